@@ -1,6 +1,12 @@
 from fastapi import Depends
 from ..services.user import UserService
+from ..services.async_anthropic_service import AsyncAnthropicService
 
 
 def get_user_service() -> UserService:
     return UserService()
+
+
+def get_anthropic_service() -> AsyncAnthropicService:
+    # Cheap to construct: every instance shares the process-wide pooled client.
+    return AsyncAnthropicService()
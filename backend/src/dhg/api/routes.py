@@ -1,8 +1,13 @@
+import json
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from typing import List
 from ..services.user import UserService
+from ..services.async_anthropic_service import AsyncAnthropicService
+from ..services.anthropic_metrics import default_metrics
 from ..schemas.user import UserCreate, UserResponse
-from .dependencies import get_user_service
+from ..schemas.claude import ClaudeStreamRequest
+from .dependencies import get_user_service, get_anthropic_service
 
 router = APIRouter()
 
@@ -31,6 +36,44 @@ async def create_user(
     return await service.create(user.model_dump())
 
 
+@router.post("/claude/stream")
+async def stream_claude(
+    request: ClaudeStreamRequest,
+    service: AsyncAnthropicService = Depends(get_anthropic_service),
+):
+    """Stream Claude's response as Server-Sent Events.
+
+    Each text delta is sent as a ``data:`` event carrying ``{"text": ...}``;
+    the stream ends with a ``done`` event, or an ``error`` event on failure.
+    """
+
+    async def event_stream():
+        try:
+            async for delta in service.stream_claude_messages(
+                max_tokens=request.max_tokens,
+                messages=request.to_messages(),
+                system_string=request.system,
+                temperature=request.temperature,
+            ):
+                yield f"data: {json.dumps({'text': delta})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            # Headers are already sent, so report failures in-band
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/claude/metrics", response_class=PlainTextResponse)
+async def claude_metrics():
+    """Per-label Claude usage and latency in Prometheus text format."""
+    return default_metrics.render_prometheus()
+
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint."""
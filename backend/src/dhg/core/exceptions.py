@@ -74,6 +74,20 @@ class AnthropicError(AIServiceError):
     pass
 
 
+class AnthropicTokenBudgetError(AnthropicError):
+    """Raised before sending a request that cannot fit the model's limits"""
+
+    pass
+
+
+class PipelineError(ServiceError):
+    """Raised when a node of a pipeline fails; completed nodes stay checkpointed"""
+
+    def __init__(self, message: str, node: str, original_error: Exception = None):
+        self.node = node
+        super().__init__(message, original_error)
+
+
 # Storage service exceptions
 class StorageError(Exception):
     """Base class for storage-related errors"""
@@ -5,6 +5,8 @@ from dhg.api.routes import router
 from .core.middleware import error_handler
 from .core.logging import setup_logging
 from .core.config import get_settings
+from .services.async_anthropic_service import close_shared_async_clients
+from .services.anthropic_images import close_shared_image_clients
 from flask import Flask
 
 # Initialize settings and logging
@@ -19,6 +21,8 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown
     print("Shutting down...")
+    await close_shared_async_clients()
+    await close_shared_image_clients()
 
 
 app = FastAPI(title="DHG Hub API", lifespan=lifespan)
@@ -1,3 +1,4 @@
 from .user import UserCreate, UserResponse
+from .claude import ClaudeStreamRequest
 
-__all__ = ["UserCreate", "UserResponse"]
+__all__ = ["UserCreate", "UserResponse", "ClaudeStreamRequest"]
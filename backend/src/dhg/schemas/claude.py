@@ -0,0 +1,22 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, Dict, List, Optional
+
+
+class ClaudeStreamRequest(BaseModel):
+    prompt: Optional[str] = None
+    messages: Optional[List[Dict[str, Any]]] = None
+    system: Optional[str] = None
+    max_tokens: int = Field(default=1024, gt=0, le=8192)
+    temperature: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+
+    @model_validator(mode="after")
+    def check_prompt_or_messages(self) -> "ClaudeStreamRequest":
+        if not self.prompt and not self.messages:
+            raise ValueError("Either prompt or messages is required")
+        return self
+
+    def to_messages(self) -> List[Dict[str, Any]]:
+        """Messages in Claude's format, wrapping a bare prompt as one user turn."""
+        if self.messages:
+            return self.messages
+        return [{"role": "user", "content": [{"type": "text", "text": self.prompt}]}]
@@ -0,0 +1,205 @@
+"""Persistent store of analysis results keyed by (PDF hash, prompt hash, model).
+
+Re-running an analysis over a paper that was already processed reads the
+stored results instead of calling Claude again, so reprocessing a corpus
+after adding one prompt only pays for the new prompt. Results live in a
+local SQLite file, optionally backed by a Supabase table shared between
+machines; a Supabase outage falls back to the local copy.
+
+Example:
+    store = analysis_store(supabase_client)
+    key = AnalysisKey.for_prompt(pdf_sha256, prompt, model)
+    result = store.get(key)
+    if result is None:
+        result = run_prompt()
+        store.put(key, result)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ANALYSIS_DB = "analysis_results.sqlite3"
+
+
+def default_analysis_db_path() -> str:
+    """Analysis database path from ANALYSIS_STORE_DB, or a file in the cwd."""
+    return os.getenv("ANALYSIS_STORE_DB", DEFAULT_ANALYSIS_DB)
+
+
+def prompt_sha256(prompt: str, system: Optional[str] = None) -> str:
+    """Hash identifying a prompt (and the system prompt it runs under)."""
+    text = prompt if system is None else f"{system}\0{prompt}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class AnalysisKey:
+    """Identifies one result: which paper, which prompt, which model."""
+
+    pdf_sha256: str
+    prompt_sha256: str
+    model: str
+
+    @classmethod
+    def for_prompt(
+        cls, pdf_sha256: str, prompt: str, model: str, system: Optional[str] = None
+    ) -> "AnalysisKey":
+        return cls(pdf_sha256, prompt_sha256(prompt, system), model)
+
+
+class AnalysisStore:
+    """Base class for result stores; values are JSON-serializable."""
+
+    def get(self, key: AnalysisKey) -> Optional[Any]:
+        raise NotImplementedError
+
+    def put(self, key: AnalysisKey, result: Any, step: Optional[str] = None) -> None:
+        raise NotImplementedError
+
+
+class SqliteAnalysisStore(AnalysisStore):
+    """Results in a local SQLite file."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or default_analysis_db_path()
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS analysis_results (
+                    pdf_sha256 TEXT NOT NULL,
+                    prompt_sha256 TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    step TEXT,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (pdf_sha256, prompt_sha256, model)
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: AnalysisKey) -> Optional[Any]:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT result FROM analysis_results "
+                "WHERE pdf_sha256 = ? AND prompt_sha256 = ? AND model = ?",
+                (key.pdf_sha256, key.prompt_sha256, key.model),
+            )
+            .fetchone()
+        )
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key: AnalysisKey, result: Any, step: Optional[str] = None) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_results (pdf_sha256, prompt_sha256, "
+                "model, step, result, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key.pdf_sha256,
+                    key.prompt_sha256,
+                    key.model,
+                    step,
+                    json.dumps(result),
+                    time.time(),
+                ),
+            )
+
+
+class SupabaseAnalysisStore(AnalysisStore):
+    """Results in a Supabase table (see create_paper_analysis_results.sql)."""
+
+    def __init__(self, client: Any, table: str = "paper_analysis_results"):
+        """
+        Args:
+            client: Supabase client
+            table: Table with a unique (pdf_sha256, prompt_sha256, model) constraint
+        """
+        self.client = client
+        self.table = table
+
+    def get(self, key: AnalysisKey) -> Optional[Any]:
+        response = (
+            self.client.table(self.table)
+            .select("result")
+            .eq("pdf_sha256", key.pdf_sha256)
+            .eq("prompt_sha256", key.prompt_sha256)
+            .eq("model", key.model)
+            .limit(1)
+            .execute()
+        )
+        return response.data[0]["result"] if response.data else None
+
+    def put(self, key: AnalysisKey, result: Any, step: Optional[str] = None) -> None:
+        self.client.table(self.table).upsert(
+            {**asdict(key), "step": step, "result": result},
+            on_conflict="pdf_sha256,prompt_sha256,model",
+        ).execute()
+
+
+class TieredAnalysisStore(AnalysisStore):
+    """Reads tiers in order and backfills earlier ones; writes to every tier.
+
+    A tier that raises is logged and skipped, so an unreachable remote store
+    degrades to the local ones instead of failing the analysis.
+    """
+
+    def __init__(self, tiers: Sequence[AnalysisStore]):
+        self.tiers: List[AnalysisStore] = list(tiers)
+
+    def get(self, key: AnalysisKey) -> Optional[Any]:
+        for i, tier in enumerate(self.tiers):
+            try:
+                result = tier.get(key)
+            except Exception as e:
+                logger.warning(f"{type(tier).__name__} read failed: {str(e)}")
+                continue
+            if result is not None:
+                for earlier in self.tiers[:i]:
+                    try:
+                        earlier.put(key, result)
+                    except Exception as e:
+                        logger.warning(
+                            f"{type(earlier).__name__} backfill failed: {str(e)}"
+                        )
+                return result
+        return None
+
+    def put(self, key: AnalysisKey, result: Any, step: Optional[str] = None) -> None:
+        stored = False
+        for tier in self.tiers:
+            try:
+                tier.put(key, result, step=step)
+                stored = True
+            except Exception as e:
+                logger.warning(f"{type(tier).__name__} write failed: {str(e)}")
+        if not stored:
+            raise RuntimeError("Analysis result could not be stored in any tier")
+
+
+def analysis_store(
+    supabase_client: Optional[Any] = None, db_path: Optional[str] = None
+) -> AnalysisStore:
+    """Local SQLite store, backed by Supabase when a client is given."""
+    local = SqliteAnalysisStore(db_path)
+    if supabase_client is None:
+        return local
+    return TieredAnalysisStore([local, SupabaseAnalysisStore(supabase_client)])
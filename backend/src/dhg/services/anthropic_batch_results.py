@@ -0,0 +1,288 @@
+"""Streaming Message Batch results into JSONL files and Supabase.
+
+Instead of holding every result of a batch in memory, BatchResultStreamer
+writes results in chunks to one or more sinks as they are downloaded. After
+each chunk is durable in every sink, the position in the results stream is
+checkpointed in the BatchJobStore. An interrupted download resumes after the
+last checkpoint: the results endpoint has no offset parameter, so the already
+checkpointed prefix is read past again, but nothing before the checkpoint is
+parsed into rows or written a second time.
+
+Delivery is at least once for rows written after the last checkpoint. On
+resume the JSONL sink drops the batch's rows past its checkpointed offset,
+keeping any other batch's rows in a shared file, and the Supabase sink
+upserts on (batch_id, custom_id), so neither ends up with duplicates.
+
+Example:
+    streamer = BatchResultStreamer(
+        service.client,
+        [JsonlResultSink("results/{batch_id}.jsonl"), SupabaseResultSink(supabase)],
+    )
+    streamer.stream(batch_id)
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from dhg.services.anthropic_batches import (
+    BatchJobStore,
+    ResultCallback,
+    _result_content,
+)
+from dhg.services.anthropic_metrics import _usage_count
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+# Bytes copied at a time when rewriting a JSONL file
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+class ResultSink:
+    """Destination for streamed batch results; subclass to add one."""
+
+    @property
+    def key(self) -> str:
+        """Identifies the sink in checkpoints; must be stable across runs."""
+        raise NotImplementedError
+
+    def open(self, batch_id: str, state: Any) -> None:
+        """Prepare to receive batch_id's results.
+
+        Args:
+            batch_id: Batch being streamed
+            state: What commit() returned at the last checkpoint, or None
+        """
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def commit(self) -> Any:
+        """Make written rows durable; the return value is checkpointed."""
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class JsonlResultSink(ResultSink):
+    """Appends one JSON object per result to a file.
+
+    path may contain "{batch_id}" to write each batch to its own file. A
+    file shared by several batches must not have two of them streaming into
+    it at once, and resuming one batch rewrites the part of the file written
+    since its checkpoint.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: File to append to, optionally with a {batch_id} placeholder
+        """
+        self.path = path
+        self._file = None
+
+    @property
+    def key(self) -> str:
+        return f"jsonl:{os.path.abspath(self.path)}"
+
+    def open(self, batch_id: str, state: Any) -> None:
+        path = self.path.format(batch_id=batch_id)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if state is not None and os.path.exists(path):
+            if os.path.getsize(path) > state["offset"]:
+                # Rows written after the last checkpoint are re-read
+                _drop_rows_after(path, state["offset"], batch_id)
+        self._file = open(path, "ab")
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._file.write(
+            b"".join(
+                json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n"
+                for row in rows
+            )
+        )
+
+    def commit(self) -> Any:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {"offset": self._file.tell()}
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _drop_rows_after(path: str, offset: int, batch_id: str) -> None:
+    """Rewrite path without batch_id's rows past offset.
+
+    Other batches may have appended to a shared file since batch_id's
+    checkpoint, so the file is filtered rather than truncated. Partial lines
+    left by a crash are dropped too.
+    """
+    temp = f"{path}.tmp"
+    with open(path, "rb") as src, open(temp, "wb") as dst:
+        remaining = offset
+        while remaining:
+            block = src.read(min(remaining, COPY_BLOCK_SIZE))
+            if not block:
+                break
+            dst.write(block)
+            remaining -= len(block)
+        for line in src:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if row.get("batch_id") != batch_id:
+                dst.write(line)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(temp, path)
+
+
+class SupabaseResultSink(ResultSink):
+    """Bulk-upserts results into Supabase (see create_claude_batch_results.sql)."""
+
+    def __init__(self, client: Any, table: str = "claude_batch_results"):
+        """
+        Args:
+            client: Supabase client
+            table: Table with a unique (batch_id, custom_id) constraint
+        """
+        self.client = client
+        self.table = table
+
+    @property
+    def key(self) -> str:
+        return f"supabase:{self.table}"
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self.client.table(self.table).upsert(
+            rows, on_conflict="batch_id,custom_id"
+        ).execute()
+
+
+def result_row(
+    batch_id: str, entry: Any, metadata: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Flatten a batch result entry into a JSON-serializable row."""
+    result = entry.result
+    usage = (
+        getattr(result.message, "usage", None) if result.type == "succeeded" else None
+    )
+    return {
+        "batch_id": batch_id,
+        "custom_id": entry.custom_id,
+        "result_type": result.type,
+        "result": _result_content(entry),
+        "metadata": metadata,
+        "input_tokens": _usage_count(usage, "input_tokens"),
+        "output_tokens": _usage_count(usage, "output_tokens"),
+    }
+
+
+class BatchResultStreamer:
+    """Writes the results of ended batches to sinks, with resumable checkpoints.
+
+    Pass one to BatchJobManager(streamer=...) to have the polling loop stream
+    each batch as it ends instead of storing its results in SQLite.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        sinks: Sequence[ResultSink],
+        store: Optional[BatchJobStore] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        """
+        Args:
+            client: Synchronous Anthropic client
+            sinks: Where results are written
+            store: Holds request metadata and checkpoints (defaults to
+                BatchJobStore() at ANTHROPIC_BATCH_DB)
+            chunk_size: Results written per checkpoint
+        """
+        if not sinks:
+            raise ValueError("At least one result sink is required")
+        self.client = client
+        self.sinks = list(sinks)
+        self.store = store if store is not None else BatchJobStore()
+        self.chunk_size = chunk_size
+
+    @property
+    def consumer(self) -> str:
+        return "|".join(sink.key for sink in self.sinks)
+
+    def _checkpoint(
+        self, batch_id: str, position: int, completed: bool = False
+    ) -> None:
+        states = {sink.key: sink.commit() for sink in self.sinks}
+        self.store.save_checkpoint(
+            batch_id, self.consumer, position, states, completed=completed
+        )
+
+    def stream(self, batch_id: str, on_result: Optional[ResultCallback] = None) -> int:
+        """Stream an ended batch's results to every sink.
+
+        Args:
+            batch_id: Batch whose processing has ended
+            on_result: Called for each newly streamed result
+
+        Returns:
+            int: Results written in this call (0 if already fully streamed)
+        """
+        checkpoint = self.store.get_checkpoint(batch_id, self.consumer)
+        if checkpoint["completed"]:
+            return 0
+        states = checkpoint["state"] or {}
+        position = checkpoint["position"]
+        metadata = self.store.request_metadata(batch_id)
+
+        for sink in self.sinks:
+            sink.open(batch_id, states.get(sink.key))
+        try:
+            # Record where this batch starts so a crash before the first
+            # chunk is also rolled back
+            self._checkpoint(batch_id, position)
+            chunk: List[Dict[str, Any]] = []
+            written = 0
+            index = -1
+            for index, entry in enumerate(
+                self.client.messages.batches.results(batch_id)
+            ):
+                if index < position:
+                    continue
+                chunk.append(result_row(batch_id, entry, metadata.get(entry.custom_id)))
+                if on_result is not None:
+                    on_result(batch_id, entry.custom_id, entry)
+                if len(chunk) >= self.chunk_size:
+                    for sink in self.sinks:
+                        sink.write(chunk)
+                    written += len(chunk)
+                    chunk = []
+                    self._checkpoint(batch_id, index + 1)
+            if chunk:
+                for sink in self.sinks:
+                    sink.write(chunk)
+                written += len(chunk)
+            self._checkpoint(batch_id, max(position, index + 1), completed=True)
+        finally:
+            for sink in self.sinks:
+                sink.close()
+
+        logger.info(f"Streamed {written} results for batch {batch_id}")
+        return written
+
+    async def astream(
+        self, batch_id: str, on_result: Optional[ResultCallback] = None
+    ) -> int:
+        """Async version of stream(); the download runs in a worker thread."""
+        return await asyncio.to_thread(self.stream, batch_id, on_result)
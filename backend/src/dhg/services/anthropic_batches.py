@@ -0,0 +1,469 @@
+"""Durable tracking of Message Batches.
+
+Submitted batch ids, the metadata of every request in them and their polling
+state are kept in SQLite, so a restarted worker picks up where the previous
+one stopped instead of losing paid-for results. One BatchJobManager polls any
+number of batches from a single loop, backing off while a batch makes no
+progress.
+
+Example:
+    manager = BatchJobManager(service.client, BatchJobStore("batches.db"))
+    batch_id = manager.submit(requests)
+    manager.run()  # after a restart, run() resumes every open batch
+    results = manager.store.results(batch_id)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_DB = "claude_batches.sqlite3"
+
+# Called with (batch_id, custom_id, result entry) as results are collected
+ResultCallback = Callable[[str, str, Any], None]
+
+
+def default_batch_db_path() -> str:
+    """Batch database path from ANTHROPIC_BATCH_DB, or a file in the cwd."""
+    return os.getenv("ANTHROPIC_BATCH_DB", DEFAULT_BATCH_DB)
+
+
+class BatchJobStore:
+    """SQLite record of batches, their requests and collected results."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or default_batch_db_path()
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS batch_jobs (
+                batch_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                collected INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                next_poll_at REAL NOT NULL,
+                poll_interval REAL NOT NULL,
+                progress INTEGER NOT NULL DEFAULT 0,
+                metadata TEXT
+            );
+            CREATE TABLE IF NOT EXISTS batch_requests (
+                batch_id TEXT NOT NULL,
+                custom_id TEXT NOT NULL,
+                metadata TEXT,
+                result_type TEXT,
+                result TEXT,
+                PRIMARY KEY (batch_id, custom_id)
+            );
+            CREATE TABLE IF NOT EXISTS batch_result_checkpoints (
+                batch_id TEXT NOT NULL,
+                consumer TEXT NOT NULL,
+                position INTEGER NOT NULL DEFAULT 0,
+                state TEXT,
+                completed INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (batch_id, consumer)
+            );
+            """
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["collected"] = bool(job["collected"])
+        job["metadata"] = json.loads(job["metadata"]) if job["metadata"] else None
+        return job
+
+    def add_batch(
+        self,
+        batch_id: str,
+        requests: Dict[str, Any],
+        metadata: Optional[Dict[str, Any]] = None,
+        poll_interval: float = 10.0,
+        status: str = "in_progress",
+    ) -> None:
+        """Record a submitted batch.
+
+        Args:
+            batch_id: Id returned by the API
+            requests: custom_id -> JSON-serializable metadata for routing results
+            metadata: Batch-level metadata
+            poll_interval: Seconds before the first poll
+            status: Processing status reported at submission
+        """
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO batch_jobs (batch_id, status, collected, "
+                "created_at, updated_at, next_poll_at, poll_interval, metadata) "
+                "VALUES (?, ?, 0, ?, ?, ?, ?, ?)",
+                (
+                    batch_id,
+                    status,
+                    now,
+                    now,
+                    now + poll_interval,
+                    poll_interval,
+                    json.dumps(metadata) if metadata is not None else None,
+                ),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO batch_requests (batch_id, custom_id, metadata) "
+                "VALUES (?, ?, ?)",
+                [
+                    (batch_id, custom_id, json.dumps(meta))
+                    for custom_id, meta in requests.items()
+                ],
+            )
+
+    def get_job(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        row = (
+            self._connect()
+            .execute("SELECT * FROM batch_jobs WHERE batch_id = ?", (batch_id,))
+            .fetchone()
+        )
+        return self._job(row) if row is not None else None
+
+    def open_jobs(self) -> List[Dict[str, Any]]:
+        """Batches whose results have not been collected yet, soonest poll first."""
+        rows = (
+            self._connect()
+            .execute(
+                "SELECT * FROM batch_jobs WHERE collected = 0 ORDER BY next_poll_at"
+            )
+            .fetchall()
+        )
+        return [self._job(row) for row in rows]
+
+    def update_job(self, batch_id: str, **fields: Any) -> None:
+        """Update columns of a batch (status, next_poll_at, poll_interval, ...)."""
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                f"UPDATE batch_jobs SET {assignments} WHERE batch_id = ?",
+                (*fields.values(), batch_id),
+            )
+
+    def mark_collected(self, batch_id: str) -> None:
+        self.update_job(batch_id, collected=1)
+
+    def request_metadata(self, batch_id: str) -> Dict[str, Any]:
+        """custom_id -> metadata for every request in the batch."""
+        rows = (
+            self._connect()
+            .execute(
+                "SELECT custom_id, metadata FROM batch_requests WHERE batch_id = ?",
+                (batch_id,),
+            )
+            .fetchall()
+        )
+        return {row["custom_id"]: json.loads(row["metadata"]) for row in rows}
+
+    def save_result(
+        self, batch_id: str, custom_id: str, result_type: str, result: str
+    ) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO batch_requests (batch_id, custom_id, result_type, result) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(batch_id, custom_id) DO UPDATE SET "
+                "result_type = excluded.result_type, result = excluded.result",
+                (batch_id, custom_id, result_type, result),
+            )
+
+    def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        """Collected results with their request metadata, in submission order."""
+        rows = (
+            self._connect()
+            .execute(
+                "SELECT custom_id, metadata, result_type, result FROM batch_requests "
+                "WHERE batch_id = ? AND result_type IS NOT NULL ORDER BY rowid",
+                (batch_id,),
+            )
+            .fetchall()
+        )
+        return [
+            {
+                "custom_id": row["custom_id"],
+                "metadata": json.loads(row["metadata"]) if row["metadata"] else None,
+                "result_type": row["result_type"],
+                "result": row["result"],
+            }
+            for row in rows
+        ]
+
+    def get_checkpoint(self, batch_id: str, consumer: str) -> Dict[str, Any]:
+        """How far consumer has streamed batch_id's results.
+
+        Returns:
+            Dict with position (entries consumed), state (consumer-specific,
+            JSON-decoded) and completed
+        """
+        row = (
+            self._connect()
+            .execute(
+                "SELECT position, state, completed FROM batch_result_checkpoints "
+                "WHERE batch_id = ? AND consumer = ?",
+                (batch_id, consumer),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return {"position": 0, "state": None, "completed": False}
+        return {
+            "position": row["position"],
+            "state": json.loads(row["state"]) if row["state"] else None,
+            "completed": bool(row["completed"]),
+        }
+
+    def save_checkpoint(
+        self,
+        batch_id: str,
+        consumer: str,
+        position: int,
+        state: Any = None,
+        completed: bool = False,
+    ) -> None:
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO batch_result_checkpoints (batch_id, "
+                "consumer, position, state, completed, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    batch_id,
+                    consumer,
+                    position,
+                    json.dumps(state) if state is not None else None,
+                    int(completed),
+                    time.time(),
+                ),
+            )
+
+
+def _result_content(entry: Any) -> str:
+    """Response text for a succeeded entry, otherwise a description of the error."""
+    result = entry.result
+    if result.type == "succeeded":
+        return result.message.content[0].text
+    return str(getattr(result, "error", None) or result.type)
+
+
+class BatchJobManager:
+    """Submits batches and polls all open ones from a single loop.
+
+    Each batch is polled on its own schedule. The interval resets to
+    min_interval whenever the batch has made progress since the last poll,
+    and grows by backoff (up to max_interval) while it has not.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        store: Optional[BatchJobStore] = None,
+        min_interval: float = 10.0,
+        max_interval: float = 300.0,
+        backoff: float = 2.0,
+        streamer: Optional[Any] = None,
+    ):
+        """
+        Args:
+            client: Synchronous Anthropic client
+            store: Where batch state is persisted (defaults to
+                BatchJobStore() at ANTHROPIC_BATCH_DB)
+            min_interval: Seconds between polls of a batch that is progressing
+            max_interval: Longest wait between polls of a stalled batch
+            backoff: Multiplier applied to the interval while there is no progress
+            streamer: Optional BatchResultStreamer; ended batches are streamed
+                to its sinks instead of being stored in the SQLite store
+        """
+        self.client = client
+        self.store = store if store is not None else BatchJobStore()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.streamer = streamer
+
+    def submit(
+        self,
+        requests: Sequence[Any],
+        request_metadata: Optional[Dict[str, Any]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Create a batch and record it before returning its id.
+
+        Args:
+            requests: Batch requests (each with a custom_id and params)
+            request_metadata: custom_id -> metadata used to route its result
+            metadata: Batch-level metadata
+
+        Returns:
+            str: Batch id
+        """
+        request_metadata = dict(request_metadata or {})
+        for request in requests:
+            custom_id = request["custom_id"]
+            request_metadata.setdefault(custom_id, None)
+        batch = self.client.messages.batches.create(requests=list(requests))
+        self.store.add_batch(
+            batch.id,
+            request_metadata,
+            metadata=metadata,
+            poll_interval=self.min_interval,
+            status=getattr(batch, "processing_status", "in_progress"),
+        )
+        logger.info(f"Submitted batch {batch.id} with {len(requests)} requests")
+        return batch.id
+
+    @staticmethod
+    def _progress(batch: Any) -> int:
+        counts = batch.request_counts
+        return counts.succeeded + counts.errored + counts.canceled + counts.expired
+
+    def _poll(self, job: Dict[str, Any], on_result: Optional[ResultCallback]) -> bool:
+        """Poll one batch; returns True once its results are collected."""
+        batch_id = job["batch_id"]
+        try:
+            batch = self.client.messages.batches.retrieve(batch_id)
+        except Exception as e:
+            interval = min(self.max_interval, job["poll_interval"] * self.backoff)
+            logger.warning(f"Polling batch {batch_id} failed: {str(e)}")
+            self.store.update_job(
+                batch_id, next_poll_at=time.time() + interval, poll_interval=interval
+            )
+            return False
+
+        if batch.processing_status == "ended":
+            self.store.update_job(batch_id, status="ended")
+            if self.streamer is not None:
+                self.streamer.stream(batch_id, on_result=on_result)
+                self.store.mark_collected(batch_id)
+            else:
+                self.collect(batch_id, on_result=on_result)
+            return True
+
+        progress = self._progress(batch)
+        if progress > job["progress"]:
+            interval = self.min_interval
+        else:
+            interval = min(self.max_interval, job["poll_interval"] * self.backoff)
+        self.store.update_job(
+            batch_id,
+            status=batch.processing_status,
+            progress=progress,
+            poll_interval=interval,
+            next_poll_at=time.time() + interval,
+        )
+        return False
+
+    def collect(self, batch_id: str, on_result: Optional[ResultCallback] = None) -> int:
+        """Download and store the results of an ended batch.
+
+        Returns:
+            int: Number of results stored
+        """
+        count = 0
+        for entry in self.client.messages.batches.results(batch_id):
+            self.store.save_result(
+                batch_id, entry.custom_id, entry.result.type, _result_content(entry)
+            )
+            if on_result is not None:
+                on_result(batch_id, entry.custom_id, entry)
+            count += 1
+        self.store.mark_collected(batch_id)
+        logger.info(f"Collected {count} results for batch {batch_id}")
+        return count
+
+    def poll_once(
+        self,
+        batch_ids: Optional[Sequence[str]] = None,
+        on_result: Optional[ResultCallback] = None,
+    ) -> List[str]:
+        """Poll every open batch that is due.
+
+        Args:
+            batch_ids: Restrict to these batches (default: all open batches)
+            on_result: Called for each result as it is collected
+
+        Returns:
+            List[str]: Batches whose results were collected in this pass
+        """
+        now = time.time()
+        finished = []
+        for job in self.store.open_jobs():
+            if batch_ids is not None and job["batch_id"] not in batch_ids:
+                continue
+            if job["next_poll_at"] > now:
+                continue
+            if self._poll(job, on_result):
+                finished.append(job["batch_id"])
+        return finished
+
+    def _next_wait(self, batch_ids: Optional[Sequence[str]]) -> Optional[float]:
+        """Seconds until the next poll is due, or None if nothing is open."""
+        jobs = [
+            job
+            for job in self.store.open_jobs()
+            if batch_ids is None or job["batch_id"] in batch_ids
+        ]
+        if not jobs:
+            return None
+        return max(0.0, min(job["next_poll_at"] for job in jobs) - time.time())
+
+    def run(
+        self,
+        batch_ids: Optional[Sequence[str]] = None,
+        on_result: Optional[ResultCallback] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Poll until the given batches (default: every open batch) are collected.
+
+        Raises:
+            TimeoutError: If timeout seconds pass first; state is kept, so a
+                later run() continues where this one stopped
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.poll_once(batch_ids, on_result)
+            wait = self._next_wait(batch_ids)
+            if wait is None:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise TimeoutError("Batches still processing at timeout")
+            time.sleep(wait)
+
+    async def arun(
+        self,
+        batch_ids: Optional[Sequence[str]] = None,
+        on_result: Optional[ResultCallback] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Async version of run(); API calls run in a worker thread."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            await asyncio.to_thread(self.poll_once, batch_ids, on_result)
+            wait = await asyncio.to_thread(self._next_wait, batch_ids)
+            if wait is None:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise TimeoutError("Batches still processing at timeout")
+            await asyncio.sleep(wait)
@@ -0,0 +1,381 @@
+"""Response cache for deterministic (temperature 0) Claude calls."""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from dhg.services.pdf_payload import document_sha256
+
+CacheValue = Dict[str, Any]
+
+
+def _hash_base64_sources(messages: Any) -> Any:
+    """messages with each base64 block's data replaced by its content hash.
+
+    Serializing and hashing a multi-MB document for every key would cost
+    more than the lookup it serves.
+    """
+    if not isinstance(messages, list):
+        return messages
+    hashed = []
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, list):
+            blocks = []
+            for block in content:
+                source = block.get("source") if isinstance(block, dict) else None
+                data = source.get("data") if isinstance(source, dict) else None
+                if isinstance(data, str) and source.get("type") == "base64":
+                    source = {k: v for k, v in source.items() if k != "data"}
+                    source["sha256"] = document_sha256(data)
+                    block = {**block, "source": source}
+                blocks.append(block)
+            message = {**message, "content": blocks}
+        hashed.append(message)
+    return hashed
+
+
+def make_cache_key(
+    model_name: str,
+    system: Optional[Union[str, List[Dict[str, Any]]]],
+    messages: List[Dict[str, Any]],
+    max_tokens: int,
+    temperature: Optional[float],
+    tools: Optional[List[Dict[str, Any]]] = None,
+    tool_choice: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Build a stable hash for a Messages API request.
+
+    Args:
+        model_name: Model the request is sent to
+        system: System prompt (string or list of blocks)
+        messages: Messages in Claude's format
+        max_tokens: Maximum tokens in the response
+        temperature: Sampling temperature
+        tools: Tool definitions, if any
+        tool_choice: Forced tool choice, if any
+
+    Base64 sources (PDFs, images) enter the key by content hash.
+
+    Returns:
+        str: Hex SHA-256 digest identifying the request
+    """
+    request = {
+        "model": model_name,
+        "system": system,
+        "messages": _hash_base64_sources(messages),
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+    # Only present when used, so keys of tool-free requests are unchanged
+    if tools is not None:
+        request["tools"] = tools
+    if tool_choice is not None:
+        request["tool_choice"] = tool_choice
+    payload = json.dumps(
+        request,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters for a ResponseCache."""
+
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    writes: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "hits": self.hits, "hit_rate": self.hit_rate}
+
+
+class CacheTier:
+    """Interface for a storage tier; subclass to plug in another backend."""
+
+    name = "tier"
+    # True if calls do I/O, so async callers run them in a worker thread
+    blocking = False
+
+    def get(self, key: str) -> Optional[CacheValue]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: CacheValue) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryCacheTier(CacheTier):
+    """In-process LRU tier bounded by entry count."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheValue]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: CacheValue) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCacheTier(CacheTier):
+    """On-disk tier of one JSON file per entry, bounded by total bytes and TTL.
+
+    Entry sizes are indexed in memory, so writes enforce the cap without
+    listing the directory, and eviction is least recently used within this
+    process (by write time for entries found at startup). The directory is
+    rescanned every rescan_interval seconds to pick up other processes'
+    writes and drop expired entries.
+    """
+
+    name = "disk"
+    blocking = True
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path],
+        max_bytes: int = 512 * 1024 * 1024,
+        ttl: Optional[float] = 30 * 24 * 3600,
+        rescan_interval: float = 600.0,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        with self._lock:
+            self._scan()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _scan(self) -> None:
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if self.ttl is not None and now - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        self._sizes = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._total = sum(self._sizes.values())
+        self._scanned_at = time.monotonic()
+
+    def _forget(self, key: str) -> None:
+        self._total -= self._sizes.pop(key, 0)
+
+    def get(self, key: str) -> Optional[CacheValue]:
+        path = self._path(key)
+        try:
+            if self.ttl is not None and time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                with self._lock:
+                    self._forget(key)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+            return None
+        except json.JSONDecodeError:
+            return None
+        with self._lock:
+            if key in self._sizes:
+                self._sizes.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: CacheValue) -> None:
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+            size = f.tell()
+        # Atomic rename so concurrent readers never see a half-written entry
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._forget(key)
+            self._sizes[key] = size
+            self._total += size
+            self._enforce_limits()
+
+    def _enforce_limits(self) -> None:
+        if time.monotonic() - self._scanned_at > self.rescan_interval:
+            self._scan()
+        # Evict least recently used entries until we are back under the cap
+        while self._total > self.max_bytes and self._sizes:
+            key, size = self._sizes.popitem(last=False)
+            self._total -= size
+            self._path(key).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self.cache_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+            self._sizes.clear()
+            self._total = 0
+
+
+class ResponseCache:
+    """Tiered response cache; lookups go through tiers in order.
+
+    A hit in a slower tier is promoted into every faster tier in front of it.
+
+    Example:
+        cache = ResponseCache(disk_dir=".cache/claude")
+        service = AnthropicService(response_cache=cache)
+    """
+
+    def __init__(
+        self,
+        memory_max_entries: int = 1024,
+        disk_dir: Optional[Union[str, Path]] = None,
+        disk_max_bytes: int = 512 * 1024 * 1024,
+        ttl: Optional[float] = 30 * 24 * 3600,
+        tiers: Optional[List[CacheTier]] = None,
+    ):
+        """Initialize the cache.
+
+        Args:
+            memory_max_entries: Entry cap for the in-memory LRU tier
+            disk_dir: Directory for the on-disk tier (omit for memory only)
+            disk_max_bytes: Size cap for the on-disk tier
+            ttl: Seconds an entry stays valid (None = forever)
+            tiers: Explicit tier list, overriding the arguments above
+        """
+        if tiers is None:
+            tiers = [MemoryCacheTier(max_entries=memory_max_entries, ttl=ttl)]
+            if disk_dir is not None:
+                tiers.append(DiskCacheTier(disk_dir, max_bytes=disk_max_bytes, ttl=ttl))
+        self.tiers = tiers
+        self.stats = CacheStats()
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def is_cacheable(params: Dict[str, Any]) -> bool:
+        """Only requests pinned to temperature 0 are deterministic enough to cache."""
+        return params.get("temperature") == 0 and not params.get("stream")
+
+    @staticmethod
+    def key_for(params: Dict[str, Any]) -> str:
+        """Cache key for a set of Messages API parameters."""
+        return make_cache_key(
+            params.get("model"),
+            params.get("system"),
+            params.get("messages"),
+            params.get("max_tokens"),
+            params.get("temperature"),
+            params.get("tools"),
+            params.get("tool_choice"),
+        )
+
+    def get(self, key: str) -> Optional[CacheValue]:
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                with self._stats_lock:
+                    if tier.name == "memory":
+                        self.stats.memory_hits += 1
+                    else:
+                        self.stats.disk_hits += 1
+                return value
+        with self._stats_lock:
+            self.stats.misses += 1
+        return None
+
+    def set(self, key: str, value: CacheValue) -> None:
+        for tier in self.tiers:
+            tier.set(key, value)
+        with self._stats_lock:
+            self.stats.writes += 1
+
+    @staticmethod
+    async def _acall(tier: CacheTier, method: Callable, *args: Any) -> Any:
+        if tier.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def aget(self, key: str) -> Optional[CacheValue]:
+        """get() for async callers; blocking tiers run in a worker thread."""
+        for i, tier in enumerate(self.tiers):
+            value = await self._acall(tier, tier.get, key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    await self._acall(faster, faster.set, key, value)
+                with self._stats_lock:
+                    if tier.name == "memory":
+                        self.stats.memory_hits += 1
+                    else:
+                        self.stats.disk_hits += 1
+                return value
+        with self._stats_lock:
+            self.stats.misses += 1
+        return None
+
+    async def aset(self, key: str, value: CacheValue) -> None:
+        """set() for async callers; blocking tiers run in a worker thread."""
+        for tier in self.tiers:
+            await self._acall(tier, tier.set, key, value)
+        with self._stats_lock:
+            self.stats.writes += 1
+
+    def clear(self) -> None:
+        for tier in self.tiers:
+            tier.clear()
@@ -0,0 +1,190 @@
+"""Image preprocessing for Claude vision requests.
+
+Images are fetched through a shared keep-alive connection pool, their real
+format is detected from the file signature, and anything larger than the
+model can use is downscaled before base64 encoding. Claude resizes images
+whose long edge exceeds about 1568px anyway, so sending more only costs
+upload time and request bytes.
+
+Downscaling needs Pillow; without it images are sent unchanged.
+"""
+
+import asyncio
+import base64
+import io
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional
+    Image = None
+    ImageOps = None
+
+# Longest edge Claude uses without resizing on its side
+MAX_IMAGE_EDGE = 1568
+# API limit per image
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+# Refuse downloads larger than this rather than buffering them
+MAX_DOWNLOAD_BYTES = 50 * 1024 * 1024
+JPEG_QUALITY = 85
+
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+_FETCH_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+_FETCH_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+
+# Pooled HTTP clients for image downloads, one per process
+_http_clients: Dict[int, httpx.Client] = {}
+_async_http_clients: Dict[int, httpx.AsyncClient] = {}
+_http_clients_lock = threading.Lock()
+
+
+def detect_media_type(data: bytes) -> Optional[str]:
+    """Media type from the file signature, or None if not a supported format."""
+    for signature, media_type in _SIGNATURES:
+        if data.startswith(signature):
+            return media_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def prepare_image(data: bytes, max_edge: int = MAX_IMAGE_EDGE) -> Tuple[str, str]:
+    """Downscale an image if needed and encode it for the API.
+
+    Images already within max_edge in a supported format are passed through
+    untouched. Larger ones are resized; opaque images are re-encoded as JPEG
+    and images with transparency as PNG.
+
+    Args:
+        data: Raw image bytes
+        max_edge: Longest edge in pixels to send
+
+    Returns:
+        Tuple[str, str]: (base64 data, media type)
+
+    Raises:
+        ValueError: If the format is unsupported and cannot be converted
+    """
+    media_type = detect_media_type(data)
+    if Image is None:
+        if media_type is None:
+            raise ValueError("Unsupported image format (install Pillow to convert)")
+        return base64.b64encode(data).decode("utf-8"), media_type
+
+    with Image.open(io.BytesIO(data)) as image:
+        too_large = max(image.size) > max_edge or len(data) > MAX_IMAGE_BYTES
+        animated = getattr(image, "is_animated", False)
+        if media_type is not None and (not too_large or animated):
+            return base64.b64encode(data).decode("utf-8"), media_type
+
+        # Let the JPEG decoder skip detail we are about to throw away
+        image.draft("RGB", (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        output = io.BytesIO()
+        if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+            image.save(output, format="PNG", optimize=True)
+            media_type = "image/png"
+        else:
+            image.convert("RGB").save(
+                output, format="JPEG", quality=JPEG_QUALITY, optimize=True
+            )
+            media_type = "image/jpeg"
+    return base64.b64encode(output.getvalue()).decode("utf-8"), media_type
+
+
+def _get_http_client() -> httpx.Client:
+    pid = os.getpid()
+    with _http_clients_lock:
+        client = _http_clients.get(pid)
+        if client is None:
+            client = httpx.Client(
+                timeout=_FETCH_TIMEOUT, limits=_FETCH_LIMITS, follow_redirects=True
+            )
+            _http_clients[pid] = client
+        return client
+
+
+def _get_async_http_client() -> httpx.AsyncClient:
+    pid = os.getpid()
+    with _http_clients_lock:
+        client = _async_http_clients.get(pid)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=_FETCH_TIMEOUT, limits=_FETCH_LIMITS, follow_redirects=True
+            )
+            _async_http_clients[pid] = client
+        return client
+
+
+def _check_length(response: httpx.Response) -> None:
+    length = response.headers.get("content-length")
+    if length is not None and int(length) > MAX_DOWNLOAD_BYTES:
+        raise ValueError(f"Image is {length} bytes; limit is {MAX_DOWNLOAD_BYTES}")
+
+
+def fetch_image(url: str) -> bytes:
+    """Download an image through the shared connection pool."""
+    buffer = bytearray()
+    with _get_http_client().stream("GET", url) as response:
+        response.raise_for_status()
+        _check_length(response)
+        for chunk in response.iter_bytes():
+            buffer.extend(chunk)
+            if len(buffer) > MAX_DOWNLOAD_BYTES:
+                raise ValueError(f"Image exceeds {MAX_DOWNLOAD_BYTES} bytes")
+    return bytes(buffer)
+
+
+async def afetch_image(url: str) -> bytes:
+    """Async version of fetch_image()."""
+    buffer = bytearray()
+    async with _get_async_http_client().stream("GET", url) as response:
+        response.raise_for_status()
+        _check_length(response)
+        async for chunk in response.aiter_bytes():
+            buffer.extend(chunk)
+            if len(buffer) > MAX_DOWNLOAD_BYTES:
+                raise ValueError(f"Image exceeds {MAX_DOWNLOAD_BYTES} bytes")
+    return bytes(buffer)
+
+
+def load_image(source: str, is_url: bool = False) -> Tuple[str, str]:
+    """Read or fetch an image and prepare it; returns (base64 data, media type)."""
+    if is_url:
+        data = fetch_image(source)
+    else:
+        with open(source, "rb") as image_file:
+            data = image_file.read()
+    return prepare_image(data)
+
+
+async def aload_image(source: str, is_url: bool = False) -> Tuple[str, str]:
+    """Async version of load_image(); decoding and resizing run in a thread."""
+    if is_url:
+        data = await afetch_image(source)
+        return await asyncio.to_thread(prepare_image, data)
+    return await asyncio.to_thread(load_image, source)
+
+
+async def close_shared_image_clients() -> None:
+    """Close this process's pooled download clients (call on app shutdown)."""
+    pid = os.getpid()
+    with _http_clients_lock:
+        client = _http_clients.pop(pid, None)
+        async_client = _async_http_clients.pop(pid, None)
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.aclose()
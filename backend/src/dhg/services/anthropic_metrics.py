@@ -0,0 +1,418 @@
+"""Per-call usage and latency metrics for Claude calls.
+
+Every call made through the Anthropic services produces a CallRecord with
+its label, model, token usage, latency, time to first token (streaming only)
+and retry count. A MetricsRecorder aggregates records into per-(label, model)
+histograms and counters, and forwards each record to any exporters.
+
+Label calls with the claude_label() context manager:
+
+    with claude_label("paper_analysis"):
+        service.call_claude_basic(...)
+"""
+
+import bisect
+import contextvars
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LABEL = "unlabeled"
+
+# Seconds
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+# Tokens
+TOKEN_BUCKETS = (100, 500, 1000, 2000, 5000, 10_000, 25_000, 50_000, 100_000)
+
+_current_label: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "claude_label", default=DEFAULT_LABEL
+)
+
+
+@contextmanager
+def claude_label(label: str) -> Iterator[None]:
+    """Tag every Claude call made inside the block with label."""
+    token = _current_label.set(label)
+    try:
+        yield
+    finally:
+        _current_label.reset(token)
+
+
+def current_label() -> str:
+    """Label in effect for the current context."""
+    return _current_label.get()
+
+
+@dataclass
+class CallRecord:
+    """Measurements for one logical call, including all of its retries."""
+
+    label: str
+    model: str
+    latency: float
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    time_to_first_token: Optional[float] = None
+    retries: int = 0
+    cached: bool = False
+    error: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "ok": self.ok}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(upper bound, count of observations <= bound) pairs, ending with +Inf."""
+        total = 0
+        result = []
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            result.append((str(bound), total))
+        return result
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return float(bound)
+        return float("inf")
+
+
+class CallStats:
+    """Aggregates for one (label, model) pair."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.time_to_first_token = Histogram(LATENCY_BUCKETS)
+        self.input_token_sizes = Histogram(TOKEN_BUCKETS)
+        self.output_token_sizes = Histogram(TOKEN_BUCKETS)
+
+    def add(self, record: CallRecord) -> None:
+        self.calls += 1
+        self.errors += 0 if record.ok else 1
+        self.retries += record.retries
+        self.cache_hits += 1 if record.cached else 0
+        self.input_tokens += record.input_tokens
+        self.output_tokens += record.output_tokens
+        self.cache_creation_input_tokens += record.cache_creation_input_tokens
+        self.cache_read_input_tokens += record.cache_read_input_tokens
+        self.latency.observe(record.latency)
+        if record.time_to_first_token is not None:
+            self.time_to_first_token.observe(record.time_to_first_token)
+        if record.ok and not record.cached:
+            self.input_token_sizes.observe(record.input_tokens)
+            self.output_token_sizes.observe(record.output_tokens)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_creation_input_tokens": self.cache_creation_input_tokens,
+            "cache_read_input_tokens": self.cache_read_input_tokens,
+            "latency_sum": self.latency.sum,
+            "latency_p50": self.latency.quantile(0.5),
+            "latency_p95": self.latency.quantile(0.95),
+            "ttft_p50": self.time_to_first_token.quantile(0.5),
+            "ttft_p95": self.time_to_first_token.quantile(0.95),
+        }
+
+
+class MetricsExporter:
+    """Receives every CallRecord; subclass to ship records elsewhere."""
+
+    def export(self, record: CallRecord) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+
+class SupabaseMetricsExporter(MetricsExporter):
+    """Batches records into a Supabase table (see create_claude_call_metrics.sql).
+
+    Full batches are inserted by a background thread so the call path never
+    waits on Supabase. At most max_pending_batches wait to be inserted;
+    beyond that batches are dropped. Call flush() before exiting to send
+    what is buffered.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        table: str = "claude_call_metrics",
+        batch_size: int = 50,
+        max_pending_batches: int = 20,
+    ):
+        """
+        Args:
+            client: Supabase client
+            table: Table to insert rows into
+            batch_size: Rows buffered before an insert
+            max_pending_batches: Batches queued for the insert thread
+        """
+        self.client = client
+        self.table = table
+        self.batch_size = batch_size
+        self._rows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[List[Dict[str, Any]]]" = queue.Queue(
+            maxsize=max_pending_batches
+        )
+        self._worker: Optional[threading.Thread] = None
+
+    def export(self, record: CallRecord) -> None:
+        with self._lock:
+            self._rows.append(record.as_dict())
+            if len(self._rows) < self.batch_size:
+                return
+            rows, self._rows = self._rows, []
+        self._submit(rows)
+
+    def _submit(self, rows: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="claude-metrics-export", daemon=True
+                )
+                self._worker.start()
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            logger.warning(f"Dropped {len(rows)} Claude metric rows: queue full")
+
+    def _run(self) -> None:
+        while True:
+            rows = self._queue.get()
+            try:
+                self.client.table(self.table).insert(rows).execute()
+            except Exception as e:
+                # Metrics must never break the call path
+                logger.warning(f"Dropped {len(rows)} Claude metric rows: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Send buffered rows and wait until every queued batch is inserted."""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if rows:
+            self._submit(rows)
+        self._queue.join()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRecorder:
+    """Thread-safe in-process aggregation of CallRecords.
+
+    Example:
+        recorder = MetricsRecorder(exporters=[SupabaseMetricsExporter(client)])
+        service = AnthropicService(metrics=recorder)
+        print(recorder.render_prometheus())
+    """
+
+    def __init__(self, exporters: Optional[List[MetricsExporter]] = None):
+        self.exporters = list(exporters or [])
+        self._stats: Dict[Tuple[str, str], CallStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, record: CallRecord) -> None:
+        with self._lock:
+            key = (record.label, record.model)
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = CallStats()
+            stats.add(record)
+            exporters = list(self.exporters)
+        for exporter in exporters:
+            try:
+                exporter.export(record)
+            except Exception as e:
+                logger.warning(f"Metrics exporter failed: {str(e)}")
+
+    def stats(self, label: str, model: str) -> Optional[CallStats]:
+        return self._stats.get((label, model))
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Aggregates per (label, model), most expensive first."""
+        with self._lock:
+            rows = [
+                {"label": label, "model": model, **stats.as_dict()}
+                for (label, model), stats in self._stats.items()
+            ]
+        return sorted(
+            rows,
+            key=lambda row: row["input_tokens"] + row["output_tokens"],
+            reverse=True,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def add_exporter(self, exporter: MetricsExporter) -> None:
+        with self._lock:
+            self.exporters.append(exporter)
+
+    def remove_exporter(self, exporter: MetricsExporter) -> None:
+        with self._lock:
+            self.exporters.remove(exporter)
+
+    def flush(self) -> None:
+        with self._lock:
+            exporters = list(self.exporters)
+        for exporter in exporters:
+            exporter.flush()
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition of all aggregates."""
+        lines: List[str] = []
+        with self._lock:
+            items = sorted(self._stats.items())
+
+            def labels(label: str, model: str, **extra: str) -> str:
+                pairs = {"label": label, "model": model, **extra}
+                inner = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs.items())
+                return "{" + inner + "}"
+
+            counters = (
+                ("claude_calls_total", "calls"),
+                ("claude_errors_total", "errors"),
+                ("claude_retries_total", "retries"),
+                ("claude_cache_hits_total", "cache_hits"),
+            )
+            for name, attr in counters:
+                lines.append(f"# TYPE {name} counter")
+                for (label, model), stats in items:
+                    lines.append(f"{name}{labels(label, model)} {getattr(stats, attr)}")
+
+            lines.append("# TYPE claude_tokens_total counter")
+            for (label, model), stats in items:
+                for kind in (
+                    "input",
+                    "output",
+                    "cache_creation_input",
+                    "cache_read_input",
+                ):
+                    value = getattr(stats, f"{kind}_tokens")
+                    lines.append(
+                        f"claude_tokens_total{labels(label, model, type=kind)} {value}"
+                    )
+
+            histograms = (
+                ("claude_latency_seconds", "latency"),
+                ("claude_time_to_first_token_seconds", "time_to_first_token"),
+            )
+            for name, attr in histograms:
+                lines.append(f"# TYPE {name} histogram")
+                for (label, model), stats in items:
+                    histogram = getattr(stats, attr)
+                    for bound, count in histogram.cumulative():
+                        lines.append(
+                            f"{name}_bucket{labels(label, model, le=bound)} {count}"
+                        )
+                    lines.append(f"{name}_sum{labels(label, model)} {histogram.sum}")
+                    lines.append(
+                        f"{name}_count{labels(label, model)} {histogram.count}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+def _usage_count(usage: Any, name: str) -> int:
+    value = getattr(usage, name, None)
+    return value if isinstance(value, int) else 0
+
+
+class CallTimer:
+    """Collects the measurements of one call while it runs."""
+
+    def __init__(self, recorder: Optional[MetricsRecorder], model: str):
+        self.recorder = recorder
+        self.model = model
+        self.label = current_label()
+        self.started = time.monotonic()
+        self.retries = 0
+        self.time_to_first_token: Optional[float] = None
+        self.usage: Any = None
+        self.cached = False
+
+    def on_retry(self, attempt: int, error: BaseException, delay: float) -> None:
+        """RetryPolicy callback."""
+        self.retries += 1
+
+    def first_token(self) -> None:
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.monotonic() - self.started
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if self.recorder is None:
+            return
+        usage = self.usage
+        self.recorder.record(
+            CallRecord(
+                label=self.label,
+                model=self.model,
+                latency=time.monotonic() - self.started,
+                input_tokens=_usage_count(usage, "input_tokens"),
+                output_tokens=_usage_count(usage, "output_tokens"),
+                cache_creation_input_tokens=_usage_count(
+                    usage, "cache_creation_input_tokens"
+                ),
+                cache_read_input_tokens=_usage_count(usage, "cache_read_input_tokens"),
+                time_to_first_token=self.time_to_first_token,
+                retries=self.retries,
+                cached=self.cached,
+                error=type(error).__name__ if error is not None else None,
+            )
+        )
+
+
+# Shared by every service that is not given its own recorder
+default_metrics = MetricsRecorder()
@@ -0,0 +1,451 @@
+"""Client-side rate limiting and adaptive concurrency for Anthropic calls.
+
+Token buckets enforce requests-per-minute, input-tokens-per-minute and
+output-tokens-per-minute. An AIMD (additive-increase, multiplicative-decrease)
+window caps in-flight requests: it halves on 429/529 responses and grows by
+one slot per window of successes. Bucket state can live in process memory or in
+a SQLite file shared by every worker on the host.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from dhg.services.anthropic_tokens import estimate_request_tokens
+
+# Statuses the API uses for "slow down": rate limited and overloaded
+OVERLOAD_STATUS_CODES = (429, 529)
+
+_POLL_INTERVAL = 0.05
+
+# (bucket name, amount, capacity, refill per second)
+BucketRequest = Tuple[str, float, float, float]
+
+
+@dataclass
+class RateLimits:
+    """Per-minute limits; None disables that bucket."""
+
+    requests_per_minute: Optional[float] = None
+    input_tokens_per_minute: Optional[float] = None
+    output_tokens_per_minute: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "RateLimits":
+        """Read ANTHROPIC_RPM, ANTHROPIC_INPUT_TPM and ANTHROPIC_OUTPUT_TPM."""
+
+        def _read(name: str) -> Optional[float]:
+            value = os.getenv(name)
+            return float(value) if value else None
+
+        return cls(
+            requests_per_minute=_read("ANTHROPIC_RPM"),
+            input_tokens_per_minute=_read("ANTHROPIC_INPUT_TPM"),
+            output_tokens_per_minute=_read("ANTHROPIC_OUTPUT_TPM"),
+        )
+
+
+class BucketBackend:
+    """Storage for token bucket levels."""
+
+    # True if calls do I/O, so async callers run them in a worker thread
+    blocking = True
+
+    def take(self, requests: List[BucketRequest]) -> float:
+        """Atomically take every amount, or nothing.
+
+        Returns:
+            float: 0 if the amounts were taken, else seconds until they could be
+        """
+        raise NotImplementedError
+
+    def adjust(self, name: str, delta: float, capacity: float, rate: float) -> None:
+        """Add delta (may be negative) to a bucket, e.g. to settle an estimate."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _refill(
+        tokens: float, updated: float, capacity: float, rate: float, now: float
+    ) -> float:
+        return min(capacity, tokens + (now - updated) * rate)
+
+    @staticmethod
+    def _wait_time(levels: List[float], requests: List[BucketRequest]) -> float:
+        wait = 0.0
+        for level, (_, amount, capacity, rate) in zip(levels, requests):
+            needed = min(amount, capacity)
+            if level < needed:
+                wait = max(wait, (needed - level) / rate)
+        return wait
+
+
+class MemoryBucketBackend(BucketBackend):
+    """Bucket levels held in this process only."""
+
+    blocking = False
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _level(self, name: str, capacity: float, rate: float, now: float) -> float:
+        tokens, updated = self._buckets.get(name, (capacity, now))
+        return self._refill(tokens, updated, capacity, rate, now)
+
+    def take(self, requests: List[BucketRequest]) -> float:
+        with self._lock:
+            now = time.monotonic()
+            levels = [self._level(n, c, r, now) for n, _, c, r in requests]
+            wait = self._wait_time(levels, requests)
+            if wait > 0:
+                return wait
+            for level, (name, amount, capacity, _) in zip(levels, requests):
+                self._buckets[name] = (level - min(amount, capacity), now)
+            return 0.0
+
+    def adjust(self, name: str, delta: float, capacity: float, rate: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            level = self._level(name, capacity, rate, now)
+            self._buckets[name] = (min(capacity, level + delta), now)
+
+
+class SQLiteBucketBackend(BucketBackend):
+    """Bucket levels in a SQLite file, shared by every process that opens it.
+
+    Each operation runs in a BEGIN IMMEDIATE transaction, so concurrent
+    workers serialize on the database lock rather than double-spending.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _level(
+        self,
+        conn: sqlite3.Connection,
+        name: str,
+        capacity: float,
+        rate: float,
+        now: float,
+    ) -> float:
+        row = conn.execute(
+            "SELECT tokens, updated FROM rate_buckets WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            return capacity
+        return self._refill(row[0], row[1], capacity, rate, now)
+
+    @staticmethod
+    def _store(conn: sqlite3.Connection, name: str, tokens: float, now: float) -> None:
+        conn.execute(
+            "INSERT INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, "
+            "updated = excluded.updated",
+            (name, tokens, now),
+        )
+
+    def take(self, requests: List[BucketRequest]) -> float:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Wall clock, since monotonic clocks are not comparable across processes
+            now = time.time()
+            levels = [self._level(conn, n, c, r, now) for n, _, c, r in requests]
+            wait = self._wait_time(levels, requests)
+            if wait == 0:
+                for level, (name, amount, capacity, _) in zip(levels, requests):
+                    self._store(conn, name, level - min(amount, capacity), now)
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def adjust(self, name: str, delta: float, capacity: float, rate: float) -> None:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            level = self._level(conn, name, capacity, rate, now)
+            self._store(conn, name, min(capacity, level + delta), now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class AdaptiveConcurrency:
+    """AIMD window bounding the number of in-flight requests."""
+
+    def __init__(
+        self,
+        initial: int = 8,
+        minimum: int = 1,
+        maximum: int = 64,
+        decrease_factor: float = 0.5,
+        cooldown: float = 2.0,
+    ):
+        """
+        Args:
+            initial: Starting window size
+            minimum: Window never shrinks below this
+            maximum: Window never grows above this
+            decrease_factor: Multiplier applied on overload
+            cooldown: Seconds after a decrease during which further overloads
+                (usually from the same burst) do not shrink the window again
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return max(self.minimum, int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            if self._in_flight < self.limit:
+                self._in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait(timeout=_POLL_INTERVAL)
+            self._in_flight += 1
+
+    def release(self, overloaded: Optional[bool] = None) -> None:
+        """Free a slot and adapt the window.
+
+        Args:
+            overloaded: True on 429/529, False on success, None when the
+                outcome says nothing about capacity (e.g. a 400)
+        """
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                if now - self._last_decrease >= self.cooldown:
+                    self._limit = max(self.minimum, self._limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif overloaded is False:
+                # +1 slot for every full window of successes
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+            self._condition.notify_all()
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """Whether an API error means we are sending too fast."""
+    return getattr(error, "status_code", None) in OVERLOAD_STATUS_CODES
+
+
+def estimate_input_tokens(params: Dict[str, Any]) -> int:
+    """Rough input token estimate used to reserve bucket capacity.
+
+    The reservation is settled against the real usage once the response
+    arrives.
+    """
+    return max(1, estimate_request_tokens(params))
+
+
+class RateLimitSlot:
+    """Reservation held while a request is in flight."""
+
+    def __init__(self, limiter: "RateLimiter", input_tokens: int, output_tokens: int):
+        self._limiter = limiter
+        self._input_tokens = input_tokens
+        self._output_tokens = output_tokens
+        self._usage: Optional[Any] = None
+
+    def record(self, usage: Any) -> None:
+        """Attach the response usage so the reservation can be settled."""
+        self._usage = usage
+
+    def _finish(self, error: Optional[BaseException]) -> None:
+        overloaded = None
+        if error is None:
+            overloaded = False
+        elif is_overload_error(error):
+            overloaded = True
+        self._limiter._settle(self._input_tokens, self._output_tokens, self._usage)
+        if self._limiter.concurrency is not None:
+            self._limiter.concurrency.release(overloaded)
+
+    def __enter__(self) -> "RateLimitSlot":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self._finish(exc)
+        return False
+
+    async def __aenter__(self) -> "RateLimitSlot":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        if self._limiter.backend.blocking:
+            await asyncio.to_thread(self._finish, exc)
+        else:
+            self._finish(exc)
+        return False
+
+
+class RateLimiter:
+    """Token-bucket limiter plus adaptive concurrency for Messages API calls.
+
+    Example:
+        limiter = RateLimiter(
+            RateLimits(requests_per_minute=50, input_tokens_per_minute=40000),
+            backend=SQLiteBucketBackend("/tmp/anthropic_limits.db"),
+        )
+        service = AnthropicService(rate_limiter=limiter)
+    """
+
+    def __init__(
+        self,
+        limits: RateLimits,
+        backend: Optional[BucketBackend] = None,
+        concurrency: Optional[AdaptiveConcurrency] = None,
+        namespace: str = "anthropic",
+    ):
+        """
+        Args:
+            limits: Per-minute request and token limits
+            backend: Where bucket levels live (defaults to this process's memory)
+            concurrency: AIMD window (defaults to a fresh AdaptiveConcurrency)
+            namespace: Prefix for bucket names, e.g. one per API key
+        """
+        self.limits = limits
+        self.backend = backend or MemoryBucketBackend()
+        self.concurrency = (
+            concurrency if concurrency is not None else AdaptiveConcurrency()
+        )
+        self.namespace = namespace
+
+    def _bucket(self, kind: str, per_minute: float) -> Tuple[str, float, float]:
+        return f"{self.namespace}:{kind}", per_minute, per_minute / 60.0
+
+    def _requests_for(
+        self, input_tokens: int, output_tokens: int
+    ) -> List[BucketRequest]:
+        requests = []
+        for kind, per_minute, amount in (
+            ("rpm", self.limits.requests_per_minute, 1),
+            ("input_tpm", self.limits.input_tokens_per_minute, input_tokens),
+            ("output_tpm", self.limits.output_tokens_per_minute, output_tokens),
+        ):
+            if per_minute:
+                name, capacity, rate = self._bucket(kind, per_minute)
+                requests.append((name, amount, capacity, rate))
+        return requests
+
+    def _settle(
+        self, input_tokens: int, output_tokens: int, usage: Optional[Any]
+    ) -> None:
+        """Replace the estimated reservation with actual usage."""
+        if usage is None:
+            return
+        for kind, per_minute, reserved, used in (
+            (
+                "input_tpm",
+                self.limits.input_tokens_per_minute,
+                input_tokens,
+                usage.input_tokens,
+            ),
+            (
+                "output_tpm",
+                self.limits.output_tokens_per_minute,
+                output_tokens,
+                usage.output_tokens,
+            ),
+        ):
+            if per_minute and used is not None and used != reserved:
+                name, capacity, rate = self._bucket(kind, per_minute)
+                self.backend.adjust(name, reserved - used, capacity, rate)
+
+    def _reservation(self, params: Dict[str, Any]) -> Tuple[int, int]:
+        return estimate_input_tokens(params), int(params.get("max_tokens") or 0)
+
+    def limit(self, params: Dict[str, Any]) -> RateLimitSlot:
+        """Block until the request may be sent, then return its slot.
+
+        Use as ``with limiter.limit(params) as slot: ...; slot.record(usage)``.
+        """
+        input_tokens, output_tokens = self._reservation(params)
+        requests = self._requests_for(input_tokens, output_tokens)
+        while requests:
+            wait = self.backend.take(requests)
+            if wait == 0:
+                break
+            time.sleep(wait)
+        if self.concurrency is not None:
+            self.concurrency.acquire()
+        return RateLimitSlot(self, input_tokens, output_tokens)
+
+    async def alimit(self, params: Dict[str, Any]) -> RateLimitSlot:
+        """Async version of limit(); waits without blocking the event loop.
+
+        Use as ``async with await limiter.alimit(params) as slot: ...``.
+        """
+        input_tokens, output_tokens = self._reservation(params)
+        requests = self._requests_for(input_tokens, output_tokens)
+        while requests:
+            if self.backend.blocking:
+                wait = await asyncio.to_thread(self.backend.take, requests)
+            else:
+                wait = self.backend.take(requests)
+            if wait == 0:
+                break
+            await asyncio.sleep(wait)
+        if self.concurrency is not None:
+            while not self.concurrency.try_acquire():
+                await asyncio.sleep(_POLL_INTERVAL)
+        return RateLimitSlot(self, input_tokens, output_tokens)
+
+
+class _NoLimitSlot:
+    """Slot used when no limiter is configured."""
+
+    def record(self, usage: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoLimitSlot":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+    async def __aenter__(self) -> "_NoLimitSlot":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NO_LIMIT = _NoLimitSlot()
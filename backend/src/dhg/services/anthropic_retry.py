@@ -0,0 +1,198 @@
+"""Retry policy for Claude calls.
+
+Errors are classified as retryable (connection problems, timeouts, 408/409/
+429/5xx/529) or not. Waits honor the server's retry-after headers when
+present and otherwise use decorrelated-jitter backoff. Every call is bounded
+by an overall deadline that also caps each attempt's timeout.
+"""
+
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+import anthropic
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+
+# Called before each wait with (attempt number, error, delay in seconds)
+RetryCallback = Callable[[int, BaseException, float], None]
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an error from the Anthropic client is worth retrying."""
+    response = getattr(error, "response", None)
+    should_retry = None
+    if response is not None:
+        should_retry = response.headers.get("x-should-retry")
+    if should_retry == "true":
+        return True
+    if should_retry == "false":
+        return False
+    if isinstance(error, anthropic.APIConnectionError):
+        # Includes APITimeoutError
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Delay requested by the server via retry-after-ms or retry-after, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    # HTTP-date form
+    parsed = email.utils.parsedate_tz(retry_after)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+
+
+class RetryPolicy:
+    """Decorrelated-jitter retries bounded by attempts and a per-call deadline.
+
+    Example:
+        policy = RetryPolicy(max_attempts=6, deadline=120)
+        service = AnthropicService(retry_policy=policy)
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        deadline: Optional[float] = 600.0,
+    ):
+        """
+        Args:
+            max_attempts: Total attempts including the first
+            base_delay: Smallest backoff in seconds
+            max_delay: Largest backoff in seconds
+            deadline: Seconds the whole call (all attempts and waits) may take;
+                None for no deadline
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def next_delay(self, previous_delay: float) -> float:
+        """Decorrelated jitter: uniform between base and 3x the previous delay."""
+        upper = max(self.base_delay, previous_delay * 3)
+        return min(self.max_delay, random.uniform(self.base_delay, upper))
+
+    def plan_wait(
+        self,
+        attempt: int,
+        error: BaseException,
+        previous_delay: float,
+        started: float,
+    ) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up."""
+        if attempt >= self.max_attempts or not is_retryable(error):
+            return None
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = self.next_delay(previous_delay)
+        if self.deadline is not None:
+            remaining = self.deadline - (time.monotonic() - started)
+            if delay >= remaining:
+                logger.warning(
+                    f"Giving up after {attempt} attempts: retry would pass the deadline"
+                )
+                return None
+        return delay
+
+    def remaining(self, started: float) -> Optional[float]:
+        """Seconds left before the deadline, for use as an attempt timeout."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - (time.monotonic() - started))
+
+    def call(
+        self,
+        func: Callable[[Optional[float]], T],
+        on_retry: Optional[RetryCallback] = None,
+    ) -> T:
+        """Run func with retries.
+
+        Args:
+            func: Called with the time left before the deadline (or None)
+            on_retry: Optional hook invoked before each wait
+
+        Returns:
+            Whatever func returns on its first successful attempt
+
+        Raises:
+            The last error once it is not retryable, attempts are exhausted
+            or the deadline would be exceeded
+        """
+        started = time.monotonic()
+        delay = self.base_delay
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return func(self.remaining(started))
+            except Exception as e:
+                wait = self.plan_wait(attempt, e, delay, started)
+                if wait is None:
+                    raise
+                logger.info(f"Retrying after {type(e).__name__} in {wait:.2f}s")
+                if on_retry is not None:
+                    on_retry(attempt, e, wait)
+                delay = wait
+                time.sleep(wait)
+
+    async def acall(
+        self,
+        func: Callable[[Optional[float]], Awaitable[T]],
+        on_retry: Optional[RetryCallback] = None,
+    ) -> T:
+        """Async version of call()."""
+        started = time.monotonic()
+        delay = self.base_delay
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await func(self.remaining(started))
+            except Exception as e:
+                wait = self.plan_wait(attempt, e, delay, started)
+                if wait is None:
+                    raise
+                logger.info(f"Retrying after {type(e).__name__} in {wait:.2f}s")
+                if on_retry is not None:
+                    on_retry(attempt, e, wait)
+                delay = wait
+                await asyncio.sleep(wait)
+
+
+def attempt_timeout(requested: Any, remaining: Optional[float]) -> Optional[float]:
+    """Combine a caller's per-request timeout with the time left on the deadline."""
+    if remaining is None:
+        return requested
+    if requested is None:
+        return remaining
+    return min(requested, remaining)
@@ -1,23 +1,226 @@
+import contextvars
 import os
+import time
 from anthropic import Anthropic
 from anthropic.types import Message
 import dotenv
-import base64
-import httpx
-from typing import Optional, List, Dict, Union, Tuple, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from dhg.services.anthropic_cache import ResponseCache, make_cache_key
+from dhg.services.anthropic_metrics import (
+    CallTimer,
+    MetricsRecorder,
+    claude_label,
+    current_label,
+    default_metrics,
+)
+from dhg.services.anthropic_images import load_image
+from dhg.services.pdf_payload import default_pdf_registry
+from dhg.services import pdf_split
+from dhg.services.anthropic_rate_limiter import RateLimiter, NO_LIMIT
+from dhg.services.anthropic_tokens import (
+    COUNT_TOKENS_PARAMS,
+    TokenEstimator,
+    preflight,
+    default_token_estimator,
+    estimate_text_tokens,
+)
+from dhg.services.anthropic_retry import RetryPolicy, attempt_timeout
+from dhg.services.structured_output import StructuredTool
+from dhg.core.exceptions import AnthropicError, AnthropicTokenBudgetError
 
 dotenv.load_dotenv()
 
 
+def _text_block(text: str) -> Dict[str, str]:
+    """Build a text content block."""
+    return {"type": "text", "text": text}
+
+
+def _pdf_document_block(pdf_base64: str) -> Dict[str, Any]:
+    """Build a base64 PDF document content block."""
+    return {
+        "type": "document",
+        "source": {
+            "type": "base64",
+            "media_type": "application/pdf",
+            "data": pdf_base64,
+        },
+    }
+
+
+def _image_block(image_base64: str, media_type: str = "image/jpeg") -> Dict[str, Any]:
+    """Build a base64 image content block."""
+    return {
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": media_type,
+            "data": image_base64,
+        },
+    }
+
+
+def _follow_up_messages(
+    initial_message: str, follow_up_message: str
+) -> List[Dict[str, Any]]:
+    """Build the three-turn conversation used by follow-up calls."""
+    return [
+        {"role": "user", "content": [_text_block(initial_message)]},
+        {"role": "assistant", "content": [_text_block(follow_up_message)]},
+        {
+            "role": "user",
+            "content": [_text_block("Tell me more about what you just said.")],
+        },
+    ]
+
+
+def _validate_messages(messages: List[Dict[str, Any]]) -> None:
+    """Raise ValueError if any message is missing its role or content."""
+    for msg in messages:
+        if not isinstance(msg, dict) or "role" not in msg or "content" not in msg:
+            raise ValueError("Invalid message format")
+
+
+def _tool_input_deltas(stream: Any) -> Iterator[str]:
+    """Partial tool input JSON from a Messages stream."""
+    for event in stream:
+        if (
+            event.type == "content_block_delta"
+            and event.delta.type == "input_json_delta"
+        ):
+            yield event.delta.partial_json
+
+
+def _attempt_params(
+    params: Dict[str, Any], remaining: Optional[float]
+) -> Dict[str, Any]:
+    """Request parameters for one attempt, with the timeout capped by the deadline."""
+    timeout = attempt_timeout(params.get("timeout"), remaining)
+    if timeout is None:
+        return params
+    return {**params, "timeout": timeout}
+
+
+def usage_to_dict(message: Message) -> Dict[str, int]:
+    """Extract token usage, including prompt-cache reads and writes, from a Message."""
+    usage = message.usage
+    return {
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "cache_creation_input_tokens": getattr(
+            usage, "cache_creation_input_tokens", None
+        )
+        or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0,
+    }
+
+
+@dataclass
+class ClaudeRequest:
+    """One independent request for call_claude_many.
+
+    Give either input_string (sent as a single user turn) or messages.
+    """
+
+    max_tokens: int
+    input_string: Optional[str] = None
+    messages: Optional[List[Dict[str, Any]]] = None
+    system_string: Optional[str] = None
+    temperature: Optional[float] = None
+    # Metrics label for this request (defaults to the caller's claude_label)
+    label: Optional[str] = None
+
+
+@dataclass
+class ClaudeResult:
+    """Outcome of one request from call_claude_many."""
+
+    index: int
+    text: Optional[str] = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+ClaudeRequestSpec = Union[ClaudeRequest, Dict[str, Any]]
+
+
+def _as_claude_request(spec: ClaudeRequestSpec) -> ClaudeRequest:
+    """Accept either a ClaudeRequest or a dict of its fields."""
+    request = spec if isinstance(spec, ClaudeRequest) else ClaudeRequest(**spec)
+    if (request.input_string is None) == (request.messages is None):
+        raise ValueError("Give exactly one of input_string or messages")
+    return request
+
+
+def _claude_request_params(request: ClaudeRequest, model_name: str) -> Dict[str, Any]:
+    """Messages API parameters for a ClaudeRequest."""
+    messages = request.messages
+    if messages is None:
+        messages = [{"role": "user", "content": [_text_block(request.input_string)]}]
+    params: Dict[str, Any] = {
+        "model": model_name,
+        "max_tokens": request.max_tokens,
+        "messages": messages,
+    }
+    if request.system_string is not None:
+        params["system"] = request.system_string
+    if request.temperature is not None:
+        params["temperature"] = request.temperature
+    return params
+
+
 class AnthropicService:
-    def __init__(self):
-        """Initialize the Anthropic service with API key from environment."""
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        response_cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        token_estimator: Optional[TokenEstimator] = None,
+        metrics: Optional[MetricsRecorder] = None,
+    ):
+        """Initialize the Anthropic service with API key from environment.
+
+        Args:
+            api_key: Anthropic API key (defaults to ANTHROPIC_API_KEY)
+            response_cache: Optional cache for temperature-0 responses
+            rate_limiter: Optional client-side RPM/TPM limiter and AIMD window;
+                share one instance between services to share the limits
+            retry_policy: Retry behavior for transient failures (defaults to
+                RetryPolicy()); replaces the SDK's own retries
+            token_estimator: Estimator for pre-flight checks (defaults to the
+                shared one, so PDF estimates are reused across services)
+            metrics: Recorder for per-call usage and latency (defaults to the
+                process-wide default_metrics)
+        """
         dotenv.load_dotenv()
-        api_key = os.getenv("ANTHROPIC_API_KEY")
+        api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
-        self.client = Anthropic(api_key=api_key)
+        # Retries are handled by self.retry_policy, not the SDK
+        self.client = Anthropic(api_key=api_key, max_retries=0)
         self.model_name = "claude-3-5-sonnet-20241022"
+        self.response_cache = response_cache
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.token_estimator = token_estimator or default_token_estimator
+        self.metrics = metrics or default_metrics
 
     @property
     def model(self) -> str:
@@ -28,6 +231,95 @@ class AnthropicService:
         """
         return self.model_name
 
+    def _rate_limit_slot(self, params: Dict[str, Any]):
+        """Wait for rate-limit capacity and return the request's slot."""
+        if self.rate_limiter is None:
+            return NO_LIMIT
+        return self.rate_limiter.limit(params)
+
+    def _create_message(self, **params: Any) -> Message:
+        """Send a Messages API request; every call_claude_* method funnels through here."""
+        params = self._preflight(params)
+        timer = CallTimer(self.metrics, params.get("model", self.model_name))
+        cache_key = None
+        if self.response_cache is not None and ResponseCache.is_cacheable(params):
+            cache_key = ResponseCache.key_for(params)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                timer.cached = True
+                timer.finish()
+                return Message.model_validate(cached)
+
+        def _attempt(remaining: Optional[float]) -> Message:
+            attempt_params = _attempt_params(params, remaining)
+            with self._rate_limit_slot(attempt_params) as slot:
+                response = self.client.messages.create(**attempt_params)
+                slot.record(response.usage)
+            return response
+
+        try:
+            response = self.retry_policy.call(_attempt, on_retry=timer.on_retry)
+        except Exception as e:
+            timer.finish(e)
+            raise
+        timer.usage = response.usage
+        timer.finish()
+
+        if cache_key is not None:
+            self.response_cache.set(cache_key, response.model_dump(mode="json"))
+        return response
+
+    def count_tokens(
+        self,
+        messages: List[Dict[str, Any]],
+        system: Optional[Union[str, List[Dict[str, Any]]]] = None,
+        exact: bool = False,
+    ) -> int:
+        """Count the input tokens of a request without sending it.
+
+        Args:
+            messages (List[Dict]): Messages in Claude's format
+            system (str | List[Dict], optional): System prompt
+            exact (bool): Ask the count_tokens endpoint instead of using the
+                local heuristic. Exact counts are cached per request.
+
+        Returns:
+            int: Input token count (an estimate unless exact=True)
+        """
+        params: Dict[str, Any] = {"model": self.model_name, "messages": messages}
+        if system is not None:
+            params["system"] = system
+        if not exact:
+            return self.token_estimator.estimate_request(params)
+
+        try:
+            return self._exact_input_tokens(params)
+        except Exception as e:
+            raise AnthropicError(f"Token counting failed: {str(e)}", original_error=e)
+
+    def _exact_input_tokens(self, params: Dict[str, Any]) -> int:
+        """Input tokens of a request from the count_tokens endpoint, cached."""
+        count_params = {k: v for k, v in params.items() if k in COUNT_TOKENS_PARAMS}
+        key = make_cache_key(
+            count_params.get("model", self.model_name),
+            count_params.get("system"),
+            count_params["messages"],
+            0,
+            None,
+            count_params.get("tools"),
+            count_params.get("tool_choice"),
+        )
+        tokens = self.token_estimator.cached_exact(key)
+        if tokens is None:
+            result = self.client.messages.count_tokens(**count_params)
+            tokens = result.input_tokens
+            self.token_estimator.remember_exact(key, tokens)
+        return tokens
+
+    def _preflight(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """preflight(), confirming a tight fit with the count_tokens endpoint."""
+        return preflight(params, self.token_estimator, self._exact_input_tokens)
+
     def call_claude_basic(
         self, max_tokens: int, input_string: str, system_string: Optional[str] = None
     ) -> str:
@@ -41,11 +333,9 @@ class AnthropicService:
         Returns:
             str: Claude's response text
         """
-        messages = [
-            {"role": "user", "content": [{"type": "text", "text": input_string}]}
-        ]
+        messages = [{"role": "user", "content": [_text_block(input_string)]}]
 
-        response = self.client.messages.create(
+        response = self._create_message(
             model=self.model_name,
             max_tokens=max_tokens,
             messages=messages,
@@ -69,7 +359,7 @@ class AnthropicService:
         Returns:
             str: Claude's response text
         """
-        response = self.client.messages.create(
+        response = self._create_message(
             model=self.model_name,
             system=system_string,
             messages=messages,
@@ -77,6 +367,205 @@ class AnthropicService:
         )
         return response.content[0].text
 
+    def call_claude_structured(
+        self,
+        max_tokens: int,
+        messages: List[Dict[str, Any]],
+        tool: StructuredTool,
+        system_string: Optional[str] = None,
+        temperature: float = 0.0,
+    ) -> Any:
+        """Force Claude to answer with a call to tool and return its input.
+
+        Args:
+            max_tokens (int): Maximum tokens in response
+            messages (List[Dict]): List of message dictionaries in Claude's format
+            tool (StructuredTool): Tool whose input schema is the answer's shape
+            system_string (Optional[str]): System prompt to guide Claude's behavior
+            temperature (float): Sampling temperature
+
+        Returns:
+            Any: The tool input, validated against tool.input_schema
+
+        Raises:
+            StructuredOutputError: If the answer does not match the schema
+        """
+        params: Dict[str, Any] = {
+            "model": self.model_name,
+            "max_tokens": max_tokens,
+            "messages": messages,
+            "temperature": temperature,
+            **tool.request_params(),
+        }
+        if system_string is not None:
+            params["system"] = system_string
+        return tool.parse(self._create_message(**params))
+
+    def _run_claude_request(self, index: int, spec: ClaudeRequestSpec) -> ClaudeResult:
+        """Run one request for call_claude_many, capturing rather than raising errors."""
+        try:
+            request = _as_claude_request(spec)
+            with claude_label(request.label or current_label()):
+                response = self._create_message(
+                    **_claude_request_params(request, self.model_name)
+                )
+            return ClaudeResult(index=index, text=response.content[0].text)
+        except Exception as e:
+            return ClaudeResult(index=index, error=e)
+
+    def iter_claude_many(
+        self, requests: Sequence[ClaudeRequestSpec], concurrency: int = 8
+    ) -> Iterator[ClaudeResult]:
+        """Run independent requests concurrently, yielding results as they complete.
+
+        Args:
+            requests: ClaudeRequest objects (or dicts of their fields)
+            concurrency: Maximum requests in flight at once
+
+        Yields:
+            ClaudeResult: In completion order; result.index is the input position
+        """
+        executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        try:
+            # Copy the caller's context so its claude_label reaches the workers
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run, self._run_claude_request, i, spec
+                )
+                for i, spec in enumerate(requests)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Stop queued work if the consumer abandons the iterator early
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def call_claude_many(
+        self, requests: Sequence[ClaudeRequestSpec], concurrency: int = 8
+    ) -> List[ClaudeResult]:
+        """Run independent requests concurrently and return results in input order.
+
+        Wall-clock time is roughly the slowest request per concurrency slot
+        rather than the sum of all latencies. A failing request does not stop
+        the others; its error is captured on its ClaudeResult.
+
+        Args:
+            requests: ClaudeRequest objects (or dicts of their fields)
+            concurrency: Maximum requests in flight at once
+
+        Returns:
+            List[ClaudeResult]: One result per request, in input order
+
+        Example:
+            results = service.call_claude_many(
+                [{"max_tokens": 500, "input_string": p} for p in prompts],
+                concurrency=10,
+            )
+            texts = [r.text for r in results if r.ok]
+        """
+        results: List[Optional[ClaudeResult]] = [None] * len(requests)
+        for result in self.iter_claude_many(requests, concurrency=concurrency):
+            results[result.index] = result
+        return results
+
+    def stream_claude_messages(
+        self,
+        max_tokens: int,
+        messages: List[Dict[str, Any]],
+        system_string: Optional[str] = None,
+        temperature: Optional[float] = None,
+    ) -> Iterator[str]:
+        """Stream Claude's reply to a conversation as text deltas.
+
+        Args:
+            max_tokens (int): Maximum tokens in response
+            messages (List[Dict]): List of message dictionaries in Claude's format
+            system_string (Optional[str]): System prompt to guide Claude's behavior
+            temperature (Optional[float]): Sampling temperature (API default if None)
+
+        Yields:
+            str: Successive pieces of the response text as they are generated
+        """
+        params: Dict[str, Any] = {
+            "model": self.model_name,
+            "max_tokens": max_tokens,
+            "messages": messages,
+        }
+        if system_string is not None:
+            params["system"] = system_string
+        if temperature is not None:
+            params["temperature"] = temperature
+
+        yield from self._stream(params, lambda stream: stream.text_stream)
+
+    def stream_claude_tool_input(
+        self,
+        max_tokens: int,
+        messages: List[Dict[str, Any]],
+        tool: StructuredTool,
+        system_string: Optional[Union[str, List[Dict[str, Any]]]] = None,
+        temperature: Optional[float] = None,
+    ) -> Iterator[str]:
+        """Force a call to tool and stream its input JSON as it is generated.
+
+        Feed the chunks to tool.iter_fields() to get validated fields as
+        they complete.
+
+        Yields:
+            str: Successive pieces of the tool input JSON
+        """
+        params: Dict[str, Any] = {
+            "model": self.model_name,
+            "max_tokens": max_tokens,
+            "messages": messages,
+            **tool.request_params(),
+        }
+        if system_string is not None:
+            params["system"] = system_string
+        if temperature is not None:
+            params["temperature"] = temperature
+        yield from self._stream(params, _tool_input_deltas)
+
+    def _stream(
+        self, params: Dict[str, Any], deltas: Callable[[Any], Iterator[str]]
+    ) -> Iterator[str]:
+        """Stream a request, yielding what deltas extracts from the SDK stream."""
+        params = self._preflight(params)
+        timer = CallTimer(self.metrics, self.model_name)
+
+        # Retry only while nothing has been yielded; after that the caller
+        # has seen partial output and a retry would duplicate it.
+        started = time.monotonic()
+        attempt = 0
+        delay = self.retry_policy.base_delay
+        yielded = False
+        while True:
+            attempt += 1
+            attempt_params = _attempt_params(
+                params, self.retry_policy.remaining(started)
+            )
+            try:
+                with self._rate_limit_slot(attempt_params) as slot:
+                    with self.client.messages.stream(**attempt_params) as stream:
+                        for text in deltas(stream):
+                            yielded = True
+                            timer.first_token()
+                            yield text
+                        timer.usage = stream.get_final_message().usage
+                        slot.record(timer.usage)
+                timer.finish()
+                return
+            except Exception as e:
+                wait = None
+                if not yielded:
+                    wait = self.retry_policy.plan_wait(attempt, e, delay, started)
+                if wait is None:
+                    timer.finish(e)
+                    raise
+                timer.retries += 1
+                delay = wait
+                time.sleep(wait)
+
     def call_claude_follow_up(
         self,
         initial_message: str,
@@ -103,22 +592,10 @@ class AnthropicService:
             follow_up = "It's Paris, the City of Light."
             response = call_claude_follow_up(initial, follow_up, "Tell me more about...")
         """
-        messages = [
-            {"role": "user", "content": [{"type": "text", "text": initial_message}]},
-            {
-                "role": "assistant",
-                "content": [{"type": "text", "text": follow_up_message}],
-            },
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "Tell me more about what you just said."}
-                ],
-            },
-        ]
+        messages = _follow_up_messages(initial_message, follow_up_message)
 
         try:
-            response = self.client.messages.create(
+            response = self._create_message(
                 model=self.model_name,
                 max_tokens=max_tokens,
                 system=system_string,
@@ -127,7 +604,9 @@ class AnthropicService:
             )
             return response.content[0].text if response.content else None
         except Exception as e:
-            raise Exception(f"Error in follow-up conversation: {str(e)}")
+            raise AnthropicError(
+                f"Error in follow-up conversation: {str(e)}", original_error=e
+            )
 
     def test_anthropic(self) -> Tuple[str, str, str]:
         # Test basic call
@@ -162,24 +641,34 @@ class AnthropicService:
 
         return response_basic, response_complex, response_follow_up
 
-    def _encode_image_file(self, image_path: str) -> str:
-        """Convert image file to base64 string."""
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
-
-    def _encode_image_url(self, image_url: str) -> str:
-        """Convert image from URL to base64 string."""
-        return base64.b64encode(httpx.get(image_url).content).decode("utf-8")
+    def _load_images(
+        self, sources: Sequence[str], is_url: bool
+    ) -> List[Dict[str, Any]]:
+        """Fetch or read and downscale images, returning image content blocks."""
+        if len(sources) == 1:
+            return [_image_block(*load_image(sources[0], is_url))]
+        with ThreadPoolExecutor(max_workers=min(len(sources), 8)) as executor:
+            loaded = list(executor.map(lambda src: load_image(src, is_url), sources))
+        return [_image_block(data, media_type) for data, media_type in loaded]
 
     def call_claude_with_image(
-        self, image_source: str, prompt: str, is_url: bool = False
+        self,
+        image_source: Union[str, Sequence[str]],
+        prompt: str,
+        is_url: bool = False,
+        max_tokens: int = 1000,
     ) -> str:
-        """Call Claude with an image and get a response.
+        """Call Claude with one or more images and get a response.
+
+        Images are downscaled to the size Claude actually uses and sent with
+        their detected media type.
 
         Args:
-            image_source (str): Path to local image file or URL
-            prompt (str): Text prompt to accompany the image
+            image_source (str | Sequence[str]): Path or URL of an image, or a
+                list of them (all paths or all URLs)
+            prompt (str): Text prompt to accompany the images
             is_url (bool): Whether image_source is a URL (True) or local path (False)
+            max_tokens (int): Maximum tokens in response
 
         Returns:
             str: Claude's response text
@@ -187,36 +676,19 @@ class AnthropicService:
         Raises:
             Exception: If image processing fails
         """
+        sources = [image_source] if isinstance(image_source, str) else image_source
         try:
-            # Convert both URLs and local files to base64
-            if is_url:
-                base64_data = self._encode_image_url(image_source)
-            else:
-                base64_data = self._encode_image_file(image_source)
-
-            # Create message with base64-encoded image
-            media = [
-                {
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/jpeg",
-                        "data": base64_data,
-                    },
-                }
-            ]
+            media = self._load_images(sources, is_url)
 
-            messages = [
-                {"role": "user", "content": [{"type": "text", "text": prompt}, *media]}
-            ]
+            messages = [{"role": "user", "content": [_text_block(prompt), *media]}]
 
-            response = self.client.messages.create(
-                model=self.model_name, max_tokens=1000, messages=messages
+            response = self._create_message(
+                model=self.model_name, max_tokens=max_tokens, messages=messages
             )
             return response.content[0].text
 
         except Exception as e:
-            raise Exception(f"Error processing image: {str(e)}")
+            raise AnthropicError(f"Error processing image: {str(e)}", original_error=e)
 
     # internal helper to get the client and model
     def get_pdf_client_and_model(self) -> Tuple[Anthropic, str]:
@@ -231,27 +703,28 @@ class AnthropicService:
     # internal helper from anthropic example
     def get_completion(
         self,
-        client: Anthropic,
+        client: Optional[Anthropic],
         messages: List[Message],
     ) -> str:
         """Get completion from Claude API.
 
         Args:
-            client (Anthropic): Anthropic client instance
+            client (Anthropic, optional): Ignored; kept for compatibility. The
+                request goes through this service's client, so it gets the
+                service's retries, rate limiting and metrics.
             messages (List[Message]): List of properly formatted message objects
 
         Returns:
             str: Claude's response text
+
+        Raises:
+            AnthropicTokenBudgetError: If the messages leave no room for a reply
         """
-        return (
-            client.messages.create(
-                model=self.model_name,
-                max_tokens=4096,
-                messages=messages,
-            )
-            .content[0]
-            .text
+        # 4096 unless the input leaves less room in the context window
+        response = self._create_message(
+            model=self.model_name, max_tokens=4096, messages=messages
         )
+        return response.content[0].text
 
     # ** external high level function or a complex helper call with messages from anthropic example - no system prompt
     def call_claude_pdf_with_messages(
@@ -260,6 +733,7 @@ class AnthropicService:
         messages: List[Dict[str, Union[str, List[Dict[str, str]]]]],
         temperature: float = 0.0,
         timeout: Optional[float] = None,
+        system: Optional[Union[str, List[Dict[str, Any]]]] = None,
     ) -> str:
         """
         Makes a call to Claude's PDF-enabled API with custom message formatting.
@@ -275,6 +749,8 @@ class AnthropicService:
                 content should include document source information.
             temperature (float, optional): Controls randomness in responses. Defaults to 0.0.
             timeout (float, optional): Timeout for API call in seconds. Defaults to None.
+            system (str | List[Dict], optional): System prompt, either plain text or
+                text blocks (e.g. carrying cache_control breakpoints). Defaults to None.
 
         Returns:
             str: Claude's response text
@@ -283,28 +759,56 @@ class AnthropicService:
             ValueError: If messages are not properly formatted
             Exception: If API call fails
         """
+        response = self.create_pdf_message(
+            max_tokens,
+            messages,
+            temperature=temperature,
+            timeout=timeout,
+            system=system,
+        )
+        return response.content[0].text
+
+    def create_pdf_message(
+        self,
+        max_tokens: int,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.0,
+        timeout: Optional[float] = None,
+        system: Optional[Union[str, List[Dict[str, Any]]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[Dict[str, Any]] = None,
+    ) -> Message:
+        """Same as call_claude_pdf_with_messages but returns the full Message.
+
+        Use this when the caller needs response metadata such as token usage,
+        or tool_use blocks (see StructuredTool.request_params).
+
+        Returns:
+            Message: Claude's full response, including usage
+        """
         try:
             # Validate message format
-            for msg in messages:
-                if (
-                    not isinstance(msg, dict)
-                    or "role" not in msg
-                    or "content" not in msg
-                ):
-                    raise ValueError("Invalid message format")
-
-            client, model_name = self.get_pdf_client_and_model()
-            response = client.messages.create(
-                model=model_name,
-                max_tokens=max_tokens,
-                messages=messages,
-                temperature=temperature,
-                timeout=timeout,
-            )
-            return response.content[0].text
-
+            _validate_messages(messages)
+
+            params: Dict[str, Any] = {
+                "model": self.model_name,
+                "max_tokens": max_tokens,
+                "messages": messages,
+                "temperature": temperature,
+                "timeout": timeout,
+            }
+            if system is not None:
+                params["system"] = system
+            if tools is not None:
+                params["tools"] = tools
+            if tool_choice is not None:
+                params["tool_choice"] = tool_choice
+            return self._create_message(**params)
+
+        except AnthropicTokenBudgetError:
+            raise
         except Exception as e:
-            raise Exception(f"PDF processing failed: {str(e)}")
+            raise AnthropicError(f"PDF processing failed: {str(e)}", original_error=e)
 
     # external helper for a simple call makes user messages - no system prompt
     def call_claude_pdf_basic(
@@ -327,34 +831,26 @@ class AnthropicService:
 
         Returns:
             str: Claude's response text
+
+        PDFs too large for one document block are split into page ranges and
+        answered with call_claude_pdf_map_reduce when pypdf is installed.
         """
         if not input_string.strip():
             raise ValueError("Input string cannot be empty")
 
         try:
-            # Read the PDF file
-            with open(pdf_path, "rb") as f:
-                pdf_content = f.read()
-
             # Create message with both text and PDF using correct type
             messages = [
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": input_string},
-                        {
-                            "type": "document",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "application/pdf",
-                                "data": base64.b64encode(pdf_content).decode(),
-                            },
-                        },
+                        _text_block(input_string),
+                        default_pdf_registry.get(pdf_path).document_block(),
                     ],
                 }
             ]
 
-            response = self.client.messages.create(
+            response = self._create_message(
                 model=self.model_name,
                 max_tokens=max_tokens,
                 messages=messages,
@@ -363,8 +859,96 @@ class AnthropicService:
             )
             return response.content[0].text
 
+        except AnthropicTokenBudgetError:
+            if not pdf_split.can_split_pdfs():
+                raise
+            return self.call_claude_pdf_map_reduce(
+                max_tokens, input_string, pdf_path, temperature=temperature
+            )
         except Exception as e:
-            raise Exception(f"PDF processing failed: {str(e)}")
+            raise AnthropicError(f"PDF processing failed: {str(e)}", original_error=e)
+
+    def call_claude_pdf_map_reduce(
+        self,
+        max_tokens: int,
+        input_string: str,
+        pdf_path: str,
+        temperature: float = 0.0,
+        reduce_prompt: Optional[str] = None,
+        pages_per_chunk: Optional[int] = None,
+        concurrency: int = 8,
+    ) -> str:
+        """Answers a prompt about a PDF of any length by map-reduce over page ranges.
+
+        The PDF is split into the fewest evenly sized chunks that fit the
+        request limits, the prompt runs on all chunks concurrently, and one
+        text-only call merges the partial answers. Wall-clock time is about
+        one chunk call plus the merge, whatever the length of the document.
+
+        Args:
+            max_tokens (int): Maximum tokens for each chunk answer and the merge
+            input_string (str): The prompt to answer about the whole PDF
+            pdf_path (str): Path to the PDF file
+            temperature (float, optional): Sampling temperature. Defaults to 0.0.
+            reduce_prompt (str, optional): Instructions for merging the partial
+                answers. Defaults to pdf_split.DEFAULT_REDUCE_PROMPT.
+            pages_per_chunk (int, optional): Page limit per chunk; smaller chunks
+                mean more parallel calls. Defaults to the most that fit.
+            concurrency (int, optional): Chunk calls in flight at once. Defaults to 8.
+
+        Returns:
+            str: The merged answer
+        """
+        if not input_string.strip():
+            raise ValueError("Input string cannot be empty")
+
+        chunks = pdf_split.split_pdf(
+            pdf_path,
+            pages_per_chunk
+            or pdf_split.chunk_page_limit(
+                max_tokens, estimate_text_tokens(input_string)
+            ),
+        )
+        results = self.call_claude_many(
+            pdf_split.map_requests(chunks, input_string, max_tokens, temperature),
+            concurrency=concurrency,
+        )
+        failed = [result for result in results if not result.ok]
+        if failed:
+            raise AnthropicError(
+                f"{len(failed)} of {len(chunks)} PDF chunks failed: "
+                f"{str(failed[0].error)}",
+                original_error=failed[0].error,
+            )
+        partials = [result.text for result in results]
+        if len(partials) == 1:
+            return partials[0]
+
+        try:
+            response = self._create_message(
+                model=self.model_name,
+                max_tokens=max_tokens,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            _text_block(
+                                pdf_split.reduce_input(
+                                    input_string, chunks, partials, reduce_prompt
+                                )
+                            )
+                        ],
+                    }
+                ],
+                temperature=temperature,
+            )
+            return response.content[0].text
+        except AnthropicTokenBudgetError:
+            raise
+        except Exception as e:
+            raise AnthropicError(
+                f"Merging PDF chunk answers failed: {str(e)}", original_error=e
+            )
 
     def get_model(self):
         """Get the current model being used."""
@@ -0,0 +1,329 @@
+"""Pre-flight token estimation and budget checks for Claude requests.
+
+A fast local heuristic sizes requests before they are sent; the exact
+count_tokens endpoint is asked when the heuristic says a request may not fit,
+since for PDFs it is an upper bound rather than a measurement. Only the
+hard limits (pages per PDF, request size) are enforced from the heuristic
+alone. PDF estimates are cached by a hash of the document so repeated
+requests about the same paper cost nothing to estimate.
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from dhg.core.exceptions import AnthropicTokenBudgetError
+from dhg.services.pdf_payload import resident_sha256
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pypdf is optional
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+# Limits for claude-3-5-sonnet
+MODEL_CONTEXT_WINDOW = 200_000
+MODEL_MAX_OUTPUT_TOKENS = 8192
+PDF_MAX_PAGES = 100
+MAX_REQUEST_BYTES = 32 * 1024 * 1024
+
+# Heuristics. Each PDF page is sent as extracted text plus a page image, which
+# the API documents as roughly 1,500-3,000 text tokens plus an image per page,
+# so PDF estimates use the top of that range.
+CHARS_PER_TOKEN = 3.5
+PDF_TOKENS_PER_PAGE = 3000
+IMAGE_TOKENS = 1600
+MESSAGE_OVERHEAD_TOKENS = 5
+
+# Smallest output budget worth sending a request for
+MIN_OUTPUT_TOKENS = 256
+
+_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Heuristic token count for plain text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def count_pdf_pages(pdf_bytes: bytes) -> int:
+    """Count pages by their page objects, or with pypdf if none are found.
+
+    Page objects inside compressed object streams are invisible to the scan.
+    Returns 0 if the count is unknown (pypdf missing or the PDF unreadable).
+    """
+    pages = len(_PAGE_PATTERN.findall(pdf_bytes))
+    if pages or PdfReader is None:
+        return pages
+    try:
+        return len(PdfReader(io.BytesIO(pdf_bytes)).pages)
+    except Exception as e:
+        logger.debug(f"Could not count PDF pages with pypdf: {str(e)}")
+        return 0
+
+
+class PdfEstimate:
+    """Page count, size and token estimate for one PDF."""
+
+    def __init__(self, sha256: str, pages: int, size_bytes: int):
+        self.sha256 = sha256
+        self.pages = pages
+        self.size_bytes = size_bytes
+
+    @property
+    def tokens(self) -> int:
+        return self.pages * PDF_TOKENS_PER_PAGE
+
+
+class TokenEstimator:
+    """Estimates request sizes, caching PDF estimates by content hash."""
+
+    def __init__(self, max_cached_pdfs: int = 1024):
+        self.max_cached_pdfs = max_cached_pdfs
+        self._pdf_cache: "OrderedDict[str, PdfEstimate]" = OrderedDict()
+        self._exact_cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, cache: OrderedDict, key: str, value: Any) -> None:
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.max_cached_pdfs:
+                cache.popitem(last=False)
+
+    def _lookup(self, cache: OrderedDict, key: str) -> Any:
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+
+    def estimate_pdf(
+        self, pdf_base64: str, sha256: Optional[str] = None
+    ) -> PdfEstimate:
+        """Estimate a base64-encoded PDF.
+
+        Args:
+            pdf_base64: The document's base64 data
+            sha256: SHA-256 of the PDF bytes if the caller already has one;
+                otherwise taken from the payload registry when the data is a
+                resident payload, and only computed as a last resort
+        """
+        key = sha256 or resident_sha256(pdf_base64)
+        pdf_bytes = None
+        if key is None:
+            pdf_bytes = base64.b64decode(pdf_base64)
+            key = hashlib.sha256(pdf_bytes).hexdigest()
+        estimate = self._lookup(self._pdf_cache, key)
+        if estimate is None:
+            if pdf_bytes is None:
+                pdf_bytes = base64.b64decode(pdf_base64)
+            estimate = PdfEstimate(key, count_pdf_pages(pdf_bytes), len(pdf_bytes))
+            self._remember(self._pdf_cache, key, estimate)
+        return estimate
+
+    def _block_tokens(self, block: Union[str, Dict[str, Any]]) -> int:
+        if isinstance(block, str):
+            return estimate_text_tokens(block)
+        block_type = block.get("type")
+        if block_type == "text":
+            return estimate_text_tokens(block.get("text", ""))
+        if block_type == "document":
+            source = block.get("source", {})
+            if source.get("media_type") == "application/pdf" and source.get("data"):
+                return self.estimate_pdf(source["data"]).tokens
+            return estimate_text_tokens(str(source.get("data", "")))
+        if block_type == "image":
+            return IMAGE_TOKENS
+        return estimate_text_tokens(str(block))
+
+    def _content_tokens(self, content: Any) -> int:
+        if isinstance(content, list):
+            return sum(self._block_tokens(block) for block in content)
+        return self._block_tokens(content) if content else 0
+
+    def estimate_request(self, params: Dict[str, Any]) -> int:
+        """Heuristic input token count for Messages API parameters."""
+        total = self._content_tokens(params.get("system"))
+        for message in params.get("messages") or []:
+            total += MESSAGE_OVERHEAD_TOKENS
+            total += self._content_tokens(message.get("content"))
+        for tool in params.get("tools") or []:
+            total += estimate_text_tokens(str(tool))
+        return total
+
+    def pdf_estimates(self, params: Dict[str, Any]) -> List[PdfEstimate]:
+        """Estimates for every PDF document block in the request."""
+        estimates = []
+        for message in params.get("messages") or []:
+            content = message.get("content")
+            if not isinstance(content, list):
+                continue
+            for block in content:
+                if not isinstance(block, dict):
+                    continue
+                source = block.get("source", {})
+                if (
+                    block.get("type") == "document"
+                    and source.get("media_type") == "application/pdf"
+                ):
+                    estimates.append(self.estimate_pdf(source["data"]))
+        return estimates
+
+    def cached_exact(self, key: str) -> Optional[int]:
+        """Exact count previously stored under key, if any."""
+        return self._lookup(self._exact_cache, key)
+
+    def remember_exact(self, key: str, tokens: int) -> None:
+        """Store an exact count from the count_tokens endpoint."""
+        self._remember(self._exact_cache, key, tokens)
+
+
+# Shared so PDF estimates are reused across service instances
+default_token_estimator = TokenEstimator()
+
+
+def estimate_request_tokens(params: Dict[str, Any]) -> int:
+    """Heuristic input token count using the shared estimator."""
+    return default_token_estimator.estimate_request(params)
+
+
+def check_pdf_limits(estimates: List[PdfEstimate]) -> None:
+    """Reject PDFs over the page or request-size limits before uploading them."""
+    total_bytes = 0
+    for estimate in estimates:
+        if estimate.pages > PDF_MAX_PAGES:
+            raise AnthropicTokenBudgetError(
+                f"PDF has {estimate.pages} pages; the limit is {PDF_MAX_PAGES}"
+            )
+        total_bytes += estimate.size_bytes
+    # base64 inflates the payload by 4/3
+    if total_bytes * 4 / 3 > MAX_REQUEST_BYTES:
+        raise AnthropicTokenBudgetError(
+            f"PDF payload of {total_bytes} bytes exceeds the "
+            f"{MAX_REQUEST_BYTES} byte request limit once encoded"
+        )
+
+
+def plan_max_tokens(
+    input_tokens: int,
+    requested: Optional[int] = None,
+    context_window: int = MODEL_CONTEXT_WINDOW,
+    max_output_tokens: int = MODEL_MAX_OUTPUT_TOKENS,
+) -> int:
+    """Fit max_tokens into what the context window has left after the input.
+
+    Args:
+        input_tokens: Estimated or exact input size
+        requested: Caller's max_tokens (defaults to the model maximum)
+        context_window: Model context window
+        max_output_tokens: Model output limit
+
+    Returns:
+        int: max_tokens to send
+
+    Raises:
+        AnthropicTokenBudgetError: If fewer than MIN_OUTPUT_TOKENS remain
+    """
+    remaining = context_window - input_tokens
+    budget = min(requested or max_output_tokens, max_output_tokens, remaining)
+    if budget < min(MIN_OUTPUT_TOKENS, requested or MIN_OUTPUT_TOKENS):
+        raise AnthropicTokenBudgetError(
+            f"Input of ~{input_tokens} tokens leaves {max(remaining, 0)} of the "
+            f"{context_window}-token context window for output"
+        )
+    return budget
+
+
+# Exact input token count of a request, e.g. from the count_tokens endpoint
+ExactCounter = Callable[[Dict[str, Any]], int]
+AsyncExactCounter = Callable[[Dict[str, Any]], Awaitable[int]]
+
+# Request parameters the count_tokens endpoint accepts
+COUNT_TOKENS_PARAMS = ("model", "messages", "system", "tools", "tool_choice")
+
+
+def _fits(params: Dict[str, Any], input_tokens: int) -> bool:
+    requested = params.get("max_tokens") or MODEL_MAX_OUTPUT_TOKENS
+    output_tokens = min(requested, MODEL_MAX_OUTPUT_TOKENS)
+    return input_tokens + output_tokens <= MODEL_CONTEXT_WINDOW
+
+
+def _fit_max_tokens(params: Dict[str, Any], input_tokens: int) -> Dict[str, Any]:
+    requested = params.get("max_tokens")
+    max_tokens = plan_max_tokens(input_tokens, requested)
+    if max_tokens == requested:
+        return params
+    logger.info(f"Reducing max_tokens from {requested} to {max_tokens} to fit context")
+    return {**params, "max_tokens": max_tokens}
+
+
+def _checked_estimate(params: Dict[str, Any], estimator: TokenEstimator) -> int:
+    """Estimated input tokens, after rejecting PDFs over the hard limits."""
+    check_pdf_limits(estimator.pdf_estimates(params))
+    return estimator.estimate_request(params)
+
+
+def preflight(
+    params: Dict[str, Any],
+    estimator: Optional[TokenEstimator] = None,
+    count_exact: Optional[ExactCounter] = None,
+) -> Dict[str, Any]:
+    """Check a request against the model's limits before it is sent.
+
+    PDFs over the page or size limits are rejected without uploading them.
+    If the estimated input leaves too little room for max_tokens, the exact
+    count from count_exact is used to shrink max_tokens or reject the
+    request; if counting fails the request is sent unchanged and the API has
+    the last word.
+
+    Args:
+        params: Messages API parameters
+        estimator: Heuristic estimator (defaults to the shared one)
+        count_exact: Exact counter, e.g. the count_tokens endpoint; without
+            one the estimate is trusted
+
+    Returns:
+        Dict: params, with max_tokens adjusted if needed
+
+    Raises:
+        AnthropicTokenBudgetError: If the request cannot fit
+    """
+    estimator = estimator or default_token_estimator
+    input_tokens = _checked_estimate(params, estimator)
+    if count_exact is not None and not _fits(params, input_tokens):
+        try:
+            input_tokens = count_exact(params)
+        except Exception as e:
+            logger.warning(f"Token counting failed; sending unchecked: {str(e)}")
+            return params
+    return _fit_max_tokens(params, input_tokens)
+
+
+async def apreflight(
+    params: Dict[str, Any],
+    estimator: Optional[TokenEstimator] = None,
+    count_exact: Optional[AsyncExactCounter] = None,
+) -> Dict[str, Any]:
+    """preflight() with an async exact counter.
+
+    Estimating a PDF not seen before decodes it and counts its pages, so the
+    estimate runs in a worker thread rather than on the event loop.
+    """
+    estimator = estimator or default_token_estimator
+    input_tokens = await asyncio.to_thread(_checked_estimate, params, estimator)
+    if count_exact is not None and not _fits(params, input_tokens):
+        try:
+            input_tokens = await count_exact(params)
+        except Exception as e:
+            logger.warning(f"Token counting failed; sending unchecked: {str(e)}")
+            return params
+    return _fit_max_tokens(params, input_tokens)
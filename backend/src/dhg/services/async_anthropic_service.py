@@ -0,0 +1,765 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Optional, List, Dict, Union, Tuple, Any, AsyncIterator, Sequence
+
+import dotenv
+import httpx
+from anthropic import AsyncAnthropic
+from anthropic.types import Message
+
+from dhg.services.anthropic_cache import ResponseCache, make_cache_key
+from dhg.services.anthropic_metrics import (
+    CallTimer,
+    MetricsRecorder,
+    claude_label,
+    current_label,
+    default_metrics,
+)
+from dhg.services.anthropic_images import aload_image
+from dhg.services.pdf_payload import default_pdf_registry
+from dhg.services import pdf_split
+from dhg.services.anthropic_rate_limiter import RateLimiter, NO_LIMIT
+from dhg.services.anthropic_tokens import (
+    COUNT_TOKENS_PARAMS,
+    TokenEstimator,
+    apreflight,
+    default_token_estimator,
+    estimate_text_tokens,
+)
+from dhg.services.anthropic_retry import RetryPolicy
+from dhg.services.structured_output import StructuredTool
+from dhg.core.exceptions import AnthropicError, AnthropicTokenBudgetError
+from dhg.services.anthropic_service import (
+    ClaudeRequestSpec,
+    ClaudeResult,
+    _as_claude_request,
+    _claude_request_params,
+    _attempt_params,
+    _text_block,
+    _image_block,
+    _follow_up_messages,
+    _validate_messages,
+)
+
+dotenv.load_dotenv()
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_TIMEOUT = 600.0
+
+# One pooled client per (process, api key, pool settings). Keyed on pid so a
+# forked worker never reuses sockets inherited from its parent.
+_shared_clients: Dict[Tuple[Any, ...], AsyncAnthropic] = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_async_client(
+    api_key: str,
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+) -> AsyncAnthropic:
+    """Return the process-wide pooled AsyncAnthropic client for these settings.
+
+    Args:
+        api_key: Anthropic API key
+        max_connections: Upper bound on open connections in the pool
+        max_keepalive_connections: Idle connections kept open for reuse
+        keepalive_expiry: Seconds an idle connection is kept alive
+
+    Returns:
+        AsyncAnthropic: Shared client backed by a keep-alive httpx pool
+    """
+    key = (
+        os.getpid(),
+        api_key,
+        max_connections,
+        max_keepalive_connections,
+        keepalive_expiry,
+    )
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                    keepalive_expiry=keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=10.0),
+            )
+            # Retries are handled by each service's RetryPolicy, not the SDK
+            client = AsyncAnthropic(
+                api_key=api_key, http_client=http_client, max_retries=0
+            )
+            _shared_clients[key] = client
+        return client
+
+
+async def close_shared_async_clients() -> None:
+    """Close every pooled client owned by this process (call on app shutdown)."""
+    with _shared_clients_lock:
+        pid = os.getpid()
+        owned = [key for key in _shared_clients if key[0] == pid]
+        clients = [_shared_clients.pop(key) for key in owned]
+    for client in clients:
+        await client.close()
+
+
+def _env_number(name: str, default: Union[int, float]) -> Union[int, float]:
+    """Read a numeric setting from the environment, falling back to default."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    return type(default)(value)
+
+
+class AsyncAnthropicService:
+    """Async counterpart of AnthropicService for use inside an event loop.
+
+    All instances in a process share one pooled AsyncAnthropic client, so
+    constructing a service per request is cheap and never opens a new pool.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        response_cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        token_estimator: Optional[TokenEstimator] = None,
+        metrics: Optional[MetricsRecorder] = None,
+    ):
+        """Initialize the service with API key and pool limits from environment.
+
+        Args:
+            api_key: Anthropic API key (defaults to ANTHROPIC_API_KEY)
+            max_connections: Pool size (defaults to ANTHROPIC_MAX_CONNECTIONS)
+            max_keepalive_connections: Idle pool size
+                (defaults to ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS)
+            keepalive_expiry: Idle connection lifetime in seconds
+                (defaults to ANTHROPIC_KEEPALIVE_EXPIRY)
+            response_cache: Optional cache for temperature-0 responses
+            rate_limiter: Optional client-side RPM/TPM limiter and AIMD window;
+                share one instance between services to share the limits
+            retry_policy: Retry behavior for transient failures (defaults to
+                RetryPolicy())
+            token_estimator: Estimator for pre-flight checks (defaults to the
+                shared one, so PDF estimates are reused across services)
+            metrics: Recorder for per-call usage and latency (defaults to the
+                process-wide default_metrics)
+        """
+        api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("ANTHROPIC_API_KEY environment variable is not set")
+        self.client = get_shared_async_client(
+            api_key,
+            max_connections=max_connections
+            or _env_number("ANTHROPIC_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS),
+            max_keepalive_connections=max_keepalive_connections
+            or _env_number(
+                "ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS",
+                DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            keepalive_expiry=keepalive_expiry
+            or _env_number("ANTHROPIC_KEEPALIVE_EXPIRY", DEFAULT_KEEPALIVE_EXPIRY),
+        )
+        self.model_name = "claude-3-5-sonnet-20241022"
+        self.response_cache = response_cache
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.token_estimator = token_estimator or default_token_estimator
+        self.metrics = metrics or default_metrics
+
+    @property
+    def model(self) -> str:
+        """Current model name."""
+        return self.model_name
+
+    async def _rate_limit_slot(self, params: Dict[str, Any]):
+        """Wait for rate-limit capacity and return the request's slot."""
+        if self.rate_limiter is None:
+            return NO_LIMIT
+        return await self.rate_limiter.alimit(params)
+
+    async def _create_message(self, **params: Any) -> Message:
+        """Send a Messages API request; every call_claude_* method funnels through here."""
+        params = await self._preflight(params)
+        timer = CallTimer(self.metrics, params.get("model", self.model_name))
+        cache_key = None
+        if self.response_cache is not None and ResponseCache.is_cacheable(params):
+            cache_key = await asyncio.to_thread(ResponseCache.key_for, params)
+            cached = await self.response_cache.aget(cache_key)
+            if cached is not None:
+                timer.cached = True
+                timer.finish()
+                return Message.model_validate(cached)
+
+        async def _attempt(remaining: Optional[float]) -> Message:
+            attempt_params = _attempt_params(params, remaining)
+            async with await self._rate_limit_slot(attempt_params) as slot:
+                response = await self.client.messages.create(**attempt_params)
+                slot.record(response.usage)
+            return response
+
+        try:
+            response = await self.retry_policy.acall(_attempt, on_retry=timer.on_retry)
+        except Exception as e:
+            timer.finish(e)
+            raise
+        timer.usage = response.usage
+        timer.finish()
+
+        if cache_key is not None:
+            await self.response_cache.aset(cache_key, response.model_dump(mode="json"))
+        return response
+
+    async def count_tokens(
+        self,
+        messages: List[Dict[str, Any]],
+        system: Optional[Union[str, List[Dict[str, Any]]]] = None,
+        exact: bool = False,
+    ) -> int:
+        """Count the input tokens of a request without sending it.
+
+        Args:
+            messages (List[Dict]): Messages in Claude's format
+            system (str | List[Dict], optional): System prompt
+            exact (bool): Ask the count_tokens endpoint instead of using the
+                local heuristic. Exact counts are cached per request.
+
+        Returns:
+            int: Input token count (an estimate unless exact=True)
+        """
+        params: Dict[str, Any] = {"model": self.model_name, "messages": messages}
+        if system is not None:
+            params["system"] = system
+        if not exact:
+            return self.token_estimator.estimate_request(params)
+
+        try:
+            return await self._exact_input_tokens(params)
+        except Exception as e:
+            raise AnthropicError(f"Token counting failed: {str(e)}", original_error=e)
+
+    async def _exact_input_tokens(self, params: Dict[str, Any]) -> int:
+        """Input tokens of a request from the count_tokens endpoint, cached."""
+        count_params = {k: v for k, v in params.items() if k in COUNT_TOKENS_PARAMS}
+        key = make_cache_key(
+            count_params.get("model", self.model_name),
+            count_params.get("system"),
+            count_params["messages"],
+            0,
+            None,
+            count_params.get("tools"),
+            count_params.get("tool_choice"),
+        )
+        tokens = self.token_estimator.cached_exact(key)
+        if tokens is None:
+            result = await self.client.messages.count_tokens(**count_params)
+            tokens = result.input_tokens
+            self.token_estimator.remember_exact(key, tokens)
+        return tokens
+
+    async def _preflight(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """preflight(), confirming a tight fit with the count_tokens endpoint."""
+        return await apreflight(params, self.token_estimator, self._exact_input_tokens)
+
+    async def call_claude_basic(
+        self, max_tokens: int, input_string: str, system_string: Optional[str] = None
+    ) -> str:
+        """Basic Claude call with system prompt and single user message.
+
+        Args:
+            max_tokens (int): Maximum tokens in response
+            input_string (str): User's input message
+            system_string (Optional[str]): System prompt to guide Claude's behavior
+
+        Returns:
+            str: Claude's response text
+        """
+        messages = [{"role": "user", "content": [_text_block(input_string)]}]
+
+        response = await self._create_message(
+            model=self.model_name,
+            max_tokens=max_tokens,
+            messages=messages,
+            system=system_string,
+        )
+        return response.content[0].text
+
+    async def call_claude_messages(
+        self,
+        max_tokens: int,
+        messages: List[Dict[str, Union[str, List[Dict[str, str]]]]],
+        system_string: str,
+    ) -> str:
+        """Complex Claude call supporting multiple messages and system prompt.
+
+        Args:
+            max_tokens (int): Maximum tokens in response
+            messages (List[Dict]): List of message dictionaries in Claude's format
+            system_string (str): System prompt to guide Claude's behavior
+
+        Returns:
+            str: Claude's response text
+        """
+        response = await self._create_message(
+            model=self.model_name,
+            system=system_string,
+            messages=messages,
+            max_tokens=max_tokens,
+        )
+        return response.content[0].text
+
+    async def call_claude_structured(
+        self,
+        max_tokens: int,
+        messages: List[Dict[str, Any]],
+        tool: StructuredTool,
+        system_string: Optional[str] = None,
+        temperature: float = 0.0,
+    ) -> Any:
+        """Force Claude to answer with a call to tool and return its input.
+
+        Args:
+            max_tokens (int): Maximum tokens in response
+            messages (List[Dict]): List of message dictionaries in Claude's format
+            tool (StructuredTool): Tool whose input schema is the answer's shape
+            system_string (Optional[str]): System prompt to guide Claude's behavior
+            temperature (float): Sampling temperature
+
+        Returns:
+            Any: The tool input, validated against tool.input_schema
+
+        Raises:
+            StructuredOutputError: If the answer does not match the schema
+        """
+        params: Dict[str, Any] = {
+            "model": self.model_name,
+            "max_tokens": max_tokens,
+            "messages": messages,
+            "temperature": temperature,
+            **tool.request_params(),
+        }
+        if system_string is not None:
+            params["system"] = system_string
+        return tool.parse(await self._create_message(**params))
+
+    async def _run_claude_request(
+        self, index: int, spec: ClaudeRequestSpec, semaphore: asyncio.Semaphore
+    ) -> ClaudeResult:
+        """Run one request for call_claude_many, capturing rather than raising errors."""
+        async with semaphore:
+            try:
+                request = _as_claude_request(spec)
+                with claude_label(request.label or current_label()):
+                    response = await self._create_message(
+                        **_claude_request_params(request, self.model_name)
+                    )
+                return ClaudeResult(index=index, text=response.content[0].text)
+            except Exception as e:
+                return ClaudeResult(index=index, error=e)
+
+    async def iter_claude_many(
+        self, requests: Sequence[ClaudeRequestSpec], concurrency: int = 8
+    ) -> AsyncIterator[ClaudeResult]:
+        """Run independent requests concurrently, yielding results as they complete.
+
+        Args:
+            requests: ClaudeRequest objects (or dicts of their fields)
+            concurrency: Maximum requests in flight at once
+
+        Yields:
+            ClaudeResult: In completion order; result.index is the input position
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        tasks = [
+            asyncio.ensure_future(self._run_claude_request(i, spec, semaphore))
+            for i, spec in enumerate(requests)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Cancel outstanding work if the consumer stops early
+            for task in tasks:
+                task.cancel()
+
+    async def call_claude_many(
+        self, requests: Sequence[ClaudeRequestSpec], concurrency: int = 8
+    ) -> List[ClaudeResult]:
+        """Run independent requests concurrently and return results in input order.
+
+        A failing request does not stop the others; its error is captured on
+        its ClaudeResult.
+
+        Args:
+            requests: ClaudeRequest objects (or dicts of their fields)
+            concurrency: Maximum requests in flight at once
+
+        Returns:
+            List[ClaudeResult]: One result per request, in input order
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        return list(
+            await asyncio.gather(
+                *(
+                    self._run_claude_request(i, spec, semaphore)
+                    for i, spec in enumerate(requests)
+                )
+            )
+        )
+
+    async def stream_claude_messages(
+        self,
+        max_tokens: int,
+        messages: List[Dict[str, Any]],
+        system_string: Optional[str] = None,
+        temperature: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """Stream Claude's reply to a conversation as text deltas.
+
+        Args:
+            max_tokens (int): Maximum tokens in response
+            messages (List[Dict]): List of message dictionaries in Claude's format
+            system_string (Optional[str]): System prompt to guide Claude's behavior
+            temperature (Optional[float]): Sampling temperature (API default if None)
+
+        Yields:
+            str: Successive pieces of the response text as they are generated
+        """
+        params: Dict[str, Any] = {
+            "model": self.model_name,
+            "max_tokens": max_tokens,
+            "messages": messages,
+        }
+        if system_string is not None:
+            params["system"] = system_string
+        if temperature is not None:
+            params["temperature"] = temperature
+
+        params = await self._preflight(params)
+        timer = CallTimer(self.metrics, self.model_name)
+
+        # Retry only while nothing has been yielded
+        started = time.monotonic()
+        attempt = 0
+        delay = self.retry_policy.base_delay
+        yielded = False
+        while True:
+            attempt += 1
+            attempt_params = _attempt_params(
+                params, self.retry_policy.remaining(started)
+            )
+            try:
+                async with await self._rate_limit_slot(attempt_params) as slot:
+                    async with self.client.messages.stream(**attempt_params) as stream:
+                        async for text in stream.text_stream:
+                            yielded = True
+                            timer.first_token()
+                            yield text
+                        timer.usage = (await stream.get_final_message()).usage
+                        slot.record(timer.usage)
+                timer.finish()
+                return
+            except Exception as e:
+                wait = None
+                if not yielded:
+                    wait = self.retry_policy.plan_wait(attempt, e, delay, started)
+                if wait is None:
+                    timer.finish(e)
+                    raise
+                timer.retries += 1
+                delay = wait
+                await asyncio.sleep(wait)
+
+    async def call_claude_follow_up(
+        self,
+        initial_message: str,
+        follow_up_message: str,
+        system_string: Optional[str] = None,
+        max_tokens: int = 2048,
+        temperature: float = 0,
+    ) -> str:
+        """Process a follow-up conversation with Claude.
+
+        Args:
+            initial_message: The user's initial message
+            follow_up_message: Claude's previous response to follow up on
+            system_string: Optional system prompt to guide Claude's behavior
+            max_tokens: Maximum tokens in response (default: 2048)
+            temperature: Randomness in response (0 = deterministic, 1 = creative)
+
+        Returns:
+            str: Claude's response text
+        """
+        messages = _follow_up_messages(initial_message, follow_up_message)
+
+        try:
+            response = await self._create_message(
+                model=self.model_name,
+                max_tokens=max_tokens,
+                system=system_string,
+                temperature=temperature,
+                messages=messages,
+            )
+            return response.content[0].text if response.content else None
+        except Exception as e:
+            raise AnthropicError(
+                f"Error in follow-up conversation: {str(e)}", original_error=e
+            )
+
+    async def call_claude_with_image(
+        self,
+        image_source: Union[str, Sequence[str]],
+        prompt: str,
+        is_url: bool = False,
+        max_tokens: int = 1000,
+    ) -> str:
+        """Call Claude with one or more images and get a response.
+
+        Images are fetched concurrently through a pooled client and
+        downscaled off the event loop.
+
+        Args:
+            image_source (str | Sequence[str]): Path or URL of an image, or a
+                list of them (all paths or all URLs)
+            prompt (str): Text prompt to accompany the images
+            is_url (bool): Whether image_source is a URL (True) or local path (False)
+            max_tokens (int): Maximum tokens in response
+
+        Returns:
+            str: Claude's response text
+
+        Raises:
+            Exception: If image processing fails
+        """
+        sources = [image_source] if isinstance(image_source, str) else image_source
+        try:
+            loaded = await asyncio.gather(
+                *(aload_image(source, is_url) for source in sources)
+            )
+            media = [_image_block(data, media_type) for data, media_type in loaded]
+
+            messages = [{"role": "user", "content": [_text_block(prompt), *media]}]
+
+            response = await self._create_message(
+                model=self.model_name, max_tokens=max_tokens, messages=messages
+            )
+            return response.content[0].text
+
+        except Exception as e:
+            raise AnthropicError(f"Error processing image: {str(e)}", original_error=e)
+
+    async def call_claude_pdf_with_messages(
+        self,
+        max_tokens: int,
+        messages: List[Dict[str, Union[str, List[Dict[str, str]]]]],
+        temperature: float = 0.0,
+        timeout: Optional[float] = None,
+        system: Optional[Union[str, List[Dict[str, Any]]]] = None,
+    ) -> str:
+        """Makes a call to Claude's PDF-enabled API with custom message formatting.
+
+        Args:
+            max_tokens (int): Maximum number of tokens allowed in the response
+            messages (List[Dict]): List of message dictionaries in Claude's format
+            temperature (float, optional): Controls randomness in responses. Defaults to 0.0.
+            timeout (float, optional): Timeout for API call in seconds. Defaults to None.
+            system (str | List[Dict], optional): System prompt as text or text blocks.
+
+        Returns:
+            str: Claude's response text
+
+        Raises:
+            Exception: If messages are malformed or the API call fails
+        """
+        response = await self.create_pdf_message(
+            max_tokens,
+            messages,
+            temperature=temperature,
+            timeout=timeout,
+            system=system,
+        )
+        return response.content[0].text
+
+    async def create_pdf_message(
+        self,
+        max_tokens: int,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.0,
+        timeout: Optional[float] = None,
+        system: Optional[Union[str, List[Dict[str, Any]]]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[Dict[str, Any]] = None,
+    ) -> Message:
+        """Same as call_claude_pdf_with_messages but returns the full Message."""
+        try:
+            _validate_messages(messages)
+
+            params: Dict[str, Any] = {
+                "model": self.model_name,
+                "max_tokens": max_tokens,
+                "messages": messages,
+                "temperature": temperature,
+                "timeout": timeout,
+            }
+            if system is not None:
+                params["system"] = system
+            if tools is not None:
+                params["tools"] = tools
+            if tool_choice is not None:
+                params["tool_choice"] = tool_choice
+            return await self._create_message(**params)
+
+        except AnthropicTokenBudgetError:
+            raise
+        except Exception as e:
+            raise AnthropicError(f"PDF processing failed: {str(e)}", original_error=e)
+
+    async def call_claude_pdf_basic(
+        self,
+        max_tokens: int,
+        input_string: str,
+        pdf_path: str,
+        temperature: float = 0.0,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Makes a basic call to Claude's API with a single user message and PDF.
+
+        Args:
+            max_tokens (int): Maximum number of tokens allowed in the response
+            input_string (str): The user message/prompt to send to Claude
+            pdf_path (str): Path to the PDF file to analyze
+            temperature (float, optional): Controls randomness in responses. Defaults to 0.0.
+            timeout (float, optional): Timeout for API call in seconds. Defaults to None.
+
+        Returns:
+            str: Claude's response text
+
+        PDFs too large for one document block are split into page ranges and
+        answered with call_claude_pdf_map_reduce when pypdf is installed.
+        """
+        if not input_string.strip():
+            raise ValueError("Input string cannot be empty")
+
+        try:
+            payload = await asyncio.to_thread(default_pdf_registry.get, pdf_path)
+
+            messages = [
+                {
+                    "role": "user",
+                    "content": [
+                        _text_block(input_string),
+                        payload.document_block(),
+                    ],
+                }
+            ]
+
+            response = await self._create_message(
+                model=self.model_name,
+                max_tokens=max_tokens,
+                messages=messages,
+                temperature=temperature,
+                timeout=timeout,
+            )
+            return response.content[0].text
+
+        except AnthropicTokenBudgetError:
+            if not pdf_split.can_split_pdfs():
+                raise
+            return await self.call_claude_pdf_map_reduce(
+                max_tokens, input_string, pdf_path, temperature=temperature
+            )
+        except Exception as e:
+            raise AnthropicError(f"PDF processing failed: {str(e)}", original_error=e)
+
+    async def call_claude_pdf_map_reduce(
+        self,
+        max_tokens: int,
+        input_string: str,
+        pdf_path: str,
+        temperature: float = 0.0,
+        reduce_prompt: Optional[str] = None,
+        pages_per_chunk: Optional[int] = None,
+        concurrency: int = 8,
+    ) -> str:
+        """Answers a prompt about a PDF of any length by map-reduce over page ranges.
+
+        The PDF is split into the fewest evenly sized chunks that fit the
+        request limits, the prompt runs on all chunks concurrently, and one
+        text-only call merges the partial answers. Wall-clock time is about
+        one chunk call plus the merge, whatever the length of the document.
+
+        Args:
+            max_tokens (int): Maximum tokens for each chunk answer and the merge
+            input_string (str): The prompt to answer about the whole PDF
+            pdf_path (str): Path to the PDF file
+            temperature (float, optional): Sampling temperature. Defaults to 0.0.
+            reduce_prompt (str, optional): Instructions for merging the partial
+                answers. Defaults to pdf_split.DEFAULT_REDUCE_PROMPT.
+            pages_per_chunk (int, optional): Page limit per chunk; smaller chunks
+                mean more parallel calls. Defaults to the most that fit.
+            concurrency (int, optional): Chunk calls in flight at once. Defaults to 8.
+
+        Returns:
+            str: The merged answer
+        """
+        if not input_string.strip():
+            raise ValueError("Input string cannot be empty")
+
+        chunks = await asyncio.to_thread(
+            pdf_split.split_pdf,
+            pdf_path,
+            pages_per_chunk
+            or pdf_split.chunk_page_limit(
+                max_tokens, estimate_text_tokens(input_string)
+            ),
+        )
+        results = await self.call_claude_many(
+            pdf_split.map_requests(chunks, input_string, max_tokens, temperature),
+            concurrency=concurrency,
+        )
+        failed = [result for result in results if not result.ok]
+        if failed:
+            raise AnthropicError(
+                f"{len(failed)} of {len(chunks)} PDF chunks failed: "
+                f"{str(failed[0].error)}",
+                original_error=failed[0].error,
+            )
+        partials = [result.text for result in results]
+        if len(partials) == 1:
+            return partials[0]
+
+        try:
+            response = await self._create_message(
+                model=self.model_name,
+                max_tokens=max_tokens,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            _text_block(
+                                pdf_split.reduce_input(
+                                    input_string, chunks, partials, reduce_prompt
+                                )
+                            )
+                        ],
+                    }
+                ],
+                temperature=temperature,
+            )
+            return response.content[0].text
+        except AnthropicTokenBudgetError:
+            raise
+        except Exception as e:
+            raise AnthropicError(
+                f"Merging PDF chunk answers failed: {str(e)}", original_error=e
+            )
@@ -1,29 +1,141 @@
+import json
 import logging
 import os
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
 from pathlib import Path
+from dhg.services.anthropic_service import _text_block
 from dhg.services.pdf_anthropic import PdfAnthropic
-from dhg.services.anthropic_service import AnthropicService
-from dhg.services.prompts.paper_analysis_prompts import PAPER_ANALYSIS_PROMPT
+from dhg.services.pdf_text import PdfTextExtractor, default_text_extractor
+from dhg.services.analysis_store import AnalysisKey, AnalysisStore, analysis_store
+from dhg.services.pipeline import (
+    CheckpointStore,
+    FileCheckpointStore,
+    PipelineExecutor,
+    PipelineNode,
+)
+from dhg.services.prompt_fusion import FusedPrompt
+from dhg.services.structured_output import StructuredTool
+from dhg.core.exceptions import PipelineError
+from dhg.services.prompts.paper_analysis_prompts import (
+    IMPROVEMENT_SUGGESTIONS_SCHEMA,
+    PAPER_ANALYSIS_PROMPT,
+    PAPER_ANALYSIS_SCHEMA,
+    SOURCE_QUERY_PROMPT,
+    SOURCE_QUERY_SCHEMA,
+    STRENGTH_WEAKNESS_PROMPT,
+    STRENGTH_WEAKNESS_SCHEMA,
+)
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Claude answers each step by calling one of these tools, so its answer is
+# always schema-checked JSON rather than text to be parsed
+PAPER_ANALYSIS_TOOL = StructuredTool(
+    "report_paper_analysis",
+    "Report the analysis of the paper.",
+    PAPER_ANALYSIS_SCHEMA,
+)
+STRENGTH_WEAKNESS_TOOL = StructuredTool(
+    "report_strengths_and_weaknesses",
+    "Report the strengths and weaknesses of the paper.",
+    STRENGTH_WEAKNESS_SCHEMA,
+)
+IMPROVEMENT_SUGGESTIONS_TOOL = StructuredTool(
+    "report_improvement_suggestions",
+    "Report suggestions for improving the paper.",
+    IMPROVEMENT_SUGGESTIONS_SCHEMA,
+)
+
+# Document prompts answered together by analyze_fused, in one request
+PAPER_PROMPT_FUSION = (
+    FusedPrompt("paper_analysis", PAPER_ANALYSIS_PROMPT, PAPER_ANALYSIS_SCHEMA),
+    FusedPrompt("strengths_and_weaknesses", STRENGTH_WEAKNESS_PROMPT),
+    FusedPrompt("source", SOURCE_QUERY_PROMPT, SOURCE_QUERY_SCHEMA),
+)
+
 
 class PaperAnalysisService:
-    def __init__(self, pdf_processor: PdfAnthropic):
-        """Initialize the service with a PDF processor."""
+    def __init__(
+        self,
+        pdf_processor: PdfAnthropic,
+        text_extractor: Optional[PdfTextExtractor] = None,
+        result_store: Optional[AnalysisStore] = None,
+    ):
+        """Initialize the service with a PDF processor.
+
+        Args:
+            pdf_processor: Processor for the paper being analyzed
+            text_extractor: Local text extraction for text-only prompts
+                (defaults to the shared process-pool extractor)
+            result_store: Results of earlier runs, keyed by PDF hash, prompt
+                hash and model (defaults to analysis_store(), a SQLite file at
+                ANALYSIS_STORE_DB, opened on first use)
+        """
         self.pdf_processor = pdf_processor
+        self.text_extractor = (
+            text_extractor if text_extractor is not None else default_text_extractor
+        )
+        self._result_store = result_store
         logger.info("PaperAnalysisService initialized")
 
+    @property
+    def result_store(self) -> AnalysisStore:
+        if self._result_store is None:
+            self._result_store = analysis_store()
+        return self._result_store
+
+    def _result_key(self, prompt: str, schema: Dict[str, Any]) -> AnalysisKey:
+        # The schema shapes the answer as much as the prompt does. Keyed by
+        # the schema rather than the tool, an answer is shared between a
+        # standalone request and a fused one.
+        return AnalysisKey.for_prompt(
+            self.pdf_processor.pdf_sha256,
+            prompt,
+            self.pdf_processor.anthropic_service.model_name,
+            system=json.dumps(schema, sort_keys=True),
+        )
+
+    def _stored_result(
+        self,
+        step: str,
+        prompt: str,
+        schema: Dict[str, Any],
+        compute: Callable[[], Any],
+    ) -> Any:
+        """Return the stored result of prompt for this paper, computing it on a miss.
+
+        Only validated results are stored, so a failed step is retried on
+        the next run.
+        """
+        key = self._result_key(prompt, schema)
+        result = self.result_store.get(key)
+        if result is not None:
+            logger.info(f"Using stored result for {step}")
+            return result
+        result = compute()
+        self.result_store.put(key, result, step=step)
+        return result
+
+    @staticmethod
+    def _text_messages(prompt: str) -> List[Dict[str, Any]]:
+        return [{"role": "user", "content": [_text_block(prompt)]}]
+
+    def _ask_without_document(self, prompt: str, tool: StructuredTool) -> Any:
+        """Structured call carrying only prompt, not the PDF.
+
+        Follow-up steps only need what earlier steps produced, so sending
+        them without the document saves its upload and input tokens.
+        """
+        return self.pdf_processor.anthropic_service.call_claude_structured(
+            max_tokens=4096, messages=self._text_messages(prompt), tool=tool
+        )
+
     def _extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract text content from PDF file."""
+        """Extract text content from PDF file, with [Page n] markers."""
         logger.info(f"Extracting text from PDF: {pdf_path}")
-        # You'll need to implement PDF text extraction here
-        # Consider using libraries like PyPDF2 or pdfplumber
-        # For now, returning mock text
-        return "Sample paper text..."
+        return self.text_extractor.extract(pdf_path).text
 
     def _create_analysis_prompt(self, paper_text: str) -> str:
         """Create the prompt for paper analysis."""
@@ -48,32 +160,75 @@ Please provide your analysis in the following JSON format:
 }}
 """
 
-    def extract_strengths_and_weaknesses(self) -> Dict:
-        """Extract strengths and weaknesses from the paper using Claude."""
+    def extract_strengths_and_weaknesses(self, text_only: bool = False) -> Dict:
+        """Extract strengths and weaknesses from the paper using Claude.
+
+        Args:
+            text_only: Send locally extracted text instead of the PDF. Much
+                cheaper, but Claude does not see figures or tables as images.
+        """
         logger.info("Extracting strengths and weaknesses")
 
-        try:
-            responses = self.pdf_processor.process_pdf(
-                custom_prompts=[PAPER_ANALYSIS_PROMPT]
+        if text_only:
+            # The template, not the filled-in text, identifies the prompt
+            prompt = self._create_analysis_prompt("{paper_text}")
+        else:
+            prompt = PAPER_ANALYSIS_PROMPT
+
+        def compute() -> Dict:
+            if text_only:
+                paper_text = self._extract_text_from_pdf(self.pdf_processor.pdf_path)
+                return self._ask_without_document(
+                    self._create_analysis_prompt(paper_text), STRENGTH_WEAKNESS_TOOL
+                )
+            return self.pdf_processor.extract_structured(
+                PAPER_ANALYSIS_PROMPT, PAPER_ANALYSIS_TOOL
             )
 
-            try:
-                analysis = eval(responses[0])  # Convert string to dict
-                return analysis
-            except Exception as e:
-                logger.error(f"Error parsing Claude response: {str(e)}")
-                raise
-
+        tool = STRENGTH_WEAKNESS_TOOL if text_only else PAPER_ANALYSIS_TOOL
+        try:
+            return self._stored_result(
+                "strengths_and_weaknesses", prompt, tool.input_schema, compute
+            )
         except Exception as e:
             logger.error(f"Error in extract_strengths_and_weaknesses: {str(e)}")
             raise
 
-    def generate_improvement_suggestions(self, analysis: Dict) -> List:
-        """Generate improvement suggestions based on analysis using Claude."""
-        logger.info("Generating improvement suggestions")
-
-        try:
-            prompt = f"""Based on the following analysis of a research paper, generate specific improvement suggestions.
+    def analyze_fused(
+        self, prompts: Sequence[FusedPrompt] = PAPER_PROMPT_FUSION
+    ) -> Dict[str, Any]:
+        """Answer several document prompts with one request carrying the PDF.
+
+        Answers already in the result store are reused, and only the other
+        prompts are fused into the request. Each answer is stored under the
+        same key a standalone request for its prompt and schema would use.
+
+        Returns:
+            Each prompt's answer, by prompt name
+        """
+        logger.info(f"Running fused prompts: {[p.name for p in prompts]}")
+        results: Dict[str, Any] = {}
+        missing = []
+        for fused in prompts:
+            stored = self.result_store.get(self._result_key(fused.prompt, fused.schema))
+            if stored is not None:
+                results[fused.name] = stored
+            else:
+                missing.append(fused)
+
+        if missing:
+            answers = self.pdf_processor.process_fused(missing)
+            for fused in missing:
+                self.result_store.put(
+                    self._result_key(fused.prompt, fused.schema),
+                    answers[fused.name],
+                    step=fused.name,
+                )
+                results[fused.name] = answers[fused.name]
+        return {fused.name: results[fused.name] for fused in prompts}
+
+    def _suggestions_prompt(self, analysis: Dict) -> str:
+        return f"""Based on the following analysis of a research paper, generate specific improvement suggestions.
             
 Analysis:
 Strengths:
@@ -84,19 +239,59 @@ Weaknesses:
 
 Provide suggestions in JSON format as a list of objects with 'recommendation' and 'rationale' fields."""
 
-            responses = self.pdf_processor.process_pdf(custom_prompts=[prompt])
+    def generate_improvement_suggestions(self, analysis: Dict) -> List:
+        """Generate improvement suggestions based on analysis using Claude."""
+        logger.info("Generating improvement suggestions")
 
-            try:
-                suggestions = eval(responses[0])
-                return suggestions
-            except Exception as e:
-                logger.error(f"Error parsing suggestions response: {str(e)}")
-                raise
+        try:
+            prompt = self._suggestions_prompt(analysis)
+
+            def compute() -> List:
+                # The analysis is all this step needs; the PDF is not resent
+                answer = self._ask_without_document(
+                    prompt, IMPROVEMENT_SUGGESTIONS_TOOL
+                )
+                return answer["suggestions"]
+
+            return self._stored_result(
+                "improvement_suggestions",
+                prompt,
+                IMPROVEMENT_SUGGESTIONS_SCHEMA,
+                compute,
+            )
 
         except Exception as e:
             logger.error(f"Error generating suggestions: {str(e)}")
             raise
 
+    def iter_improvement_suggestions(self, analysis: Dict) -> Iterator[Dict]:
+        """Yield improvement suggestions one by one as Claude generates them.
+
+        Each suggestion is schema-checked as soon as it is complete, so work
+        on the first ones can start while the rest are still generating. The
+        full list is stored once the answer is complete.
+        """
+        prompt = self._suggestions_prompt(analysis)
+        key = self._result_key(prompt, IMPROVEMENT_SUGGESTIONS_SCHEMA)
+        stored = self.result_store.get(key)
+        if stored is not None:
+            yield from stored
+            return
+
+        chunks = self.pdf_processor.anthropic_service.stream_claude_tool_input(
+            max_tokens=4096,
+            messages=self._text_messages(prompt),
+            tool=IMPROVEMENT_SUGGESTIONS_TOOL,
+            temperature=0.0,
+        )
+        for path, value in IMPROVEMENT_SUGGESTIONS_TOOL.iter_fields(chunks):
+            if len(path) == 2 and path[0] == "suggestions":
+                yield value
+            elif path == ():
+                self.result_store.put(
+                    key, value["suggestions"], step="improvement_suggestions"
+                )
+
     def rewrite_paper_with_improvements(self, pdf_path: str, suggestions: List) -> str:
         """Rewrite paper content with suggested improvements."""
         logger.info(f"Rewriting paper with improvements from: {pdf_path}")
@@ -167,21 +362,77 @@ Provide suggestions in JSON format as a list of objects with 'recommendation' an
             logger.error(f"Error saving outputs: {str(e)}")
             return False
 
-    def analyze_paper(self, output_dir: str) -> Dict:
-        """Run the complete paper analysis pipeline."""
+    def analysis_pipeline(self, text_only: bool = False) -> List[PipelineNode]:
+        """The steps of analyze_paper as a dependency graph.
+
+        Only the analysis sends the document; later steps are text-only calls
+        carrying what the steps before them produced. The rewrite and the
+        rationale both only need the suggestions, so they run concurrently
+        once the suggestions are in.
+        """
+        return [
+            PipelineNode(
+                "analysis",
+                lambda: self.extract_strengths_and_weaknesses(text_only=text_only),
+            ),
+            PipelineNode(
+                "suggestions",
+                self.generate_improvement_suggestions,
+                depends_on=("analysis",),
+            ),
+            PipelineNode(
+                "rewritten_content",
+                lambda suggestions: self.rewrite_paper_with_improvements(
+                    self.pdf_processor.pdf_path, suggestions
+                ),
+                depends_on=("suggestions",),
+            ),
+            PipelineNode(
+                "rationale",
+                self.generate_improvement_rationale,
+                depends_on=("suggestions",),
+            ),
+        ]
+
+    def analyze_paper(
+        self,
+        output_dir: str,
+        text_only: bool = False,
+        checkpoints: Optional[CheckpointStore] = None,
+    ) -> Dict:
+        """Run the complete paper analysis pipeline.
+
+        Each step's output is checkpointed as soon as it completes, so after
+        a failure the next call resumes from the failed step instead of
+        paying for the whole paper again.
+
+        Args:
+            output_dir: Where the Markdown outputs are written
+            text_only: Analyze locally extracted text instead of the PDF
+            checkpoints: Where step outputs are kept (defaults to JSON files
+                under output_dir/.checkpoints)
+        """
         logger.info("Starting paper analysis")
 
+        if checkpoints is None:
+            checkpoints = FileCheckpointStore(str(Path(output_dir) / ".checkpoints"))
+        mode = "text" if text_only else "pdf"
+        run_id = (
+            f"{self.pdf_processor.pdf_sha256}-"
+            f"{self.pdf_processor.anthropic_service.model_name}-{mode}"
+        )
+
         try:
-            # Remove PDF processor initialization since it's now in constructor
-            analysis = self.extract_strengths_and_weaknesses()
-            suggestions = self.generate_improvement_suggestions(analysis)
-            rewritten_content = self.rewrite_paper_with_improvements(
-                self.pdf_processor.pdf_path, suggestions
-            )
-            rationale = self.generate_improvement_rationale(suggestions)
+            outputs = PipelineExecutor(
+                self.analysis_pipeline(text_only), checkpoints=checkpoints
+            ).run(run_id)
 
             if self.save_analysis_outputs(
-                output_dir, analysis, suggestions, rewritten_content, rationale
+                output_dir,
+                outputs["analysis"],
+                outputs["suggestions"],
+                outputs["rewritten_content"],
+                outputs["rationale"],
             ):
                 return {
                     "analysis": str(Path(output_dir) / "analysis.md"),
@@ -192,18 +443,27 @@ Provide suggestions in JSON format as a list of objects with 'recommendation' an
 
             return {}  # Return empty dict instead of None
 
+        except PipelineError as e:
+            # Completed steps stay checkpointed for the next call
+            logger.error(f"Error in analyze_paper at step {e.node}: {str(e)}")
+            return {}
         except Exception as e:
             logger.error(f"Error in analyze_paper: {str(e)}")
             return {}  # Return empty dict instead of None
 
 
-def test_source_query():
-    pdf_path = "backend/tests/test_files/pdfs/long_covid_frontiers_2024_v1.pdf"
-    anthropic_service = AnthropicService()
-    pdf_processor = PdfAnthropic(anthropic_service, pdf_path)
-    paper_analysis = PaperAnalysisService(pdf_processor)
-    paper_analysis.analyze_paper("backend/tests/test_files/output")
+def test_source_query(sources: Optional[List[str]] = None, workers: int = 4):
+    """Analyze sources (directories, globs, PDFs or supabase://bucket/prefix)."""
+    from dhg.services.paper_corpus import analyze_many
+
+    analyze_many(
+        sources or ["backend/tests/test_files/pdfs/long_covid_frontiers_2024_v1.pdf"],
+        "backend/tests/test_files/output",
+        workers=workers,
+    )
 
 
 if __name__ == "__main__":
-    test_source_query()
+    import sys
+
+    test_source_query(sys.argv[1:])
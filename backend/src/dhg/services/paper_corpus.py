@@ -0,0 +1,404 @@
+"""Run PaperAnalysisService over a whole corpus of papers.
+
+analyze_many takes local directories, glob patterns, single files and
+Supabase storage prefixes (supabase://bucket/prefix), and analyzes the
+papers on a pool of workers that share one AnthropicService, so they also
+share its rate limiter and metrics. Only as many papers as there are workers
+are in flight at once: storage objects are downloaded by the worker that
+analyzes them and deleted afterwards, and encoded PDFs live in a bounded
+registry.
+
+Progress (papers/min, tokens/min, ETA) is logged after every paper and kept
+in a JSON run manifest next to the outputs, with papers finished since the
+last full write journaled to manifest.jsonl. Re-running over the same
+output_dir skips papers the manifest records as done, and papers that
+failed resume from their last checkpointed step.
+
+Example:
+    manifest = analyze_many(
+        ["papers/", "more/*.pdf", "supabase://papers/2024/"],
+        output_dir="analysis",
+        workers=8,
+    )
+"""
+
+import contextvars
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from dhg.services.analysis_store import AnalysisStore
+from dhg.services.anthropic_metrics import CallRecord, MetricsExporter
+from dhg.services.anthropic_service import AnthropicService
+from dhg.services.paper_analysis_service import PaperAnalysisService
+from dhg.services.pdf_anthropic import PdfAnthropic
+from dhg.services.pdf_payload import PdfPayloadRegistry
+
+logger = logging.getLogger(__name__)
+
+STORAGE_SCHEME = "supabase://"
+MANIFEST_NAME = "manifest.json"
+# Objects requested per storage list call
+STORAGE_PAGE_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class PaperSource:
+    """One paper: a local file, or an object in a Supabase storage bucket."""
+
+    uri: str
+    path: Optional[str] = None
+    bucket: Optional[str] = None
+    object_path: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path or self.object_path or self.uri)
+
+
+def _storage_pdfs(client: Any, bucket: str, prefix: str) -> List[str]:
+    """Object paths of every PDF under prefix, descending into folders."""
+    found = []
+    folders = [prefix.strip("/")]
+    while folders:
+        folder = folders.pop()
+        offset = 0
+        while True:
+            entries = client.storage.from_(bucket).list(
+                folder, {"limit": STORAGE_PAGE_SIZE, "offset": offset}
+            )
+            for entry in entries or []:
+                path = f"{folder}/{entry['name']}" if folder else entry["name"]
+                # Folders are listed without an id
+                if entry.get("id") is None:
+                    folders.append(path)
+                elif path.lower().endswith(".pdf"):
+                    found.append(path)
+            if not entries or len(entries) < STORAGE_PAGE_SIZE:
+                break
+            offset += len(entries)
+    return sorted(found)
+
+
+def resolve_sources(
+    sources: Sequence[str], storage_client: Optional[Any] = None
+) -> List[PaperSource]:
+    """Expand directories, globs and storage prefixes into individual papers.
+
+    Args:
+        sources: Directories (searched recursively for *.pdf), glob patterns,
+            PDF paths, or supabase://bucket/prefix
+        storage_client: Supabase client for storage prefixes (defaults to
+            get_supabase() when one is needed)
+
+    Returns:
+        Papers in source order, without duplicates
+    """
+    papers: Dict[str, PaperSource] = {}
+    for source in sources:
+        if source.startswith(STORAGE_SCHEME):
+            bucket, _, prefix = source[len(STORAGE_SCHEME) :].partition("/")
+            if storage_client is None:
+                from dhg.core.supabase_client import get_supabase
+
+                storage_client = get_supabase()
+            for object_path in _storage_pdfs(storage_client, bucket, prefix):
+                uri = f"{STORAGE_SCHEME}{bucket}/{object_path}"
+                papers.setdefault(
+                    uri, PaperSource(uri, bucket=bucket, object_path=object_path)
+                )
+            continue
+
+        if os.path.isdir(source):
+            paths = glob.glob(os.path.join(source, "**", "*.pdf"), recursive=True)
+        elif glob.has_magic(source):
+            paths = glob.glob(source, recursive=True)
+        else:
+            paths = [source]
+        for path in sorted(paths):
+            uri = os.path.abspath(path)
+            papers.setdefault(uri, PaperSource(uri, path=path))
+    return list(papers.values())
+
+
+# Progress of the corpus run the current context is analyzing a paper for;
+# workers copy their context, so it reaches every call the paper makes
+_current_run: "contextvars.ContextVar[Optional[CorpusProgress]]" = (
+    contextvars.ContextVar("corpus_run", default=None)
+)
+
+
+class CorpusProgress(MetricsExporter):
+    """Papers and tokens per minute, and the ETA, of a corpus run.
+
+    Registered as a metrics exporter for the duration of the run. The
+    recorder may be shared with unrelated calls and other runs, so only
+    records made while _current_run is this run are counted.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def export(self, record: CallRecord) -> None:
+        if _current_run.get() is not self:
+            return
+        with self._lock:
+            self.input_tokens += record.input_tokens
+            self.output_tokens += record.output_tokens
+
+    def paper_finished(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self.done + self.failed
+            minutes = max(time.monotonic() - self.started, 1e-9) / 60
+            papers_per_min = finished / minutes
+            remaining = self.total - finished
+            return {
+                "total": self.total,
+                "done": self.done,
+                "failed": self.failed,
+                "remaining": remaining,
+                "elapsed_seconds": round(minutes * 60, 1),
+                "papers_per_min": round(papers_per_min, 2),
+                "tokens_per_min": round(
+                    (self.input_tokens + self.output_tokens) / minutes
+                ),
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "eta_seconds": (
+                    round(remaining / papers_per_min * 60) if papers_per_min else None
+                ),
+            }
+
+    def format(self) -> str:
+        s = self.snapshot()
+        eta = "unknown"
+        if s["eta_seconds"] is not None:
+            eta = time.strftime("%H:%M:%S", time.gmtime(s["eta_seconds"]))
+        return (
+            f"{s['done'] + s['failed']}/{s['total']} papers ({s['failed']} failed), "
+            f"{s['papers_per_min']} papers/min, {s['tokens_per_min']:,} tokens/min, "
+            f"ETA {eta}"
+        )
+
+
+class RunManifest:
+    """JSON record of a corpus run: settings, progress and one entry per paper.
+
+    Rewriting the whole manifest after every paper would cost O(papers) each
+    time, so finished papers are appended to a JSONL journal next to it
+    instead. Loading replays the journal over the manifest, and save() folds
+    the journal back into the manifest.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.journal_path = f"{os.path.splitext(path)[0]}.jsonl"
+        self.data: Dict[str, Any] = {"run": {}, "progress": {}, "papers": {}}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Starting a new manifest; {path} unreadable: {e}")
+        self._replay_journal()
+        self._lock = threading.Lock()
+
+    def _replay_journal(self) -> None:
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash mid-append leaves at most one partial last line
+                    logger.warning(f"Skipping partial entry in {self.journal_path}")
+                    continue
+                self.papers[entry["uri"]] = entry["paper"]
+                self.data["progress"] = entry["progress"]
+
+    @property
+    def papers(self) -> Dict[str, Dict[str, Any]]:
+        return self.data["papers"]
+
+    def is_done(self, uri: str) -> bool:
+        return self.papers.get(uri, {}).get("status") == "done"
+
+    def update(self, uri: str, **fields: Any) -> None:
+        with self._lock:
+            self.papers.setdefault(uri, {}).update(fields)
+
+    def append(self, uri: str, progress: Dict[str, Any]) -> None:
+        """Journal the paper's current entry and the run progress."""
+        with self._lock:
+            self.data["progress"] = progress
+            entry = {"uri": uri, "paper": self.papers[uri], "progress": progress}
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def save(self, progress: Optional[Dict[str, Any]] = None) -> None:
+        """Write the whole manifest and clear the journal it now includes."""
+        with self._lock:
+            if progress is not None:
+                self.data["progress"] = progress
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Write then rename, so a crash never leaves a half-written manifest
+            temp = f"{self.path}.tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2, ensure_ascii=False)
+            os.replace(temp, self.path)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+
+
+def _download(client: Any, source: PaperSource, directory: str) -> str:
+    data = client.storage.from_(source.bucket).download(source.object_path)
+    path = os.path.join(directory, source.name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def analyze_many(
+    sources: Sequence[str],
+    output_dir: str,
+    workers: int = 4,
+    anthropic_service: Optional[AnthropicService] = None,
+    text_only: bool = False,
+    result_store: Optional[AnalysisStore] = None,
+    storage_client: Optional[Any] = None,
+    max_payload_bytes: int = 256 * 1024 * 1024,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Analyze every paper in sources with PaperAnalysisService.analyze_paper.
+
+    Each paper's outputs go to output_dir/<name>-<hash prefix>/, and the run
+    manifest to output_dir/manifest.json.
+
+    Args:
+        sources: Directories, globs, PDF paths or supabase://bucket/prefix
+        output_dir: Root directory for per-paper outputs and the manifest
+        workers: Papers analyzed concurrently; also the papers held in memory
+        anthropic_service: Service shared by every worker
+        text_only: Analyze locally extracted text instead of the PDFs
+        result_store: Store of analysis results shared by every paper
+        storage_client: Supabase client for storage sources
+        max_payload_bytes: Cap on the encoded PDFs kept in memory
+        on_progress: Called with the progress snapshot after every paper
+
+    Returns:
+        The run manifest
+    """
+    if workers < 1:
+        raise ValueError("workers must be >= 1")
+    anthropic_service = anthropic_service or AnthropicService()
+    if storage_client is None and any(s.startswith(STORAGE_SCHEME) for s in sources):
+        from dhg.core.supabase_client import get_supabase
+
+        storage_client = get_supabase()
+    papers = resolve_sources(sources, storage_client)
+
+    manifest = RunManifest(str(Path(output_dir) / MANIFEST_NAME))
+    manifest.data["run"] = {
+        "sources": list(sources),
+        "workers": workers,
+        "text_only": text_only,
+        "model": anthropic_service.model_name,
+        "started_at": time.time(),
+    }
+    todo = [paper for paper in papers if not manifest.is_done(paper.uri)]
+    if len(todo) < len(papers):
+        logger.info(f"Skipping {len(papers) - len(todo)} papers already done")
+    for paper in todo:
+        manifest.update(paper.uri, name=paper.name, status="pending")
+
+    progress = CorpusProgress(len(todo))
+    manifest.save(progress.snapshot())
+    registry = PdfPayloadRegistry(max_bytes=max_payload_bytes)
+
+    def analyze(paper: PaperSource) -> Dict[str, Any]:
+        # Runs in a copied context, so this does not leak to the caller
+        _current_run.set(progress)
+        started = time.monotonic()
+        with tempfile.TemporaryDirectory(prefix="paper_corpus_") as scratch:
+            path = paper.path
+            if paper.bucket is not None:
+                path = _download(storage_client, paper, scratch)
+            processor = PdfAnthropic(anthropic_service, path, payload_registry=registry)
+            # Read while the file exists; a downloaded copy is deleted below
+            sha256 = processor.pdf_sha256
+            paper_dir = Path(output_dir) / f"{Path(paper.name).stem}-{sha256[:12]}"
+            service = PaperAnalysisService(processor, result_store=result_store)
+            outputs = service.analyze_paper(str(paper_dir), text_only=text_only)
+            if not outputs:
+                raise RuntimeError(f"Analysis of {paper.name} produced no outputs")
+            return {
+                "pdf_sha256": sha256,
+                "output_dir": str(paper_dir),
+                "outputs": outputs,
+                "seconds": round(time.monotonic() - started, 1),
+            }
+
+    anthropic_service.metrics.add_exporter(progress)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = iter(todo)
+            running: Dict[Future, PaperSource] = {}
+            while True:
+                # Submit lazily so only `workers` papers are ever in flight
+                while len(running) < workers:
+                    paper = next(pending, None)
+                    if paper is None:
+                        break
+                    manifest.update(paper.uri, status="running")
+                    future = executor.submit(
+                        contextvars.copy_context().run, analyze, paper
+                    )
+                    running[future] = paper
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    paper = running.pop(future)
+                    try:
+                        manifest.update(
+                            paper.uri, status="done", error=None, **future.result()
+                        )
+                        progress.paper_finished(True)
+                    except Exception as e:
+                        logger.error(f"Failed to analyze {paper.uri}: {str(e)}")
+                        manifest.update(paper.uri, status="failed", error=str(e))
+                        progress.paper_finished(False)
+                    snapshot = progress.snapshot()
+                    manifest.append(paper.uri, snapshot)
+                    logger.info(progress.format())
+                    if on_progress is not None:
+                        on_progress(snapshot)
+    finally:
+        anthropic_service.metrics.remove_exporter(progress)
+
+    manifest.data["run"]["finished_at"] = time.time()
+    manifest.save(progress.snapshot())
+    return manifest.data
@@ -1,17 +1,49 @@
 import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from anthropic import Anthropic
 from anthropic.types import Message
 import dotenv
-import base64
 import httpx
-from typing import Optional, List, Dict, Union, Tuple, Any
+from typing import Optional, List, Dict, Union, Tuple, Any, Iterator, Sequence
 from anthropic.types.message_create_params import MessageCreateParamsNonStreaming
 from anthropic.types.messages.batch_create_params import Request
 from datetime import datetime
 import asyncio
 import time
-
-from dhg.services.anthropic_service import AnthropicService
+import logging
+
+from dhg.services.anthropic_service import (
+    AnthropicService,
+    _text_block,
+    usage_to_dict,
+)
+from dhg.services.anthropic_batches import BatchJobManager, BatchJobStore
+from dhg.services.anthropic_batch_results import BatchResultStreamer, ResultSink
+from dhg.services.pdf_context import ContextPolicy, FullHistory
+from dhg.services.analysis_store import AnalysisKey, AnalysisStore
+from dhg.services.structured_output import JsonPath, StructuredTool
+from dhg.services.prompt_fusion import (
+    FusedPrompt,
+    fused_prompt,
+    fused_tool,
+    split_answer,
+)
+from dhg.services.pdf_payload import (
+    PdfPayload,
+    PdfPayloadRegistry,
+    default_pdf_registry,
+)
+
+# Breakpoint marker for Anthropic prompt caching; everything up to and including
+# the marked block is cached and reused by later requests with the same prefix.
+CACHE_CONTROL = {"type": "ephemeral"}
+
+logger = logging.getLogger(__name__)
+
+# How process_pdf treats its prompts: as turns of one conversation, or as
+# unrelated questions about the same document
+PROCESS_MODES = ("chained", "independent")
 
 
 class PdfProcessingError(Exception):
@@ -20,76 +52,439 @@ class PdfProcessingError(Exception):
     pass
 
 
+def pdf_document_message(
+    payload: PdfPayload, prompt: str, use_prompt_cache: bool = False
+) -> Dict[str, Any]:
+    """Build the user message carrying a PDF and a prompt.
+
+    With prompt caching the document goes first and carries the breakpoint,
+    so every request about this PDF shares the same cacheable prefix.
+    """
+    document = payload.document_block()
+    if not use_prompt_cache:
+        return {"role": "user", "content": [_text_block(prompt), document]}
+    document["cache_control"] = CACHE_CONTROL
+    return {"role": "user", "content": [document, _text_block(prompt)]}
+
+
+def batch_custom_id(pdf_sha256: str, prompt_index: int) -> str:
+    """Deterministic custom_id for a (paper, prompt) request in a batch.
+
+    Derived from the document's content hash, so resubmitting the same paper
+    yields the same ids and results can be routed back without extra state.
+    Fits the API's ``^[a-zA-Z0-9_-]{1,64}$`` format.
+    """
+    return f"pdf_{pdf_sha256[:40]}_{prompt_index}"
+
+
+def batch_result_dict(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a stored batch result into the dict returned by get_batch_results."""
+    if row["result_type"] == "succeeded":
+        return {
+            "prompt_id": row["custom_id"],
+            "status": "success",
+            "result": row["result"],
+        }
+    return {
+        "prompt_id": row["custom_id"],
+        "status": row["result_type"],
+        "error": row["result"],
+    }
+
+
 class PdfAnthropic:
-    def __init__(self, anthropic_service: "AnthropicService", pdf_path: str):
+    def __init__(
+        self,
+        anthropic_service: "AnthropicService",
+        pdf_path: str,
+        use_prompt_cache: bool = False,
+        payload_registry: Optional[PdfPayloadRegistry] = None,
+        batch_store: Optional[BatchJobStore] = None,
+        result_store: Optional[AnalysisStore] = None,
+    ):
+        """
+        Args:
+            anthropic_service: Service used to talk to Claude
+            pdf_path: Path to the PDF to process
+            use_prompt_cache: Mark the document block and system prompt with
+                cache_control breakpoints so later turns reuse the cached prefix
+            payload_registry: Where encoded PDFs are shared (defaults to the
+                process-wide default_pdf_registry)
+            batch_store: Where batch ids and results are persisted (defaults
+                to BatchJobStore() at ANTHROPIC_BATCH_DB, opened on first use)
+            result_store: Where independent-mode responses are kept by (PDF hash,
+                prompt hash, model); prompts already answered are not re-run
+        """
         self.anthropic_service = anthropic_service
         if not os.path.exists(pdf_path):
             raise PdfProcessingError("PDF file not found")
         self.pdf_path = pdf_path
+        self.use_prompt_cache = use_prompt_cache
+        self.payload_registry = (
+            payload_registry if payload_registry is not None else default_pdf_registry
+        )
+        # Token usage (including cache reads/writes) of each turn of the last chain
+        self.turn_usage: List[Dict[str, int]] = []
+        self._batch_store = batch_store
+        self.result_store = result_store
+        self._batch_manager: Optional[BatchJobManager] = None
+        # Completed turns of a chain that failed part-way, kept for resuming
+        self._chain_progress: Optional[Dict[str, Any]] = None
+
+        # The file is only read and encoded when a request is built, so idle
+        # instances cost nothing beyond the path
+        self.pdf_size = os.path.getsize(pdf_path)
+
+    @property
+    def payload(self) -> PdfPayload:
+        """The encoded PDF, from the shared registry.
+
+        Not kept on the instance; the registry decides how long it stays
+        resident, and the same bytes under another path reuse the entry.
+        """
+        return self.payload_registry.get(self.pdf_path)
 
-        # Read and encode PDF once during initialization
-        with open(pdf_path, "rb") as f:
-            pdf_content = f.read()
-            self.pdf_base64 = base64.b64encode(pdf_content).decode()
+    @property
+    def pdf_base64(self) -> str:
+        """The PDF encoded for a document block."""
+        return self.payload.base64
 
-    def process_pdf(self, custom_prompts: Optional[List[str]] = None) -> List[str]:
+    @property
+    def pdf_sha256(self) -> str:
+        """SHA-256 of the PDF bytes, usable as a cache key for derived results.
+
+        Hashed from the file without encoding it, so checking stored results
+        never loads the payload.
+        """
+        return self.payload_registry.sha256_for(self.pdf_path)
+
+    def _document_message(
+        self, prompt: str, payload: Optional[PdfPayload] = None
+    ) -> Dict[str, Any]:
+        """Build the user message carrying the PDF and the first prompt."""
+        return pdf_document_message(
+            payload or self.payload, prompt, self.use_prompt_cache
+        )
+
+    def _system_param(
+        self, system_string: Optional[str]
+    ) -> Optional[Union[str, List[Dict[str, Any]]]]:
+        """Return the system prompt, as a cached text block when caching is on."""
+        if system_string is None or not self.use_prompt_cache:
+            return system_string
+        return [{**_text_block(system_string), "cache_control": CACHE_CONTROL}]
+
+    @staticmethod
+    def _mark_conversation_tail(messages: List[Dict[str, Any]]) -> None:
+        """Move the rolling cache breakpoint to the newest user turn.
+
+        Keeps at most one conversation breakpoint (plus document and system),
+        well under the API's limit of four.
+        """
+        for message in messages[1:]:
+            for block in message["content"]:
+                block.pop("cache_control", None)
+        if len(messages) > 1:
+            messages[-1]["content"][-1]["cache_control"] = CACHE_CONTROL
+
+    def process_pdf(
+        self,
+        custom_prompts: Optional[List[str]] = None,
+        system_string: Optional[str] = None,
+        resume: bool = True,
+        mode: str = "chained",
+        concurrency: int = 8,
+        context_policy: Optional[ContextPolicy] = None,
+    ) -> List[str]:
         """
         Process a PDF file with a series of prompts
 
         Args:
             custom_prompts: List of prompts to use. Cannot be None.
+            system_string: Optional system prompt shared by every turn
+            resume: If an earlier call with the same prompts failed part-way,
+                continue from the failed turn instead of starting over
+            mode: "chained" runs the prompts as one conversation, each turn
+                seeing the earlier answers. "independent" sends each prompt
+                with the document as its own request, all concurrently, so
+                the call takes about as long as the slowest prompt.
+            concurrency: Requests in flight at once in independent mode
+            context_policy: Which earlier turns each chained prompt sees
+                (see pdf_context); defaults to FullHistory, every turn. A
+                bounded policy keeps long chains linear in cost.
 
         Returns:
-            List of responses from Claude
+            List of responses from Claude, in prompt order. Per-turn token
+            usage, including cache_creation_input_tokens and
+            cache_read_input_tokens, is left in self.turn_usage.
+
+        Raises:
+            PdfProcessingError: If a turn fails after the service's retries;
+                completed turns are kept for the next call to resume from
         """
         if custom_prompts is None:
             raise PdfProcessingError("custom_prompts cannot be None")
+        if mode not in PROCESS_MODES:
+            raise PdfProcessingError(
+                f"Unknown mode {mode!r}; expected one of {PROCESS_MODES}"
+            )
 
-        responses = []
-        messages = []
-
-        # Initial message with PDF
-        messages.append(
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": custom_prompts[0]},
-                    {
-                        "type": "document",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "application/pdf",
-                            "data": self.pdf_base64,
-                        },
-                    },
-                ],
+        progress = self._chain_progress
+        if (
+            resume
+            and progress is not None
+            and progress["prompts"] == list(custom_prompts)
+            and progress["system"] == system_string
+            and progress["mode"] == mode
+            and progress["policy"] is context_policy
+        ):
+            responses = progress["responses"]
+            self.turn_usage = progress["usage"]
+            logger.info(f"Resuming {mode} prompts from an interrupted call")
+        else:
+            if mode == "independent":
+                responses = [None] * len(custom_prompts)
+                self.turn_usage = [None] * len(custom_prompts)
+            else:
+                responses = []
+                self.turn_usage = []
+            if context_policy is not None:
+                context_policy.reset()
+            self._chain_progress = {
+                "prompts": list(custom_prompts),
+                "system": system_string,
+                "mode": mode,
+                "policy": context_policy,
+                "responses": responses,
+                "usage": self.turn_usage,
             }
-        )
 
-        # Process each prompt in sequence
-        for i, prompt in enumerate(custom_prompts):
-            if i > 0:  # Skip first prompt as it's already added
-                messages.append(
-                    {
-                        "role": "assistant",
-                        "content": [{"type": "text", "text": responses[-1]}],
-                    }
-                )
-                messages.append(
-                    {"role": "user", "content": [{"type": "text", "text": prompt}]}
+        if mode == "independent":
+            self._process_independent(
+                custom_prompts, system_string, responses, concurrency
+            )
+            self._chain_progress = None
+            return responses
+
+        system = self._system_param(system_string)
+        policy = context_policy if context_policy is not None else FullHistory()
+        for i in range(len(responses), len(custom_prompts)):
+            try:
+                messages = self._chain_messages(i, custom_prompts, responses, policy)
+            except Exception as e:
+                raise PdfProcessingError(
+                    f"Building context for turn {i + 1} failed: {str(e)}"
+                ) from e
+
+            try:
+                message = self.anthropic_service.create_pdf_message(
+                    max_tokens=4096, messages=messages, temperature=0.0, system=system
                 )
+            except Exception as e:
+                raise PdfProcessingError(
+                    f"Turn {i + 1} of {len(custom_prompts)} failed: {str(e)}"
+                ) from e
+            responses.append(message.content[0].text)
+            self.turn_usage.append(usage_to_dict(message))
+
+        self._chain_progress = None
+        return responses
 
-            response = self.anthropic_service.call_claude_pdf_with_messages(
-                max_tokens=4096, messages=messages, temperature=0.0
+    def _chain_messages(
+        self,
+        index: int,
+        prompts: List[str],
+        responses: List[str],
+        policy: ContextPolicy,
+    ) -> List[Dict[str, Any]]:
+        """Messages for turn index: document, the turns the policy keeps, prompt."""
+        preamble, turns = policy.context(
+            index, prompts, responses, self.anthropic_service
+        )
+        asked = [*turns, index]
+        first_prompt = prompts[asked[0]]
+        if preamble:
+            first_prompt = f"{preamble}\n\n{first_prompt}"
+
+        messages = [self._document_message(first_prompt)]
+        for turn, next_turn in zip(asked, asked[1:]):
+            messages.append(
+                {"role": "assistant", "content": [_text_block(responses[turn])]}
             )
-            responses.append(response)
+            messages.append(
+                {"role": "user", "content": [_text_block(prompts[next_turn])]}
+            )
+        if self.use_prompt_cache:
+            self._mark_conversation_tail(messages)
+        return messages
+
+    def _process_independent(
+        self,
+        prompts: List[str],
+        system_string: Optional[str],
+        responses: List[Optional[str]],
+        concurrency: int,
+    ) -> None:
+        """Fill in the missing responses with one concurrent request per prompt.
+
+        Responses found in the result store are used as they are; their
+        turn_usage entry stays None.
+        """
+        system = self._system_param(system_string)
+        model = self.anthropic_service.model_name
+        keys = [
+            AnalysisKey.for_prompt(self.pdf_sha256, prompt, model, system_string)
+            for prompt in prompts
+        ]
+        pending = []
+        for i, response in enumerate(responses):
+            if response is not None:
+                continue
+            stored = self.result_store.get(keys[i]) if self.result_store else None
+            if stored is not None:
+                responses[i] = stored
+            else:
+                pending.append(i)
+        if not pending:
+            return
+        # Only encode the PDF when something has to be sent
+        payload = self.payload
+        errors: Dict[int, BaseException] = {}
+
+        def attempt(i: int) -> None:
+            try:
+                message = self.anthropic_service.create_pdf_message(
+                    max_tokens=4096,
+                    messages=[self._document_message(prompts[i], payload)],
+                    temperature=0.0,
+                    system=system,
+                )
+            except Exception as e:
+                errors[i] = e
+                return
+            responses[i] = message.content[0].text
+            self.turn_usage[i] = usage_to_dict(message)
+            if self.result_store is not None:
+                self.result_store.put(keys[i], responses[i], step="process_pdf")
+
+        if self.use_prompt_cache and len(pending) > 1 and len(pending) == len(prompts):
+            # Concurrent requests would each write the document to the cache;
+            # let one write it so the others read it at the cached rate
+            attempt(pending.pop(0))
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                # Copy the caller's context so its claude_label reaches the workers
+                futures = [
+                    executor.submit(contextvars.copy_context().run, attempt, i)
+                    for i in pending
+                ]
+                for future in as_completed(futures):
+                    future.result()
+
+        if errors:
+            first = min(errors)
+            raise PdfProcessingError(
+                f"{len(errors)} of {len(prompts)} prompts failed; prompt "
+                f"{first + 1}: {str(errors[first])}"
+            ) from errors[first]
+
+    def extract_structured(
+        self,
+        prompt: str,
+        tool: StructuredTool,
+        system_string: Optional[str] = None,
+        max_tokens: int = 4096,
+    ) -> Any:
+        """Ask about the document and get the answer as tool's validated input.
+
+        Raises:
+            PdfProcessingError: If the request fails or the answer does not
+                match tool's schema
+        """
+        try:
+            message = self.anthropic_service.create_pdf_message(
+                max_tokens=max_tokens,
+                messages=[self._document_message(prompt)],
+                temperature=0.0,
+                system=self._system_param(system_string),
+                **tool.request_params(),
+            )
+            result = tool.parse(message)
+        except Exception as e:
+            raise PdfProcessingError(f"Structured extraction failed: {str(e)}") from e
+        self.turn_usage = [usage_to_dict(message)]
+        return result
 
-        return responses
+    def process_fused(
+        self,
+        prompts: Sequence[FusedPrompt],
+        system_string: Optional[str] = None,
+        max_tokens: int = 8192,
+    ) -> Dict[str, Any]:
+        """Answer several independent prompts with one request carrying the PDF.
+
+        See prompt_fusion. max_tokens covers every answer together.
+
+        Returns:
+            Each prompt's validated answer, by prompt name
+
+        Raises:
+            PdfProcessingError: If the request fails or an answer does not
+                match its prompt's schema
+        """
+        answer = self.extract_structured(
+            fused_prompt(prompts),
+            fused_tool(prompts),
+            system_string=system_string,
+            max_tokens=max_tokens,
+        )
+        return split_answer(answer, prompts)
+
+    def iter_structured(
+        self,
+        prompt: str,
+        tool: StructuredTool,
+        system_string: Optional[str] = None,
+        max_tokens: int = 4096,
+    ) -> Iterator[Tuple[JsonPath, Any]]:
+        """Stream the answer to prompt as validated (path, value) pairs.
+
+        Fields arrive as soon as they are generated, innermost first, with
+        the whole answer last at path (). Breaking out of the loop closes
+        the request, so callers that have what they need stop paying for
+        output tokens.
+
+        Raises:
+            StructuredOutputError: As soon as a completed field violates the
+                schema, or if the stream ends before the answer does
+        """
+        chunks = self.anthropic_service.stream_claude_tool_input(
+            max_tokens=max_tokens,
+            messages=[self._document_message(prompt)],
+            tool=tool,
+            system_string=self._system_param(system_string),
+            temperature=0.0,
+        )
+        yield from tool.iter_fields(chunks)
+
+    @property
+    def batch_manager(self) -> BatchJobManager:
+        """Manager persisting this instance's batches (created on first use)."""
+        if self._batch_manager is None:
+            self._batch_manager = BatchJobManager(
+                self.anthropic_service.client, self._batch_store
+            )
+        return self._batch_manager
 
     def create_pdf_batch(self, prompts: List[str]) -> str:
         """
         Create a batch request for processing the current PDF with multiple prompts.
 
+        The batch id and the prompt behind each custom_id are recorded in the
+        batch store before this returns, so results can be collected even if
+        the process restarts.
+
         Args:
             prompts: List of prompts to process
 
@@ -98,10 +493,11 @@ class PdfAnthropic:
         """
         try:
             batch_requests = []
+            request_metadata = {}
+            payload = self.payload
 
             for i, prompt in enumerate(prompts):
-                # Generate unique ID for this request
-                custom_id = f"pdf_{os.path.basename(self.pdf_path)}_{i}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                custom_id = batch_custom_id(payload.sha256, i)
 
                 # Create request with PDF content
                 request = Request(
@@ -109,31 +505,20 @@ class PdfAnthropic:
                     params=MessageCreateParamsNonStreaming(
                         model=self.anthropic_service.model_name,
                         max_tokens=4096,
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": prompt},
-                                    {
-                                        "type": "document",
-                                        "source": {
-                                            "type": "base64",
-                                            "media_type": "application/pdf",
-                                            "data": self.pdf_base64,
-                                        },
-                                    },
-                                ],
-                            }
-                        ],
+                        messages=[self._document_message(prompt, payload)],
                     ),
                 )
                 batch_requests.append(request)
-
-            # Create batch using the AnthropicService client
-            batch = self.anthropic_service.client.messages.batches.create(
-                requests=batch_requests
+                request_metadata[custom_id] = {
+                    "pdf_path": self.pdf_path,
+                    "prompt_index": i,
+                }
+
+            return self.batch_manager.submit(
+                batch_requests,
+                request_metadata=request_metadata,
+                metadata={"pdf_path": self.pdf_path, "pdf_sha256": payload.sha256},
             )
-            return batch.id
 
         except Exception as e:
             raise PdfProcessingError(f"Error creating batch: {str(e)}")
@@ -149,8 +534,8 @@ class PdfAnthropic:
             Dict containing status information
         """
         try:
-            batch = await self.anthropic_service.client.messages.batches.retrieve(
-                batch_id
+            batch = await asyncio.to_thread(
+                self.anthropic_service.client.messages.batches.retrieve, batch_id
             )
             return {
                 "status": batch.processing_status,
@@ -164,146 +549,153 @@ class PdfAnthropic:
         """
         Get results from a completed batch.
 
+        Results already collected into the batch store are read from there;
+        otherwise they are downloaded and stored first.
+
         Args:
             batch_id: The ID of the batch to get results from
 
         Returns:
             List of dictionaries containing results for each prompt
         """
-        results = []
-
         try:
-            async for result in self.anthropic_service.client.messages.batches.results(
-                batch_id
-            ):
-                if result.result.type == "succeeded":
-                    results.append(
-                        {
-                            "prompt_id": result.custom_id,
-                            "status": "success",
-                            "result": result.result.message.content[0].text,
-                        }
-                    )
-                else:
-                    results.append(
-                        {
-                            "prompt_id": result.custom_id,
-                            "status": result.result.type,
-                            "error": str(
-                                getattr(result.result, "error", "Unknown error")
-                            ),
-                        }
-                    )
+            store = self.batch_manager.store
+            job = store.get_job(batch_id)
+            if job is None or not job["collected"]:
+                await asyncio.to_thread(self.batch_manager.collect, batch_id)
+
+            results = [batch_result_dict(row) for row in store.results(batch_id)]
             return results
         except Exception as e:
             raise PdfProcessingError(f"Error getting batch results: {str(e)}")
 
-    async def process_pdf_batch(self, prompts: List[str]) -> List[Dict[str, Any]]:
+    async def stream_batch_results(
+        self, batch_id: str, sinks: Sequence[ResultSink], chunk_size: int = 500
+    ) -> int:
+        """
+        Stream the results of an ended batch to sinks without holding them in memory.
+
+        Writing resumes from the last checkpoint if an earlier call was
+        interrupted.
+
+        Args:
+            batch_id: The ID of the ended batch
+            sinks: Where results are written (e.g. JsonlResultSink)
+            chunk_size: Results written per checkpoint
+
+        Returns:
+            int: Number of results written by this call
+        """
+        try:
+            streamer = BatchResultStreamer(
+                self.anthropic_service.client,
+                sinks,
+                store=self.batch_manager.store,
+                chunk_size=chunk_size,
+            )
+            return await streamer.astream(batch_id)
+        except Exception as e:
+            raise PdfProcessingError(f"Error streaming batch results: {str(e)}")
+
+    async def process_pdf_batch(
+        self, prompts: List[str], timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
         """
         Process multiple prompts for the current PDF in a batch.
 
         Args:
             prompts: List of prompts to process
+            timeout: Seconds to wait for the batch; on timeout the batch stays
+                in the store and BatchJobManager.run() can resume it
 
         Returns:
             List of dictionaries containing results
         """
         try:
-            # Create batch
-            batch_id = self.create_pdf_batch(prompts)
-            print(f"Created batch with ID: {batch_id}")
-
-            # Wait for processing to complete
-            while True:
-                status = await self.check_batch_status(batch_id)
-                print(f"Batch status: {status}")
+            batch_id = await asyncio.to_thread(self.create_pdf_batch, prompts)
+            logger.info(f"Created batch with ID: {batch_id}")
 
-                if status["status"] == "ended":
-                    break
+            # Adaptive polling until the results are collected into the store
+            await self.batch_manager.arun(batch_ids=[batch_id], timeout=timeout)
 
-                await asyncio.sleep(30)
-
-            # Get results
             return await self.get_batch_results(batch_id)
 
         except Exception as e:
             raise PdfProcessingError(f"Error in batch processing: {str(e)}")
 
-    async def test_batch_processing():
-        """Test function to demonstrate batch processing with multiple PDFs."""
-        try:
-            # Initialize service
-            anthropic_service = AnthropicService()
-
-            # Test PDFs (adjust paths as needed)
-            pdf_paths = [
-                "backend/tests/test_files/pdfs/long_covid_frontiers_2024_v1.pdf",
-                "backend/tests/test_files/pdfs/test_doc1.pdf",
-                "backend/tests/test_files/pdfs/test_doc2.pdf",
-                "backend/tests/test_files/pdfs/test_doc3.pdf",
-                "backend/tests/test_files/pdfs/test_doc4.pdf",
-            ]
-
-            # Test prompts - using paper analysis prompts for meaningful results
-            prompts = [
-                PAPER_ANALYSIS_PROMPT,
-                STRENGTH_WEAKNESS_PROMPT,
-                SOURCE_QUERY_PROMPT,
-            ]
-
-            all_results = {}
-
-            for pdf_path in pdf_paths:
-                try:
-                    print(f"\nProcessing {os.path.basename(pdf_path)}...")
-                    print("=" * 80)
-
-                    # Create processor for this PDF
-                    pdf_processor = PdfAnthropic(anthropic_service, pdf_path)
-
-                    # Process batch and await results
-                    results = await pdf_processor.process_pdf_batch(prompts)
-
-                    # Print results for this PDF
-                    print(f"\nResults for {os.path.basename(pdf_path)}:")
-                    print("-" * 40)
-
-                    for result in results:
-                        print(f"\nPrompt ID: {result['prompt_id']}")
-                        print(f"Status: {result['status']}")
-
-                        if result["status"] == "success":
-                            # Truncate long responses for readability
-                            response_preview = (
-                                result["result"][:200] + "..."
-                                if len(result["result"]) > 200
-                                else result["result"]
-                            )
-                            print(f"Response Preview: {response_preview}")
-                        else:
-                            print(f"Error: {result.get('error', 'Unknown error')}")
-
-                        print("-" * 40)
-
-                    all_results[pdf_path] = results
-
-                except Exception as e:
-                    print(f"Error processing {pdf_path}: {str(e)}")
-                    all_results[pdf_path] = None
-                    continue  # Continue with next PDF even if one fails
-
-            # Print summary
-            print("\nProcessing Summary:")
-            print("=" * 80)
-            for pdf_path, results in all_results.items():
-                status = "Success" if results is not None else "Failed"
-                print(f"{os.path.basename(pdf_path)}: {status}")
-
-            return all_results
 
-        except Exception as e:
-            print(f"Fatal error in batch processing test: {str(e)}")
-            raise
+async def test_batch_processing():
+    """Test function to demonstrate corpus batch processing with multiple PDFs."""
+    from dhg.services.pdf_corpus_batch import CorpusBatchBuilder
+    from dhg.services.prompts.paper_analysis_prompts import (
+        PAPER_ANALYSIS_PROMPT,
+        STRENGTH_WEAKNESS_PROMPT,
+        SOURCE_QUERY_PROMPT,
+    )
+
+    try:
+        # Initialize service
+        anthropic_service = AnthropicService()
+
+        # Test PDFs (adjust paths as needed)
+        pdf_paths = [
+            "backend/tests/test_files/pdfs/long_covid_frontiers_2024_v1.pdf",
+            "backend/tests/test_files/pdfs/test_doc1.pdf",
+            "backend/tests/test_files/pdfs/test_doc2.pdf",
+            "backend/tests/test_files/pdfs/test_doc3.pdf",
+            "backend/tests/test_files/pdfs/test_doc4.pdf",
+        ]
+        pdf_paths = [path for path in pdf_paths if os.path.exists(path)]
+
+        # Test prompts - using paper analysis prompts for meaningful results
+        prompts = [
+            PAPER_ANALYSIS_PROMPT,
+            STRENGTH_WEAKNESS_PROMPT,
+            SOURCE_QUERY_PROMPT,
+        ]
+
+        # Every paper and prompt goes into as few batches as possible, all
+        # submitted and polled together
+        builder = CorpusBatchBuilder(anthropic_service, use_prompt_cache=True)
+        all_results = await builder.process_corpus(pdf_paths, prompts)
+
+        for pdf_path, results in all_results.items():
+            print(f"\nResults for {os.path.basename(pdf_path)}:")
+            print("-" * 40)
+
+            for result in results:
+                if result is None:
+                    print("No result collected")
+                    continue
+                print(f"\nPrompt ID: {result['prompt_id']}")
+                print(f"Status: {result['status']}")
+
+                if result["status"] == "success":
+                    # Truncate long responses for readability
+                    response_preview = (
+                        result["result"][:200] + "..."
+                        if len(result["result"]) > 200
+                        else result["result"]
+                    )
+                    print(f"Response Preview: {response_preview}")
+                else:
+                    print(f"Error: {result.get('error', 'Unknown error')}")
+
+                print("-" * 40)
+
+        # Print summary
+        print("\nProcessing Summary:")
+        print("=" * 80)
+        for pdf_path in pdf_paths:
+            results = all_results.get(pdf_path) or []
+            ok = sum(1 for r in results if r and r["status"] == "success")
+            print(f"{os.path.basename(pdf_path)}: {ok}/{len(prompts)} succeeded")
+
+        return all_results
+
+    except Exception as e:
+        print(f"Fatal error in batch processing test: {str(e)}")
+        raise
 
 
 def test_source_query():
@@ -323,12 +715,5 @@ def test_source_query():
 
 
 if __name__ == "__main__":
-    # Import prompts at runtime to avoid circular imports
-    from dhg.services.prompts.paper_analysis_prompts import (
-        PAPER_ANALYSIS_PROMPT,
-        STRENGTH_WEAKNESS_PROMPT,
-        SOURCE_QUERY_PROMPT,
-    )
-
     # Run the batch processing test
     asyncio.run(test_batch_processing())
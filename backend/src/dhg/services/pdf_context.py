@@ -0,0 +1,144 @@
+"""Context policies for chained PdfAnthropic prompts.
+
+In a chained process_pdf call every turn normally replays all earlier
+prompts and answers, so input tokens grow quadratically with the length of
+the chain. A ContextPolicy chooses which earlier turns a prompt actually
+sees, keeping each request to the document plus a bounded amount of
+conversation.
+
+Example:
+    processor.process_pdf(prompts, context_policy=LastTurns(2))
+    processor.process_pdf(prompts, context_policy=DependencyContext({2: [0]}))
+"""
+
+from typing import Any, List, Mapping, Optional, Sequence, Tuple
+
+# (text placed before the first replayed prompt, indices of turns to replay)
+TurnContext = Tuple[Optional[str], List[int]]
+
+DEFAULT_SUMMARY_PROMPT = """Update the running summary of a conversation about a document.
+
+<summary>
+{summary}
+</summary>
+
+<question>
+{prompt}
+</question>
+
+<answer>
+{response}
+</answer>
+
+Return only the updated summary. Keep every fact, figure and conclusion a \
+later question could need, in at most a few short paragraphs."""
+
+
+class ContextPolicy:
+    """Chooses the earlier turns replayed before each prompt of a chain."""
+
+    def reset(self) -> None:
+        """Forget state from a previous chain."""
+
+    def context(
+        self,
+        index: int,
+        prompts: Sequence[str],
+        responses: Sequence[str],
+        anthropic_service: Any,
+    ) -> TurnContext:
+        """Context for turn index, given the responses to the turns before it."""
+        raise NotImplementedError
+
+
+class FullHistory(ContextPolicy):
+    """Replay every earlier turn (the default)."""
+
+    def context(self, index, prompts, responses, anthropic_service) -> TurnContext:
+        return None, list(range(index))
+
+
+class LastTurns(ContextPolicy):
+    """Replay only the last n turns."""
+
+    def __init__(self, n: int):
+        if n < 0:
+            raise ValueError("n must be >= 0")
+        self.n = n
+
+    def context(self, index, prompts, responses, anthropic_service) -> TurnContext:
+        return None, list(range(max(0, index - self.n), index))
+
+
+class DependencyContext(ContextPolicy):
+    """Replay only the turns each prompt declares it depends on.
+
+    Prompts without an entry see no earlier turns.
+    """
+
+    def __init__(self, dependencies: Mapping[int, Sequence[int]]):
+        """
+        Args:
+            dependencies: Prompt index -> indices of earlier prompts it needs
+        """
+        for index, needs in dependencies.items():
+            if any(need < 0 or need >= index for need in needs):
+                raise ValueError(f"Prompt {index} can only depend on earlier prompts")
+        self.dependencies = {
+            index: sorted(set(needs)) for index, needs in dependencies.items()
+        }
+
+    def context(self, index, prompts, responses, anthropic_service) -> TurnContext:
+        return None, list(self.dependencies.get(index, []))
+
+
+class RunningSummary(ContextPolicy):
+    """Replay the last few turns and fold older ones into a running summary.
+
+    Each turn that leaves the window is summarized once, with a text-only
+    call that does not carry the document.
+    """
+
+    def __init__(
+        self,
+        keep_last: int = 1,
+        max_tokens: int = 512,
+        summary_prompt: str = DEFAULT_SUMMARY_PROMPT,
+    ):
+        """
+        Args:
+            keep_last: Most recent turns replayed verbatim
+            max_tokens: Output limit of each summary update
+            summary_prompt: Template with {summary}, {prompt} and {response}
+        """
+        if keep_last < 0:
+            raise ValueError("keep_last must be >= 0")
+        self.keep_last = keep_last
+        self.max_tokens = max_tokens
+        self.summary_prompt = summary_prompt
+        self.reset()
+
+    def reset(self) -> None:
+        self.summary = ""
+        self.summarized = 0
+
+    def context(self, index, prompts, responses, anthropic_service) -> TurnContext:
+        start = max(0, index - self.keep_last)
+        while self.summarized < start:
+            turn = self.summarized
+            self.summary = anthropic_service.call_claude_basic(
+                max_tokens=self.max_tokens,
+                input_string=self.summary_prompt.format(
+                    summary=self.summary or "(empty)",
+                    prompt=prompts[turn],
+                    response=responses[turn],
+                ),
+            )
+            self.summarized += 1
+        preamble = None
+        if self.summary:
+            preamble = (
+                "Summary of the earlier conversation about this document:\n"
+                f"{self.summary}"
+            )
+        return preamble, list(range(start, index))
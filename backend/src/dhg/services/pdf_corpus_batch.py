@@ -0,0 +1,271 @@
+"""Corpus-wide Message Batches: many PDFs times many prompts.
+
+Instead of one batch per paper, every (paper, prompt) request of a corpus is
+packed into as few batches as the API's request-count and size limits allow.
+The batches are submitted concurrently and polled from one loop, so a whole
+corpus finishes in roughly one batch turnaround. custom_ids derive from each
+paper's content hash, and results are routed back to every path the paper
+was given under.
+
+Example:
+    builder = CorpusBatchBuilder(AnthropicService())
+    results = await builder.process_corpus(pdf_paths, prompts)
+    results["paper.pdf"][0]["result"]
+"""
+
+import asyncio
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from anthropic.types.message_create_params import MessageCreateParamsNonStreaming
+from anthropic.types.messages.batch_create_params import Request
+
+from dhg.services.anthropic_batch_results import BatchResultStreamer, ResultSink
+from dhg.services.anthropic_batches import BatchJobManager, BatchJobStore
+from dhg.services.anthropic_service import AnthropicService, _text_block
+from dhg.services.pdf_anthropic import (
+    CACHE_CONTROL,
+    batch_custom_id,
+    batch_result_dict,
+    pdf_document_message,
+)
+from dhg.services.pdf_payload import PdfPayloadRegistry, default_pdf_registry
+
+logger = logging.getLogger(__name__)
+
+# Message Batches API limits per batch
+MAX_BATCH_REQUESTS = 100_000
+MAX_BATCH_BYTES = 256 * 1024 * 1024
+# Allowance for the JSON around each request's document and prompt
+REQUEST_OVERHEAD_BYTES = 1024
+
+
+class CorpusBatchBuilder:
+    """Packs (pdf x prompt) requests from many papers into few batches."""
+
+    def __init__(
+        self,
+        anthropic_service: AnthropicService,
+        batch_store: Optional[BatchJobStore] = None,
+        payload_registry: Optional[PdfPayloadRegistry] = None,
+        max_tokens: int = 4096,
+        system_string: Optional[str] = None,
+        use_prompt_cache: bool = False,
+        max_batch_requests: int = MAX_BATCH_REQUESTS,
+        max_batch_bytes: int = MAX_BATCH_BYTES,
+    ):
+        """
+        Args:
+            anthropic_service: Service whose client submits the batches
+            batch_store: Where batches are persisted (defaults to BatchJobStore())
+            payload_registry: Source of encoded PDFs (defaults to the shared one)
+            max_tokens: max_tokens of every request
+            system_string: Optional system prompt for every request
+            use_prompt_cache: Mark each paper's document block for caching, so
+                its later prompts in the same batch can read it from cache
+            max_batch_requests: Request-count limit per batch
+            max_batch_bytes: Size limit per batch
+        """
+        self.anthropic_service = anthropic_service
+        self.manager = BatchJobManager(anthropic_service.client, batch_store)
+        self.payload_registry = (
+            payload_registry if payload_registry is not None else default_pdf_registry
+        )
+        self.max_tokens = max_tokens
+        self.system_string = system_string
+        self.use_prompt_cache = use_prompt_cache
+        self.max_batch_requests = max_batch_requests
+        self.max_batch_bytes = max_batch_bytes
+
+    def _params(self, message: Dict[str, Any]) -> MessageCreateParamsNonStreaming:
+        params = MessageCreateParamsNonStreaming(
+            model=self.anthropic_service.model_name,
+            max_tokens=self.max_tokens,
+            messages=[message],
+        )
+        if self.system_string is not None:
+            system: Any = self.system_string
+            if self.use_prompt_cache:
+                system = [{**_text_block(system), "cache_control": CACHE_CONTROL}]
+            params["system"] = system
+        return params
+
+    def iter_batches(
+        self, pdf_paths: Sequence[str], prompts: Sequence[str]
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Yield packed batches as lists of {"request", "metadata", "bytes"} items.
+
+        Papers are encoded one at a time as they are packed, so only the
+        batch being packed is built ahead of the caller. "bytes" is the
+        request's estimated size. A paper that appears under several paths is
+        requested once, with every path kept in its metadata.
+        """
+        paths_by_sha: Dict[str, List[str]] = {}
+        order: List[str] = []
+        for path in pdf_paths:
+            sha256 = self.payload_registry.sha256_for(path)
+            if sha256 not in paths_by_sha:
+                paths_by_sha[sha256] = []
+                order.append(sha256)
+            paths_by_sha[sha256].append(path)
+
+        batch: List[Dict[str, Any]] = []
+        batch_bytes = 0
+        for sha256 in order:
+            paths = paths_by_sha[sha256]
+            payload = self.payload_registry.get(paths[0])
+            for i, prompt in enumerate(prompts):
+                size = (
+                    len(payload.base64)
+                    + len(prompt.encode("utf-8"))
+                    + len((self.system_string or "").encode("utf-8"))
+                    + REQUEST_OVERHEAD_BYTES
+                )
+                if size > self.max_batch_bytes:
+                    raise ValueError(f"{paths[0]} is too large for a batch request")
+                if batch and (
+                    len(batch) >= self.max_batch_requests
+                    or batch_bytes + size > self.max_batch_bytes
+                ):
+                    yield batch
+                    batch, batch_bytes = [], 0
+                message = pdf_document_message(payload, prompt, self.use_prompt_cache)
+                custom_id = batch_custom_id(sha256, i)
+                batch.append(
+                    {
+                        "request": Request(
+                            custom_id=custom_id, params=self._params(message)
+                        ),
+                        "metadata": {
+                            "pdf_sha256": sha256,
+                            "pdf_paths": paths,
+                            "prompt_index": i,
+                        },
+                        "bytes": size,
+                    }
+                )
+                batch_bytes += size
+        if batch:
+            yield batch
+
+    def _submit_batch(self, batch: List[Dict[str, Any]]) -> str:
+        return self.manager.submit(
+            [item["request"] for item in batch],
+            request_metadata={
+                item["request"]["custom_id"]: item["metadata"] for item in batch
+            },
+            metadata={"kind": "corpus", "requests": len(batch)},
+        )
+
+    def submit(
+        self,
+        pdf_paths: Sequence[str],
+        prompts: Sequence[str],
+        concurrency: int = 4,
+        max_in_flight_bytes: int = MAX_BATCH_BYTES,
+    ) -> List[str]:
+        """Pack and submit the corpus, uploading up to concurrency batches at once.
+
+        Batches being uploaded are held in memory until their upload ends.
+        Uploads start only while their total stays within
+        max_in_flight_bytes (a single larger batch still goes alone), so
+        memory peaks at about max_in_flight_bytes plus the batch being
+        packed.
+
+        Args:
+            pdf_paths: PDFs to request
+            prompts: Prompts asked of every PDF
+            concurrency: Batches uploaded at once
+            max_in_flight_bytes: Cap on the size of batches being uploaded
+
+        Returns:
+            List[str]: Ids of the submitted batches
+        """
+        batch_ids: List[str] = []
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            in_flight: Dict[Future, int] = {}
+            for batch in self.iter_batches(pdf_paths, prompts):
+                batch_bytes = sum(item["bytes"] for item in batch)
+                while in_flight and (
+                    len(in_flight) >= concurrency
+                    or sum(in_flight.values()) + batch_bytes > max_in_flight_bytes
+                ):
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del in_flight[future]
+                        batch_ids.append(future.result())
+                in_flight[executor.submit(self._submit_batch, batch)] = batch_bytes
+            batch_ids.extend(future.result() for future in in_flight)
+        logger.info(
+            f"Submitted corpus of {len(pdf_paths)} PDFs in {len(batch_ids)} batches"
+        )
+        return batch_ids
+
+    def results_by_paper(
+        self, batch_ids: Sequence[str], num_prompts: int
+    ) -> Dict[str, List[Optional[Dict[str, Any]]]]:
+        """Route collected results back to each paper path, in prompt order.
+
+        Returns:
+            Dict mapping every input path to a list with one entry per prompt
+            (None where no result was collected)
+        """
+        by_paper: Dict[str, List[Optional[Dict[str, Any]]]] = {}
+        for batch_id in batch_ids:
+            for row in self.manager.store.results(batch_id):
+                metadata = row["metadata"]
+                for path in metadata["pdf_paths"]:
+                    slots = by_paper.setdefault(path, [None] * num_prompts)
+                    slots[metadata["prompt_index"]] = batch_result_dict(row)
+        return by_paper
+
+    async def process_corpus(
+        self,
+        pdf_paths: Sequence[str],
+        prompts: Sequence[str],
+        concurrency: int = 4,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, List[Optional[Dict[str, Any]]]]:
+        """Submit the corpus, wait for every batch and return results per paper.
+
+        If this is interrupted, the batches remain in the store; a later
+        BatchJobManager.run() collects them and results_by_paper() reads them.
+        """
+        batch_ids = await asyncio.to_thread(
+            self.submit, pdf_paths, prompts, concurrency
+        )
+        await self.manager.arun(batch_ids=batch_ids, timeout=timeout)
+        return self.results_by_paper(batch_ids, len(prompts))
+
+    async def stream_corpus(
+        self,
+        pdf_paths: Sequence[str],
+        prompts: Sequence[str],
+        sinks: Sequence[ResultSink],
+        concurrency: int = 4,
+        timeout: Optional[float] = None,
+    ) -> List[str]:
+        """Like process_corpus(), but stream results to sinks as batches end.
+
+        Nothing is kept in memory or in the SQLite store; each row's metadata
+        carries pdf_sha256, pdf_paths and prompt_index for routing.
+
+        Returns:
+            List[str]: Ids of the submitted batches
+        """
+        batch_ids = await asyncio.to_thread(
+            self.submit, pdf_paths, prompts, concurrency
+        )
+        manager = BatchJobManager(
+            self.manager.client,
+            self.manager.store,
+            min_interval=self.manager.min_interval,
+            max_interval=self.manager.max_interval,
+            backoff=self.manager.backoff,
+            streamer=BatchResultStreamer(
+                self.manager.client, sinks, store=self.manager.store
+            ),
+        )
+        await manager.arun(batch_ids=batch_ids, timeout=timeout)
+        return batch_ids
@@ -0,0 +1,237 @@
+"""Loading PDF files as base64 payloads for Claude document blocks."""
+
+import base64
+import hashlib
+import mmap
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Tuple
+
+# Multiple of 3 so chunk encodings concatenate without padding in between
+ENCODE_CHUNK_BYTES = 3 * 1024 * 1024
+
+
+def encode_file_base64(path: str, chunk_size: int = ENCODE_CHUNK_BYTES) -> str:
+    """Base64-encode a file without reading it into memory first.
+
+    The file is memory-mapped and encoded chunk by chunk into one
+    preallocated buffer, so the raw bytes are never all held in memory.
+    Decoding the buffer into the returned string copies it, so peak memory
+    is still about twice the encoded size (4/3 of the file each), against
+    the raw bytes plus both encoded copies when reading the file whole.
+
+    Args:
+        path: File to encode
+        chunk_size: Bytes encoded per step; must be a multiple of 3
+
+    Returns:
+        str: Base64 text of the whole file
+    """
+    if chunk_size % 3:
+        raise ValueError("chunk_size must be a multiple of 3")
+    size = os.path.getsize(path)
+    if size == 0:
+        return ""
+
+    encoded = bytearray(4 * ((size + 2) // 3))
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        position = 0
+        for start in range(0, size, chunk_size):
+            chunk = base64.b64encode(m[start : start + chunk_size])
+            encoded[position : position + len(chunk)] = chunk
+            position += len(chunk)
+    return encoded.decode("ascii")
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file's contents, read through a memory map."""
+    digest = hashlib.sha256()
+    if os.path.getsize(path):
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                digest.update(m)
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class PdfPayload:
+    """An encoded PDF identified by the SHA-256 of its bytes.
+
+    sha256 is stable across paths and processes, so it doubles as a cache key
+    for anything derived from the document.
+    """
+
+    sha256: str
+    base64: str
+    size_bytes: int
+
+    def document_block(self) -> Dict[str, Any]:
+        """A fresh document content block; safe to add cache_control to."""
+        return {
+            "type": "document",
+            "source": {
+                "type": "base64",
+                "media_type": "application/pdf",
+                "data": self.base64,
+            },
+        }
+
+
+@dataclass
+class PayloadStats:
+    """Counters for a PdfPayloadRegistry."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "hit_rate": self.hit_rate}
+
+
+class PdfPayloadRegistry:
+    """Process-wide, content-addressed LRU of encoded PDFs.
+
+    The same paper under different paths is encoded once. Entries are evicted
+    least recently used first once their encoded size passes max_bytes.
+
+    Example:
+        payload = default_pdf_registry.get("paper.pdf")
+        block = payload.document_block()
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Cap on the total size of cached base64 payloads
+        """
+        self.max_bytes = max_bytes
+        self.stats = PayloadStats()
+        self._payloads: "OrderedDict[str, PdfPayload]" = OrderedDict()
+        self._bytes = 0
+        # path -> (mtime_ns, size, sha256) so unchanged files are not rehashed
+        self._path_hashes: Dict[str, Tuple[int, int, str]] = {}
+        # id(payload.base64) -> sha256 of every resident payload
+        self._data_hashes: Dict[int, str] = {}
+        self._encoding: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        _registries.add(self)
+
+    def sha256_for(self, path: str) -> str:
+        """Content hash of a file, without encoding it."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            known = self._path_hashes.get(path)
+        if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+            return known[2]
+        sha256 = file_sha256(path)
+        with self._lock:
+            self._path_hashes[path] = (stat.st_mtime_ns, stat.st_size, sha256)
+        return sha256
+
+    def sha256_of(self, data: str) -> Optional[str]:
+        """Hash of the resident payload whose base64 is this string object."""
+        with self._lock:
+            sha256 = self._data_hashes.get(id(data))
+            if sha256 is not None and self._payloads[sha256].base64 is data:
+                return sha256
+        return None
+
+    def _lookup(self, sha256: str) -> Optional[PdfPayload]:
+        with self._lock:
+            payload = self._payloads.get(sha256)
+            if payload is not None:
+                self._payloads.move_to_end(sha256)
+                self.stats.hits += 1
+            return payload
+
+    def _store(self, payload: PdfPayload) -> None:
+        size = len(payload.base64)
+        with self._lock:
+            self.stats.misses += 1
+            if size > self.max_bytes or payload.sha256 in self._payloads:
+                return
+            self._payloads[payload.sha256] = payload
+            self._data_hashes[id(payload.base64)] = payload.sha256
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._payloads.popitem(last=False)
+                del self._data_hashes[id(evicted.base64)]
+                self._bytes -= len(evicted.base64)
+                self.stats.evictions += 1
+
+    def get(self, path: str) -> PdfPayload:
+        """Encoded payload for the file at path, encoding it only on a miss."""
+        sha256 = self.sha256_for(path)
+        payload = self._lookup(sha256)
+        if payload is not None:
+            return payload
+
+        # One encode per document even when several threads miss together
+        with self._lock:
+            encoding = self._encoding.setdefault(sha256, threading.Lock())
+        with encoding:
+            payload = self._lookup(sha256)
+            if payload is None:
+                payload = PdfPayload(
+                    sha256=sha256,
+                    base64=encode_file_base64(path),
+                    size_bytes=os.path.getsize(path),
+                )
+                self._store(payload)
+        with self._lock:
+            self._encoding.pop(sha256, None)
+        return payload
+
+    @property
+    def cached_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._payloads.clear()
+            self._data_hashes.clear()
+            self._path_hashes.clear()
+            self._bytes = 0
+
+
+# Every live registry, so document_sha256 can find a payload by its string
+_registries: "weakref.WeakSet[PdfPayloadRegistry]" = weakref.WeakSet()
+
+
+def resident_sha256(data: str) -> Optional[str]:
+    """SHA-256 of the PDF whose registry payload is this string, if resident."""
+    for registry in list(_registries):
+        sha256 = registry.sha256_of(data)
+        if sha256 is not None:
+            return sha256
+    return None
+
+
+def document_sha256(data: str) -> str:
+    """Hash identifying base64 document data, for cache keys.
+
+    This is the SHA-256 of the decoded bytes, the same hash a registry keys
+    payloads by, so equal documents always get equal keys. For a payload
+    resident in a registry it is found without decoding or hashing.
+    """
+    sha256 = resident_sha256(data)
+    if sha256 is not None:
+        return sha256
+    return hashlib.sha256(base64.b64decode(data)).hexdigest()
+
+
+# Shared by every PdfAnthropic and service in the process
+default_pdf_registry = PdfPayloadRegistry()
@@ -0,0 +1,203 @@
+"""Splitting oversized PDFs into page ranges for map-reduce prompting.
+
+A PDF that exceeds the page, size or context limits of a single document
+block is cut into page-range chunks that each fit. The prompt runs on every
+chunk in parallel (map), and a text-only reduce call merges the partial
+answers into one.
+
+Requires pypdf; can_split_pdfs() reports whether it is installed.
+"""
+
+import base64
+import hashlib
+import io
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dhg.core.exceptions import AnthropicTokenBudgetError
+from dhg.services.anthropic_tokens import (
+    MAX_REQUEST_BYTES,
+    MODEL_CONTEXT_WINDOW,
+    PDF_MAX_PAGES,
+    PDF_TOKENS_PER_PAGE,
+)
+from dhg.services.pdf_payload import PdfPayload
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # pypdf is optional
+    PdfReader = None
+    PdfWriter = None
+
+# Raw bytes per chunk, leaving room in the request for the prompt once the
+# PDF is base64 encoded
+MAX_CHUNK_BYTES = MAX_REQUEST_BYTES * 3 // 4 - 1024 * 1024
+# Tokens kept free in each map request for the chunk preamble and overhead
+CHUNK_TOKEN_MARGIN = 1000
+
+DEFAULT_REDUCE_PROMPT = (
+    "The task below was carried out separately on consecutive page ranges of "
+    "one document. Merge the partial answers into a single answer to the task "
+    "for the whole document: remove repetition, reconcile contradictions and "
+    "keep the format the task asks for."
+)
+
+
+def can_split_pdfs() -> bool:
+    return PdfReader is not None
+
+
+@dataclass(frozen=True)
+class PdfChunk:
+    """Pages first_page..last_page (1-based, inclusive) of a PDF."""
+
+    first_page: int
+    last_page: int
+    total_pages: int
+    payload: PdfPayload
+
+
+def chunk_page_limit(
+    max_tokens: int,
+    prompt_tokens: int = 0,
+    context_window: int = MODEL_CONTEXT_WINDOW,
+) -> int:
+    """Most pages a chunk can hold alongside the prompt and the response.
+
+    Raises:
+        AnthropicTokenBudgetError: If not even one page fits
+    """
+    available = context_window - max_tokens - prompt_tokens - CHUNK_TOKEN_MARGIN
+    pages = min(PDF_MAX_PAGES, available // PDF_TOKENS_PER_PAGE)
+    if pages < 1:
+        raise AnthropicTokenBudgetError(
+            f"No room for a PDF page beside {prompt_tokens} prompt tokens "
+            f"and max_tokens={max_tokens}"
+        )
+    return pages
+
+
+def page_ranges(total_pages: int, max_pages: int) -> List[Tuple[int, int]]:
+    """Split pages into the fewest evenly sized [start, stop) ranges.
+
+    Even sizes keep the parallel map calls similar in latency, so the slowest
+    chunk is not much slower than the rest.
+    """
+    count = max(1, math.ceil(total_pages / max_pages))
+    size, extra = divmod(total_pages, count)
+    ranges = []
+    start = 0
+    for i in range(count):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def _write_pages(reader: Any, start: int, stop: int) -> bytes:
+    writer = PdfWriter()
+    for page in reader.pages[start:stop]:
+        writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def split_pdf(
+    pdf_path: str, max_pages: int, max_bytes: int = MAX_CHUNK_BYTES
+) -> List[PdfChunk]:
+    """Cut a PDF into page-range chunks under both the page and size limits.
+
+    Ranges that come out larger than max_bytes (e.g. pages full of scans)
+    are halved until they fit.
+
+    Args:
+        pdf_path: PDF to split
+        max_pages: Page limit per chunk (see chunk_page_limit)
+        max_bytes: Size limit per chunk before encoding
+
+    Returns:
+        List[PdfChunk]: Chunks in page order
+    """
+    if PdfReader is None:
+        raise ImportError("pypdf is required to split PDFs")
+
+    reader = PdfReader(pdf_path)
+    total_pages = len(reader.pages)
+    chunks = []
+    pending = list(reversed(page_ranges(total_pages, max_pages)))
+    while pending:
+        start, stop = pending.pop()
+        data = _write_pages(reader, start, stop)
+        if len(data) > max_bytes:
+            if stop - start == 1:
+                raise AnthropicTokenBudgetError(
+                    f"Page {start + 1} of {pdf_path} alone is {len(data)} bytes; "
+                    f"the limit is {max_bytes}"
+                )
+            middle = (start + stop) // 2
+            pending.extend([(middle, stop), (start, middle)])
+            continue
+        chunks.append(
+            PdfChunk(
+                first_page=start + 1,
+                last_page=stop,
+                total_pages=total_pages,
+                payload=PdfPayload(
+                    sha256=hashlib.sha256(data).hexdigest(),
+                    base64=base64.b64encode(data).decode("ascii"),
+                    size_bytes=len(data),
+                ),
+            )
+        )
+    return chunks
+
+
+def map_requests(
+    chunks: Sequence[PdfChunk],
+    prompt: str,
+    max_tokens: int,
+    temperature: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """One call_claude_many request per chunk, telling Claude which pages it has."""
+    requests = []
+    for chunk in chunks:
+        preamble = (
+            f"The attached PDF is pages {chunk.first_page}-{chunk.last_page} of a "
+            f"{chunk.total_pages}-page document. Answer for these pages only; "
+            "the answers for all page ranges will be merged afterwards.\n\n"
+        )
+        requests.append(
+            {
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": preamble + prompt},
+                            chunk.payload.document_block(),
+                        ],
+                    }
+                ],
+            }
+        )
+    return requests
+
+
+def reduce_input(
+    prompt: str,
+    chunks: Sequence[PdfChunk],
+    partials: Sequence[str],
+    reduce_prompt: Optional[str] = None,
+) -> str:
+    """Text of the reduce call merging the per-chunk answers."""
+    sections = "\n\n".join(
+        f'<partial pages="{chunk.first_page}-{chunk.last_page}">\n{text}\n</partial>'
+        for chunk, text in zip(chunks, partials)
+    )
+    return (
+        f"{reduce_prompt or DEFAULT_REDUCE_PROMPT}\n\n"
+        f"<task>\n{prompt}\n</task>\n\n{sections}"
+    )
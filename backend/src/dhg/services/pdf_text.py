@@ -0,0 +1,341 @@
+"""Local PDF text extraction with section detection and a content-hash cache.
+
+Extraction runs in a process pool so a corpus uses every core, and results
+are cached by the SHA-256 of the PDF so a paper is only parsed once, however
+many paths or runs it appears under. The extracted text carries page markers
+and detected sections, ready for text-only prompts that skip uploading the
+PDF when its figures don't matter.
+
+Requires pypdf; can_extract_text() reports whether it is installed.
+
+Example:
+    extractor = PdfTextExtractor()
+    texts = extractor.extract_many(pdf_paths)
+    prompt = texts["paper.pdf"].text
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dhg.services.pdf_payload import PdfPayloadRegistry, default_pdf_registry
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pypdf is optional
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+# Bump when extraction changes so cached results from older code are ignored
+EXTRACTION_VERSION = 1
+
+# A line this much larger than the body text is treated as a heading
+HEADING_SIZE_RATIO = 1.15
+MAX_HEADING_CHARS = 100
+
+SECTION_NAMES = {
+    "abstract",
+    "introduction",
+    "background",
+    "related work",
+    "methods",
+    "methodology",
+    "materials and methods",
+    "results",
+    "discussion",
+    "results and discussion",
+    "conclusion",
+    "conclusions",
+    "limitations",
+    "references",
+    "acknowledgements",
+    "acknowledgments",
+    "appendix",
+}
+
+_NUMBERING = re.compile(r"^(?:\d+(?:\.\d+)*\.?|[IVX]+\.)\s+")
+
+
+def can_extract_text() -> bool:
+    return PdfReader is not None
+
+
+def default_text_cache_dir() -> Optional[str]:
+    """On-disk cache directory from PDF_TEXT_CACHE_DIR, or None for memory only."""
+    return os.getenv("PDF_TEXT_CACHE_DIR") or None
+
+
+@dataclass
+class Section:
+    """A detected section; first_page is 1-based."""
+
+    title: str
+    first_page: int
+    text: str
+
+
+@dataclass
+class PdfText:
+    """Page-level text and detected sections of one PDF."""
+
+    sha256: str
+    pages: List[str]
+    sections: List[Section] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        """Whole document with [Page n] markers, for use in prompts."""
+        return "\n\n".join(
+            f"[Page {number}]\n{page}" for number, page in enumerate(self.pages, 1)
+        )
+
+    def section(self, name: str) -> Optional[Section]:
+        """First section whose title matches name, ignoring numbering and case."""
+        wanted = _normalize_heading(name)
+        for section in self.sections:
+            if _normalize_heading(section.title) == wanted:
+                return section
+        return None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PdfText":
+        return cls(
+            sha256=data["sha256"],
+            pages=data["pages"],
+            sections=[Section(**section) for section in data["sections"]],
+        )
+
+
+def _normalize_heading(line: str) -> str:
+    return _NUMBERING.sub("", line).strip().rstrip(":.").lower()
+
+
+def _page_lines(page: Any) -> Tuple[str, List[Tuple[str, float]]]:
+    """Page text plus its lines with their rendered font size."""
+    lines: List[List[Any]] = []  # [text, size, y]
+
+    def visit(text, cm, tm, font_dict, font_size):
+        if not text:
+            return
+        scale = math.hypot(tm[2], tm[3]) * math.hypot(cm[2], cm[3])
+        size = font_size * (scale or 1.0)
+        y = tm[5] * cm[3] + cm[5]
+        for i, part in enumerate(text.split("\n")):
+            if i > 0 or not lines or abs(lines[-1][2] - y) > size / 2:
+                lines.append(["", 0.0, y])
+            if part.strip():
+                lines[-1][0] += part
+                lines[-1][1] = max(lines[-1][1], size)
+
+    text = page.extract_text(visitor_text=visit)
+    return text, [(line.strip(), size) for line, size, _ in lines if line.strip()]
+
+
+def _body_size(pages: List[List[Tuple[str, float]]]) -> float:
+    """Font size of the bulk of the text (median weighted by characters)."""
+    sizes = sorted((size, len(line)) for lines in pages for line, size in lines)
+    total = sum(weight for _, weight in sizes)
+    seen = 0
+    for size, weight in sizes:
+        seen += weight
+        if seen * 2 >= total:
+            return size
+    return 0.0
+
+
+def _is_heading(line: str, size: float, body_size: float) -> bool:
+    if len(line) > MAX_HEADING_CHARS or sum(c.isalpha() for c in line) < 3:
+        return False
+    if _normalize_heading(line) in SECTION_NAMES:
+        return True
+    if body_size and size >= body_size * HEADING_SIZE_RATIO:
+        return not line.endswith((".", ",", ";"))
+    return False
+
+
+def detect_sections(page_lines: List[List[Tuple[str, float]]]) -> List[Section]:
+    """Group lines into sections at headings found by font size or by name."""
+    body_size = _body_size(page_lines)
+    sections: List[Section] = []
+    title, first_page, body = "", 1, []
+    for number, lines in enumerate(page_lines, 1):
+        for line, size in lines:
+            if _is_heading(line, size, body_size):
+                if body or title:
+                    sections.append(Section(title, first_page, "\n".join(body)))
+                title, first_page, body = line, number, []
+            else:
+                body.append(line)
+    if body or title:
+        sections.append(Section(title, first_page, "\n".join(body)))
+    return sections
+
+
+def extract_pdf_text(pdf_path: str, sha256: str) -> PdfText:
+    """Extract page text and sections from a PDF (runs in a worker process)."""
+    reader = PdfReader(pdf_path)
+    if reader.is_encrypted:
+        reader.decrypt("")
+    pages = []
+    page_lines = []
+    for page in reader.pages:
+        text, lines = _page_lines(page)
+        pages.append(text.strip())
+        page_lines.append(lines)
+    return PdfText(sha256=sha256, pages=pages, sections=detect_sections(page_lines))
+
+
+class PdfTextCache:
+    """Extracted text by PDF content hash, in memory and optionally on disk."""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 256):
+        """
+        Args:
+            cache_dir: Directory for JSON copies that survive restarts
+                (defaults to PDF_TEXT_CACHE_DIR; memory only when unset)
+            max_entries: Documents kept in memory
+        """
+        self.cache_dir = (
+            cache_dir if cache_dir is not None else default_text_cache_dir()
+        )
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, PdfText]" = OrderedDict()
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _file(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, f"{sha256}.v{EXTRACTION_VERSION}.json")
+
+    def _remember(self, text: PdfText) -> None:
+        with self._lock:
+            self._entries[text.sha256] = text
+            self._entries.move_to_end(text.sha256)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, sha256: str) -> Optional[PdfText]:
+        with self._lock:
+            text = self._entries.get(sha256)
+            if text is not None:
+                self._entries.move_to_end(sha256)
+                return text
+        if not self.cache_dir or not os.path.exists(self._file(sha256)):
+            return None
+        try:
+            with open(self._file(sha256), encoding="utf-8") as f:
+                text = PdfText.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable text cache entry {sha256}: {str(e)}")
+            return None
+        self._remember(text)
+        return text
+
+    def put(self, text: PdfText) -> None:
+        self._remember(text)
+        if not self.cache_dir:
+            return
+        path = self._file(text.sha256)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(text.as_dict(), f, ensure_ascii=False)
+        os.replace(temp, path)
+
+
+class PdfTextExtractor:
+    """Extracts PDF text in a process pool, caching results by content hash."""
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        cache: Optional[PdfTextCache] = None,
+        payload_registry: Optional[PdfPayloadRegistry] = None,
+    ):
+        """
+        Args:
+            max_workers: Worker processes (defaults to the number of CPUs)
+            cache: Where extracted text is cached (defaults to PdfTextCache())
+            payload_registry: Supplies memoized content hashes (defaults to
+                the shared registry)
+        """
+        self.max_workers = max_workers
+        self.cache = cache if cache is not None else PdfTextCache()
+        self.payload_registry = (
+            payload_registry if payload_registry is not None else default_pdf_registry
+        )
+        self._pools: Dict[int, ProcessPoolExecutor] = {}
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # A pool inherited through fork cannot be used, so keep one per process
+        pid = os.getpid()
+        with self._lock:
+            pool = self._pools.get(pid)
+            if pool is None:
+                pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                self._pools[pid] = pool
+            return pool
+
+    def extract_many(self, pdf_paths: Sequence[str]) -> Dict[str, PdfText]:
+        """Extract every PDF, parsing each distinct document once.
+
+        Returns:
+            Dict mapping each input path to its PdfText
+        """
+        if PdfReader is None:
+            raise ImportError("pypdf is required to extract PDF text")
+
+        shas = {path: self.payload_registry.sha256_for(path) for path in pdf_paths}
+        texts: Dict[str, PdfText] = {}
+        missing: Dict[str, str] = {}
+        for path, sha256 in shas.items():
+            if sha256 in texts or sha256 in missing:
+                continue
+            cached = self.cache.get(sha256)
+            if cached is not None:
+                texts[sha256] = cached
+            else:
+                missing[sha256] = path
+
+        if missing:
+            pool = self._pool()
+            futures = [
+                pool.submit(extract_pdf_text, path, sha256)
+                for sha256, path in missing.items()
+            ]
+            for future in as_completed(futures):
+                text = future.result()
+                self.cache.put(text)
+                texts[text.sha256] = text
+            logger.info(f"Extracted text from {len(missing)} PDFs")
+
+        return {path: texts[sha256] for path, sha256 in shas.items()}
+
+    def extract(self, pdf_path: str) -> PdfText:
+        return self.extract_many([pdf_path])[pdf_path]
+
+    async def aextract(self, pdf_path: str) -> PdfText:
+        """Async version of extract(); parsing still happens in the pool."""
+        return await asyncio.to_thread(self.extract, pdf_path)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool = self._pools.pop(os.getpid(), None)
+        if pool is not None:
+            pool.shutdown()
+
+
+# Shared by PaperAnalysisService instances in the process
+default_text_extractor = PdfTextExtractor()
@@ -0,0 +1,233 @@
+"""Checkpointed dependency-graph executor for multi-step analyses.
+
+A pipeline is a set of named nodes, each a function of the outputs of the
+nodes it depends on. Nodes whose dependencies are done run concurrently, and
+every node's output is checkpointed as soon as it completes. Running the
+same pipeline again under the same run id skips the checkpointed nodes, so a
+failure costs the failed step rather than everything before it.
+
+Example:
+    executor = PipelineExecutor(
+        [
+            PipelineNode("analysis", analyze),
+            PipelineNode("suggestions", suggest, depends_on=("analysis",)),
+        ],
+        checkpoints=FileCheckpointStore("checkpoints"),
+    )
+    outputs = executor.run(run_id=pdf_sha256)
+"""
+
+import contextvars
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from dhg.core.exceptions import PipelineError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PipelineNode:
+    """A step called with the outputs of depends_on as keyword arguments."""
+
+    name: str
+    func: Callable[..., Any]
+    depends_on: Sequence[str] = ()
+
+
+class CheckpointStore:
+    """Where node outputs are kept between runs; outputs must be JSON-serializable."""
+
+    def load(self, run_id: str) -> Dict[str, Any]:
+        """Outputs of the completed nodes of a run, by node name."""
+        raise NotImplementedError
+
+    def save(self, run_id: str, node: str, output: Any) -> None:
+        raise NotImplementedError
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    """Checkpoints for the lifetime of the process only."""
+
+    def __init__(self) -> None:
+        self._runs: Dict[str, Dict[str, Any]] = {}
+
+    def load(self, run_id: str) -> Dict[str, Any]:
+        return dict(self._runs.get(run_id, {}))
+
+    def save(self, run_id: str, node: str, output: Any) -> None:
+        self._runs.setdefault(run_id, {})[node] = output
+
+
+class FileCheckpointStore(CheckpointStore):
+    """One JSON file per node under directory/run_id/."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _run_dir(self, run_id: str) -> str:
+        return os.path.join(self.directory, run_id)
+
+    def load(self, run_id: str) -> Dict[str, Any]:
+        run_dir = self._run_dir(run_id)
+        if not os.path.isdir(run_dir):
+            return {}
+        outputs = {}
+        for filename in os.listdir(run_dir):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(run_dir, filename), encoding="utf-8") as f:
+                    outputs[filename[: -len(".json")]] = json.load(f)["output"]
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Ignoring unreadable checkpoint {filename}: {str(e)}")
+        return outputs
+
+    def save(self, run_id: str, node: str, output: Any) -> None:
+        run_dir = self._run_dir(run_id)
+        os.makedirs(run_dir, exist_ok=True)
+        path = os.path.join(run_dir, f"{node}.json")
+        # Write then rename, so a crash never leaves a half-written checkpoint
+        temp = f"{path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump({"output": output}, f, ensure_ascii=False)
+        os.replace(temp, path)
+
+
+class SupabaseCheckpointStore(CheckpointStore):
+    """Checkpoints in a Supabase table (see create_pipeline_checkpoints.sql)."""
+
+    def __init__(self, client: Any, table: str = "pipeline_checkpoints"):
+        """
+        Args:
+            client: Supabase client
+            table: Table with a unique (run_id, node) constraint
+        """
+        self.client = client
+        self.table = table
+
+    def load(self, run_id: str) -> Dict[str, Any]:
+        response = (
+            self.client.table(self.table)
+            .select("node, output")
+            .eq("run_id", run_id)
+            .execute()
+        )
+        return {row["node"]: row["output"] for row in response.data or []}
+
+    def save(self, run_id: str, node: str, output: Any) -> None:
+        self.client.table(self.table).upsert(
+            {"run_id": run_id, "node": node, "output": output},
+            on_conflict="run_id,node",
+        ).execute()
+
+
+class PipelineExecutor:
+    """Runs PipelineNodes in dependency order, concurrently where possible."""
+
+    def __init__(
+        self,
+        nodes: Sequence[PipelineNode],
+        checkpoints: Optional[CheckpointStore] = None,
+        max_workers: int = 4,
+    ):
+        """
+        Args:
+            nodes: Steps of the pipeline
+            checkpoints: Where outputs are kept between runs (defaults to
+                memory, which only resumes within the process)
+            max_workers: Nodes running at once
+        """
+        self.nodes = {node.name: node for node in nodes}
+        if len(self.nodes) != len(nodes):
+            raise ValueError("Pipeline node names must be unique")
+        self.checkpoints = (
+            checkpoints if checkpoints is not None else MemoryCheckpointStore()
+        )
+        self.max_workers = max_workers
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order: List[str] = []
+        state: Dict[str, str] = {}
+
+        def visit(name: str, path: List[str]) -> None:
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Pipeline has a cycle: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dependency in self.nodes[name].depends_on:
+                if dependency not in self.nodes:
+                    raise ValueError(f"{name} depends on unknown node {dependency}")
+                visit(dependency, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name, [])
+        return order
+
+    def run(self, run_id: str) -> Dict[str, Any]:
+        """Run every node not yet checkpointed under run_id.
+
+        Returns:
+            Dict of every node's output
+
+        Raises:
+            PipelineError: For the first node that fails. Nodes already
+                running are allowed to finish and are checkpointed; nodes
+                that depend on the failed one are not started.
+        """
+        outputs = {
+            name: output
+            for name, output in self.checkpoints.load(run_id).items()
+            if name in self.nodes
+        }
+        if outputs:
+            logger.info(f"Resuming {run_id} with {sorted(outputs)} checkpointed")
+
+        running: Dict[Future, str] = {}
+        failure: Optional[PipelineError] = None
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            while True:
+                if failure is None:
+                    started = set(running.values())
+                    for name in self.order:
+                        node = self.nodes[name]
+                        if name in outputs or name in started:
+                            continue
+                        if all(dep in outputs for dep in node.depends_on):
+                            kwargs = {dep: outputs[dep] for dep in node.depends_on}
+                            # Carry the caller's context (e.g. claude_label)
+                            future = executor.submit(
+                                contextvars.copy_context().run, node.func, **kwargs
+                            )
+                            running[future] = name
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        output = future.result()
+                    except Exception as e:
+                        logger.error(f"Pipeline node {name} failed: {str(e)}")
+                        if failure is None:
+                            failure = PipelineError(
+                                f"Pipeline node {name} failed: {str(e)}",
+                                node=name,
+                                original_error=e,
+                            )
+                        continue
+                    self.checkpoints.save(run_id, name, output)
+                    outputs[name] = output
+
+        if failure is not None:
+            raise failure
+        return outputs
@@ -0,0 +1,81 @@
+"""Answer several prompts about one document in a single request.
+
+Prompts that each ask an independent question about the same document can
+be fused: the questions are sent together, each in a delimited section
+tagged with the field its answer goes in, and Claude reports every answer in
+one call to a tool whose input schema has one field per prompt, typed by
+that prompt's own schema. The tool input is then split back into
+per-prompt results. The document is uploaded and processed once instead of
+once per prompt.
+
+Example:
+    prompts = [
+        FusedPrompt("analysis", PAPER_ANALYSIS_PROMPT, PAPER_ANALYSIS_SCHEMA),
+        FusedPrompt("source", SOURCE_QUERY_PROMPT, SOURCE_QUERY_SCHEMA),
+    ]
+    results = pdf_processor.process_fused(prompts)
+    results["source"]["title"]
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Sequence
+
+from dhg.services.structured_output import StructuredTool
+
+FUSED_TOOL_NAME = "report_task_results"
+
+FUSED_PROMPT_TEMPLATE = """Complete each of the following tasks about the \
+document. The tasks are independent: answer each one fully, as if it had been \
+asked on its own. Report every answer in a single call to {tool}, putting \
+each task's answer in the field named by the task's tag. Where a task asks \
+for a format, the field's schema takes its place.
+
+{tasks}"""
+
+
+@dataclass(frozen=True)
+class FusedPrompt:
+    """A prompt that can share a request, and the schema of its answer."""
+
+    name: str
+    prompt: str
+    schema: Dict[str, Any] = field(default_factory=lambda: {"type": "string"})
+
+
+def _check_names(prompts: Sequence[FusedPrompt]) -> None:
+    names = [p.name for p in prompts]
+    if not names:
+        raise ValueError("No prompts to fuse")
+    if len(set(names)) != len(names):
+        raise ValueError(f"Fused prompt names must be unique: {names}")
+    for name in names:
+        if not name.isidentifier():
+            raise ValueError(f"Fused prompt name {name!r} is not an identifier")
+
+
+def fused_tool(prompts: Sequence[FusedPrompt]) -> StructuredTool:
+    """Tool with one required field per prompt, typed by its schema."""
+    _check_names(prompts)
+    return StructuredTool(
+        FUSED_TOOL_NAME,
+        "Report the answer to every task, one field per task.",
+        {
+            "type": "object",
+            "properties": {p.name: p.schema for p in prompts},
+            "required": [p.name for p in prompts],
+        },
+    )
+
+
+def fused_prompt(prompts: Sequence[FusedPrompt]) -> str:
+    """One prompt holding every task in a section tagged with its field."""
+    _check_names(prompts)
+    tasks = "\n\n".join(
+        f'<task field="{p.name}">\n{p.prompt.strip()}\n</task>' for p in prompts
+    )
+    return FUSED_PROMPT_TEMPLATE.format(tool=FUSED_TOOL_NAME, tasks=tasks)
+
+
+def split_answer(answer: Dict[str, Any], prompts: Sequence[FusedPrompt]) -> Dict:
+    """Per-prompt results from the fused tool input, in prompt order."""
+    return {p.name: answer[p.name] for p in prompts}
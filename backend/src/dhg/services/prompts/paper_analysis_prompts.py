@@ -185,3 +185,116 @@ Please ensure all responses are:
 - Supported by examples from the paper
 - Constructive and improvement-focused
 - Considerate of both theoretical and practical implications"""
+
+
+# JSON schemas for the structured (tool-use) versions of the prompts above
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+_ASSESSMENT = {
+    "type": "object",
+    "properties": {
+        "aspect": {"type": "string"},
+        "description": {"type": "string"},
+        "impact": {"type": "string"},
+    },
+    "required": ["aspect", "description"],
+}
+
+STRENGTH_WEAKNESS_SCHEMA = {
+    "type": "object",
+    "properties": {"strengths": _STRING_LIST, "weaknesses": _STRING_LIST},
+    "required": ["strengths", "weaknesses"],
+}
+
+IMPROVEMENT_SUGGESTIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "suggestions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "recommendation": {"type": "string"},
+                    "rationale": {"type": "string"},
+                },
+                "required": ["recommendation", "rationale"],
+            },
+        }
+    },
+    "required": ["suggestions"],
+}
+
+SOURCE_QUERY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "authors": _STRING_LIST,
+        "journal": {"type": "string"},
+        "publication_date": {"type": "string"},
+        "doi": {"type": "string"},
+        "volume": {"type": "string"},
+        "issue": {"type": "string"},
+        "pages": {"type": "string"},
+    },
+    "required": ["title", "authors"],
+}
+
+PAPER_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "paper_overview": {
+            "type": "object",
+            "properties": {
+                "research_objectives": {"type": "string"},
+                "theoretical_framework": {"type": "string"},
+                "methodology_summary": {"type": "string"},
+            },
+        },
+        "results_analysis": {
+            "type": "object",
+            "properties": {
+                "key_findings": _STRING_LIST,
+                "evidence_quality": {"type": "string"},
+                "alternative_explanations": {"type": "string"},
+            },
+        },
+        "strengths": {"type": "array", "items": _ASSESSMENT},
+        "weaknesses": {"type": "array", "items": _ASSESSMENT},
+        "improvement_suggestions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "area": {"type": "string"},
+                    "current_state": {"type": "string"},
+                    "recommended_changes": {"type": "string"},
+                    "implementation_steps": _STRING_LIST,
+                    "rationale": {"type": "string"},
+                    "expected_impact": {"type": "string"},
+                },
+                "required": ["area", "recommended_changes"],
+            },
+        },
+        "restructuring_recommendations": {
+            "type": "object",
+            "properties": {
+                "organization": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "section": {"type": "string"},
+                            "current_issues": {"type": "string"},
+                            "suggested_changes": {"type": "string"},
+                            "rationale": {"type": "string"},
+                        },
+                    },
+                },
+                "flow_improvements": {"type": "string"},
+                "clarity_enhancements": {"type": "string"},
+            },
+        },
+    },
+    "required": ["strengths", "weaknesses"],
+}
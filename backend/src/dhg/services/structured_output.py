@@ -0,0 +1,269 @@
+"""Schema-constrained output from Claude, complete or incrementally streamed.
+
+Instead of asking for JSON in the prompt and parsing whatever text comes
+back, a StructuredTool forces Claude to answer by calling a tool whose input
+schema is the shape we want, so the answer is always JSON and never wrapped
+in prose. The result is checked against the schema before it is used.
+
+When the tool input is streamed, IncrementalJsonParser reports every value
+as soon as its closing token arrives. Each field is validated as it
+completes, so a bad answer fails early, and callers can act on (or stop
+after) the fields they need before generation finishes.
+
+Example:
+    tool = StructuredTool("report_analysis", "Report the analysis", SCHEMA)
+    message = service.create_pdf_message(..., **tool.request_params())
+    analysis = tool.parse(message)
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dhg.core.exceptions import AnthropicError
+
+# Location of a value inside a JSON document: object keys and array indices
+JsonPath = Tuple[Any, ...]
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+class StructuredOutputError(AnthropicError):
+    """Raised when Claude's structured answer is missing or does not match its schema"""
+
+    pass
+
+
+def _path_label(path: JsonPath) -> str:
+    return "".join(f"[{p}]" if isinstance(p, int) else f".{p}" for p in path) or "$"
+
+
+def validate(value: Any, schema: Dict[str, Any], path: JsonPath = ()) -> None:
+    """Check value against the subset of JSON Schema used for tool inputs.
+
+    Supports type, properties, required, items and enum.
+
+    Raises:
+        StructuredOutputError: Naming the first offending location
+    """
+    expected = schema.get("type")
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        # bool is an int subclass, but not a JSON number
+        if isinstance(value, bool) and "boolean" not in types:
+            ok = False
+        else:
+            ok = any(isinstance(value, _JSON_TYPES[t]) for t in types)
+        if not ok:
+            raise StructuredOutputError(
+                f"{_path_label(path)}: expected {expected}, "
+                f"got {type(value).__name__}"
+            )
+    if "enum" in schema and value not in schema["enum"]:
+        raise StructuredOutputError(
+            f"{_path_label(path)}: {value!r} is not one of {schema['enum']}"
+        )
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                raise StructuredOutputError(
+                    f"{_path_label(path)}: missing required field {key!r}"
+                )
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                validate(value[key], subschema, path + (key,))
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            validate(item, schema["items"], path + (i,))
+
+
+def schema_at(schema: Dict[str, Any], path: JsonPath) -> Optional[Dict[str, Any]]:
+    """Subschema describing the value at path, or None if the schema is silent."""
+    for part in path:
+        if isinstance(part, int):
+            schema = schema.get("items")
+        else:
+            schema = schema.get("properties", {}).get(part)
+        if schema is None:
+            return None
+    return schema
+
+
+class IncrementalJsonParser:
+    """Parses a JSON document fed in arbitrary chunks, reporting values as they complete.
+
+    feed() returns (path, value) for every value whose last character has
+    arrived, innermost first: the items of an array before the array itself,
+    and the document (path ()) last. Text before the first opening brace or
+    bracket is skipped, so a preamble does not break parsing.
+    """
+
+    def __init__(self, opener: str = "{"):
+        """
+        Args:
+            opener: Character that starts the document, "{" or "["
+        """
+        if opener not in "{[":
+            raise ValueError("opener must be '{' or '['")
+        self.opener = opener
+        self.buffer = ""
+        self.done = False
+        self.value: Any = None
+        self._pos = 0
+        self._started = False
+        # Open containers: [kind, start offset, current key or index, expecting key]
+        self._stack: List[List[Any]] = []
+        self._string_start: Optional[int] = None
+        self._escaped = False
+        self._scalar_start: Optional[int] = None
+
+    def _path(self) -> JsonPath:
+        return tuple(frame[2] for frame in self._stack)
+
+    def _complete(self, start: int, end: int, events: List) -> None:
+        try:
+            value = json.loads(self.buffer[start:end])
+        except ValueError as e:
+            raise StructuredOutputError(f"Invalid JSON at offset {start}: {e}")
+        events.append((self._path(), value))
+        if not self._stack:
+            self.done = True
+            self.value = value
+
+    def feed(self, chunk: str) -> List[Tuple[JsonPath, Any]]:
+        """Add text and return the values it completed."""
+        events: List[Tuple[JsonPath, Any]] = []
+        self.buffer += chunk
+        buffer = self.buffer
+        while self._pos < len(buffer) and not self.done:
+            i = self._pos
+            c = buffer[i]
+            self._pos += 1
+
+            if self._string_start is not None:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    start, self._string_start = self._string_start, None
+                    frame = self._stack[-1]
+                    if frame[0] == "object" and frame[3]:
+                        frame[2] = json.loads(buffer[start : i + 1])
+                        frame[3] = False
+                    else:
+                        self._complete(start, i + 1, events)
+                continue
+
+            if self._scalar_start is not None:
+                if c not in ",}] \t\r\n":
+                    continue
+                start, self._scalar_start = self._scalar_start, None
+                self._complete(start, i, events)
+
+            if not self._started:
+                if c == self.opener:
+                    self._started = True
+                    self._stack.append(
+                        ["object" if c == "{" else "array", i, 0, c == "{"]
+                    )
+                continue
+
+            if c in " \t\r\n:":
+                continue
+            if c == "{":
+                self._stack.append(["object", i, None, True])
+            elif c == "[":
+                self._stack.append(["array", i, 0, False])
+            elif c in "}]":
+                frame = self._stack.pop()
+                self._complete(frame[1], i + 1, events)
+            elif c == ",":
+                frame = self._stack[-1]
+                if frame[0] == "object":
+                    frame[3] = True
+                else:
+                    frame[2] += 1
+            elif c == '"':
+                self._string_start = i
+            else:
+                self._scalar_start = i
+        return events
+
+    def close(self) -> Any:
+        """The parsed document; raises if the input ended before it was complete."""
+        if not self.done:
+            raise StructuredOutputError("Structured output ended before the JSON did")
+        return self.value
+
+
+def iter_json_values(
+    chunks: Iterable[str],
+    schema: Optional[Dict[str, Any]] = None,
+    opener: str = "{",
+) -> Iterator[Tuple[JsonPath, Any]]:
+    """Parse streamed JSON, yielding each (path, value) as it completes.
+
+    Every value is validated against its part of schema when it completes.
+    Stopping the iteration stops consuming chunks, which for a Claude stream
+    closes the request.
+
+    Raises:
+        StructuredOutputError: On invalid JSON, a schema violation, or a
+            stream that ends early
+    """
+    parser = IncrementalJsonParser(opener)
+    for chunk in chunks:
+        for path, value in parser.feed(chunk):
+            if schema is not None:
+                subschema = schema_at(schema, path)
+                if subschema is not None:
+                    validate(value, subschema, path)
+            yield path, value
+        if parser.done:
+            return
+    parser.close()
+
+
+@dataclass(frozen=True)
+class StructuredTool:
+    """A tool Claude is forced to call, whose input is the structured answer."""
+
+    name: str
+    description: str
+    input_schema: Dict[str, Any]
+
+    @property
+    def definition(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "input_schema": self.input_schema,
+        }
+
+    def request_params(self) -> Dict[str, Any]:
+        """tools and tool_choice for a Messages API request."""
+        return {
+            "tools": [self.definition],
+            "tool_choice": {"type": "tool", "name": self.name},
+        }
+
+    def parse(self, message: Any) -> Any:
+        """The validated tool input from a complete Message."""
+        for block in message.content:
+            if getattr(block, "type", None) == "tool_use" and block.name == self.name:
+                validate(block.input, self.input_schema)
+                return block.input
+        raise StructuredOutputError(f"Claude did not call {self.name}")
+
+    def iter_fields(self, chunks: Iterable[str]) -> Iterator[Tuple[JsonPath, Any]]:
+        """Validated (path, value) pairs from streamed tool input JSON."""
+        return iter_json_values(chunks, self.input_schema)
@@ -1,6 +1,8 @@
 import pytest
 import os
 import sys
+from unittest.mock import Mock
+
 from dhg import create_app
 from dhg.core.config import TestConfig
 
@@ -25,3 +27,34 @@ def client(app):
 def runner(app):
     """A test runner for the app's Click commands."""
     return app.test_cli_runner()
+
+
+def fake_message(text, cache_read=0, cache_write=0):
+    """Mock Claude Message with one text block and usage."""
+    message = Mock()
+    message.content = [Mock(text=text)]
+    message.usage = Mock(
+        input_tokens=100,
+        output_tokens=20,
+        cache_creation_input_tokens=cache_write,
+        cache_read_input_tokens=cache_read,
+    )
+    return message
+
+
+def fake_tool_message(tool_input, name):
+    """Mock Claude Message answering by calling the tool name."""
+    block = Mock(type="tool_use", input=tool_input)
+    # Mock(name=...) names the mock itself rather than setting .name
+    block.name = name
+    message = fake_message("")
+    message.content = [block]
+    return message
+
+
+@pytest.fixture
+def sample_pdf(tmp_path):
+    """Path of a minimal PDF file."""
+    pdf_path = tmp_path / "sample.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4\n%test document\n%%EOF\n")
+    return str(pdf_path)
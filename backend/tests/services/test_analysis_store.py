@@ -0,0 +1,134 @@
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.analysis_store import (
+    AnalysisKey,
+    SqliteAnalysisStore,
+    SupabaseAnalysisStore,
+    TieredAnalysisStore,
+)
+from dhg.services.paper_analysis_service import (
+    PAPER_ANALYSIS_TOOL,
+    PaperAnalysisService,
+)
+from dhg.services.pdf_anthropic import PdfAnthropic
+from dhg.services.pdf_payload import PdfPayloadRegistry
+from tests.conftest import fake_message, fake_tool_message
+
+MODEL = "claude-3-5-sonnet-20241022"
+ANALYSIS = {
+    "strengths": [{"aspect": "writing", "description": "clear"}],
+    "weaknesses": [{"aspect": "sample", "description": "small"}],
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SqliteAnalysisStore(str(tmp_path / "analysis.db"))
+
+
+def test_key_separates_paper_prompt_and_model(store):
+    key = AnalysisKey.for_prompt("pdf-a", "Summarize", MODEL)
+    store.put(key, {"strengths": ["clear"]})
+
+    assert store.get(key) == {"strengths": ["clear"]}
+    assert store.get(AnalysisKey.for_prompt("pdf-b", "Summarize", MODEL)) is None
+    assert store.get(AnalysisKey.for_prompt("pdf-a", "Critique", MODEL)) is None
+    assert store.get(AnalysisKey.for_prompt("pdf-a", "Summarize", "other")) is None
+    assert AnalysisKey.for_prompt(
+        "a", "p", MODEL, system="s"
+    ) != AnalysisKey.for_prompt("a", "p", MODEL)
+
+
+def test_tiered_store_falls_back_when_supabase_is_down(store):
+    supabase = Mock()
+    supabase.table.side_effect = ConnectionError("unreachable")
+    tiered = TieredAnalysisStore([store, SupabaseAnalysisStore(supabase)])
+    key = AnalysisKey.for_prompt("pdf-a", "Summarize", MODEL)
+
+    tiered.put(key, "answer")
+
+    assert tiered.get(key) == "answer"
+    assert store.get(key) == "answer"
+
+
+def test_tiered_store_backfills_local_copy_from_supabase(store):
+    supabase = Mock()
+    query = supabase.table.return_value.select.return_value
+    query = query.eq.return_value.eq.return_value.eq.return_value
+    query.limit.return_value.execute.return_value = Mock(
+        data=[{"result": "shared answer"}]
+    )
+    tiered = TieredAnalysisStore([store, SupabaseAnalysisStore(supabase)])
+    key = AnalysisKey.for_prompt("pdf-a", "Summarize", MODEL)
+
+    assert tiered.get(key) == "shared answer"
+    assert store.get(key) == "shared answer"
+
+
+def test_independent_prompts_only_run_when_not_stored(store, sample_pdf):
+    service = Mock(model_name=MODEL)
+    service.create_pdf_message.side_effect = lambda **kwargs: fake_message("fresh")
+    processor = PdfAnthropic(service, sample_pdf, result_store=store)
+
+    processor.process_pdf(custom_prompts=["p0", "p1"], mode="independent")
+    responses = processor.process_pdf(
+        custom_prompts=["p0", "p1", "p2"], mode="independent"
+    )
+
+    assert responses == ["fresh", "fresh", "fresh"]
+    # The second run only sent the new prompt
+    assert service.create_pdf_message.call_count == 3
+
+
+def test_fully_stored_run_does_not_encode_the_pdf(store, sample_pdf):
+    service = Mock(model_name=MODEL)
+    service.create_pdf_message.side_effect = lambda **kwargs: fake_message("fresh")
+    PdfAnthropic(service, sample_pdf, result_store=store).process_pdf(
+        custom_prompts=["p0", "p1"], mode="independent"
+    )
+    registry = PdfPayloadRegistry()
+    processor = PdfAnthropic(
+        service, sample_pdf, result_store=store, payload_registry=registry
+    )
+
+    responses = processor.process_pdf(custom_prompts=["p0", "p1"], mode="independent")
+
+    assert responses == ["fresh", "fresh"]
+    assert service.create_pdf_message.call_count == 2
+    assert registry.stats.misses == 0
+
+
+def test_analysis_steps_are_read_from_the_store(store, sample_pdf):
+    service = Mock(model_name=MODEL)
+    service.create_pdf_message.return_value = fake_tool_message(
+        ANALYSIS, PAPER_ANALYSIS_TOOL.name
+    )
+    service.call_claude_structured.return_value = {
+        "suggestions": [{"recommendation": "grow", "rationale": "power"}]
+    }
+    processor = PdfAnthropic(service, sample_pdf)
+    analysis_service = PaperAnalysisService(processor, result_store=store)
+
+    for _ in range(2):
+        analysis = analysis_service.extract_strengths_and_weaknesses()
+        suggestions = analysis_service.generate_improvement_suggestions(analysis)
+
+    assert analysis == ANALYSIS
+    assert suggestions == [{"recommendation": "grow", "rationale": "power"}]
+    assert service.create_pdf_message.call_count == 1
+    assert service.call_claude_structured.call_count == 1
+
+
+def test_suggestions_do_not_resend_the_document(store, sample_pdf):
+    service = Mock(model_name=MODEL)
+    service.call_claude_structured.return_value = {"suggestions": []}
+    processor = PdfAnthropic(service, sample_pdf)
+    analysis_service = PaperAnalysisService(processor, result_store=store)
+
+    analysis_service.generate_improvement_suggestions(ANALYSIS)
+
+    service.create_pdf_message.assert_not_called()
+    (message,) = service.call_claude_structured.call_args.kwargs["messages"]
+    assert [block["type"] for block in message["content"]] == ["text"]
+    assert "clear" in message["content"][0]["text"]
@@ -0,0 +1,134 @@
+import json
+
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.anthropic_batch_results import (
+    BatchResultStreamer,
+    JsonlResultSink,
+    SupabaseResultSink,
+)
+from dhg.services.anthropic_batches import BatchJobManager, BatchJobStore
+
+
+def _entry(custom_id, text):
+    result = Mock()
+    result.type = "succeeded"
+    result.message.content = [Mock(text=text)]
+    result.message.usage = Mock(input_tokens=100, output_tokens=10)
+    return Mock(custom_id=custom_id, result=result)
+
+
+def _client(count, fail_at=None):
+    client = Mock()
+
+    def results(batch_id):
+        for i in range(count):
+            if i == fail_at:
+                raise ConnectionError("stream dropped")
+            yield _entry(f"r{i}", f"answer {i}")
+
+    client.messages.batches.results.side_effect = results
+    return client
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BatchJobStore(str(tmp_path / "batches.db"))
+    store.add_batch("batch_1", {f"r{i}": {"prompt_index": i} for i in range(5)})
+    return store
+
+
+def _lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_results_stream_to_jsonl_with_metadata(tmp_path, store):
+    path = tmp_path / "out" / "{batch_id}.jsonl"
+    streamer = BatchResultStreamer(
+        _client(5), [JsonlResultSink(str(path))], store, chunk_size=2
+    )
+
+    assert streamer.stream("batch_1") == 5
+
+    rows = _lines(tmp_path / "out" / "batch_1.jsonl")
+    assert [row["custom_id"] for row in rows] == ["r0", "r1", "r2", "r3", "r4"]
+    assert rows[3]["metadata"] == {"prompt_index": 3}
+    assert rows[0]["result"] == "answer 0"
+    assert rows[0]["input_tokens"] == 100
+    # A completed batch is not streamed again
+    assert streamer.stream("batch_1") == 0
+
+
+def test_interrupted_stream_resumes_from_checkpoint(tmp_path, store):
+    path = str(tmp_path / "results.jsonl")
+    supabase = Mock()
+    sinks = [JsonlResultSink(path), SupabaseResultSink(supabase)]
+
+    with pytest.raises(ConnectionError):
+        BatchResultStreamer(_client(5, fail_at=3), sinks, store, chunk_size=2).stream(
+            "batch_1"
+        )
+    assert [row["custom_id"] for row in _lines(path)] == ["r0", "r1"]
+
+    written = BatchResultStreamer(_client(5), sinks, store, chunk_size=2).stream(
+        "batch_1"
+    )
+
+    assert written == 3
+    assert [row["custom_id"] for row in _lines(path)] == ["r0", "r1", "r2", "r3", "r4"]
+    upserted = [
+        row["custom_id"]
+        for call in supabase.table.return_value.upsert.call_args_list
+        for row in call.args[0]
+    ]
+    assert upserted == ["r0", "r1", "r2", "r3", "r4"]
+
+
+def test_rows_past_the_checkpoint_are_rolled_back_on_resume(tmp_path, store):
+    path = str(tmp_path / "results.jsonl")
+    sink = JsonlResultSink(path)
+    store.save_checkpoint("batch_1", sink.key, 0, {sink.key: {"offset": 0}})
+    with open(path, "w") as f:
+        f.write('{"custom_id": "r0", "partial": tru')
+
+    BatchResultStreamer(_client(5), [sink], store).stream("batch_1")
+
+    assert len(_lines(path)) == 5
+
+
+def test_resume_keeps_other_batches_rows_in_a_shared_file(tmp_path, store):
+    path = str(tmp_path / "results.jsonl")
+    sink = JsonlResultSink(path)
+    store.add_batch("batch_2", {})
+    store.save_checkpoint("batch_1", sink.key, 0, {sink.key: {"offset": 0}})
+    with open(path, "w") as f:
+        f.write('{"batch_id": "batch_1", "custom_id": "r0"}\n')
+        f.write('{"batch_id": "batch_2", "custom_id": "s0"}\n')
+
+    BatchResultStreamer(_client(5), [sink], store).stream("batch_1")
+
+    rows = _lines(path)
+    assert [row["custom_id"] for row in rows if row["batch_id"] == "batch_1"] == [
+        "r0",
+        "r1",
+        "r2",
+        "r3",
+        "r4",
+    ]
+    assert {"batch_id": "batch_2", "custom_id": "s0"} in rows
+
+
+def test_manager_streams_ended_batches_instead_of_storing_them(tmp_path, store):
+    client = _client(5)
+    client.messages.batches.retrieve.return_value = Mock(processing_status="ended")
+    path = str(tmp_path / "results.jsonl")
+    streamer = BatchResultStreamer(client, [JsonlResultSink(path)], store)
+    store.update_job("batch_1", next_poll_at=0)
+
+    BatchJobManager(client, store, min_interval=0, streamer=streamer).run()
+
+    assert len(_lines(path)) == 5
+    assert store.get_job("batch_1")["collected"]
+    assert store.results("batch_1") == []
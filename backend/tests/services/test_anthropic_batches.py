@@ -0,0 +1,99 @@
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.anthropic_batches import BatchJobManager, BatchJobStore
+
+
+def _batch(status, done=0, batch_id="batch_1"):
+    counts = Mock(succeeded=done, errored=0, canceled=0, expired=0)
+    return Mock(id=batch_id, processing_status=status, request_counts=counts)
+
+
+def _entry(custom_id, text=None):
+    result = Mock()
+    if text is None:
+        result.type = "errored"
+        result.error = "invalid_request"
+    else:
+        result.type = "succeeded"
+        result.message.content = [Mock(text=text)]
+    return Mock(custom_id=custom_id, result=result)
+
+
+def _requests(*custom_ids):
+    return [{"custom_id": custom_id, "params": {}} for custom_id in custom_ids]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BatchJobStore(str(tmp_path / "batches.db"))
+
+
+def test_submit_persists_batch_and_request_routing(store):
+    client = Mock()
+    client.messages.batches.create.return_value = _batch("in_progress")
+    manager = BatchJobManager(client, store)
+
+    batch_id = manager.submit(
+        _requests("a", "b"), request_metadata={"a": {"paper": "x.pdf"}}
+    )
+
+    assert store.get_job(batch_id)["status"] == "in_progress"
+    assert store.request_metadata(batch_id) == {"a": {"paper": "x.pdf"}, "b": None}
+
+
+def test_poll_interval_backs_off_without_progress_and_resets_on_progress(store):
+    client = Mock()
+    client.messages.batches.create.return_value = _batch("in_progress")
+    manager = BatchJobManager(client, store, min_interval=0, max_interval=300)
+    batch_id = manager.submit(_requests("a", "b"))
+    store.update_job(batch_id, poll_interval=10)
+
+    client.messages.batches.retrieve.return_value = _batch("in_progress", done=0)
+    manager.poll_once()
+    assert store.get_job(batch_id)["poll_interval"] == 20
+
+    store.update_job(batch_id, next_poll_at=0)
+    client.messages.batches.retrieve.return_value = _batch("in_progress", done=1)
+    manager.poll_once()
+    assert store.get_job(batch_id)["poll_interval"] == 0
+
+
+def test_restarted_manager_resumes_open_batches(store):
+    client = Mock()
+    client.messages.batches.create.return_value = _batch("in_progress")
+    BatchJobManager(client, store, min_interval=0).submit(_requests("a", "b"))
+
+    # A fresh manager (e.g. after a crash) finds the batch in the store
+    client.messages.batches.retrieve.return_value = _batch("ended", done=2)
+    client.messages.batches.results.return_value = iter(
+        [_entry("a", "summary"), _entry("b")]
+    )
+    on_result = Mock()
+    BatchJobManager(client, store, min_interval=0).run(on_result=on_result)
+
+    results = store.results("batch_1")
+    assert [(r["custom_id"], r["result_type"]) for r in results] == [
+        ("a", "succeeded"),
+        ("b", "errored"),
+    ]
+    assert results[0]["result"] == "summary"
+    assert store.get_job("batch_1")["collected"]
+    assert on_result.call_count == 2
+    assert store.open_jobs() == []
+
+
+def test_one_loop_polls_many_batches(store):
+    client = Mock()
+    client.messages.batches.create.side_effect = [
+        _batch("in_progress", batch_id=f"batch_{i}") for i in range(3)
+    ]
+    manager = BatchJobManager(client, store, min_interval=0)
+    for i in range(3):
+        manager.submit(_requests(f"r{i}"))
+    client.messages.batches.retrieve.side_effect = lambda batch_id: _batch(
+        "ended", batch_id=batch_id
+    )
+    client.messages.batches.results.side_effect = lambda batch_id: iter([])
+
+    assert sorted(manager.poll_once()) == ["batch_0", "batch_1", "batch_2"]
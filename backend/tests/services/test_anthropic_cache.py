@@ -0,0 +1,181 @@
+import asyncio
+import base64
+import os
+import threading
+import time
+from unittest.mock import Mock
+
+from anthropic.types import Message
+
+from dhg.services.anthropic_cache import (
+    DiskCacheTier,
+    MemoryCacheTier,
+    ResponseCache,
+    make_cache_key,
+)
+from dhg.services.anthropic_service import AnthropicService
+from dhg.services.pdf_payload import PdfPayloadRegistry, document_sha256
+
+
+def _message(text: str) -> Message:
+    return Message.model_validate(
+        {
+            "id": "msg_test",
+            "type": "message",
+            "role": "assistant",
+            "model": "claude-3-5-sonnet-20241022",
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 10, "output_tokens": 5},
+        }
+    )
+
+
+def test_cache_key_is_stable_and_order_independent():
+    """Equivalent requests hash the same regardless of dict key order."""
+    messages_a = [{"role": "user", "content": "hi"}]
+    messages_b = [{"content": "hi", "role": "user"}]
+
+    key_a = make_cache_key("model", "sys", messages_a, 100, 0.0)
+    key_b = make_cache_key("model", "sys", messages_b, 100, 0.0)
+
+    assert key_a == key_b
+    assert key_a != make_cache_key("model", "sys", messages_a, 200, 0.0)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    tier = MemoryCacheTier(max_entries=2)
+    tier.set("a", {"v": 1})
+    tier.set("b", {"v": 2})
+    tier.get("a")
+    tier.set("c", {"v": 3})
+
+    assert tier.get("a") == {"v": 1}
+    assert tier.get("b") is None
+    assert tier.get("c") == {"v": 3}
+
+
+def test_disk_tier_respects_ttl(tmp_path):
+    tier = DiskCacheTier(tmp_path, ttl=60)
+    tier.set("key", {"v": 1})
+    assert tier.get("key") == {"v": 1}
+
+    stale = time.time() - 120
+    os.utime(tmp_path / "key.json", (stale, stale))
+    assert tier.get("key") is None
+
+
+def test_disk_tier_enforces_size_cap(tmp_path):
+    tier = DiskCacheTier(tmp_path, max_bytes=300, ttl=None)
+    for i in range(10):
+        tier.set(f"key{i}", {"payload": "x" * 50})
+
+    total = sum(p.stat().st_size for p in tmp_path.glob("*.json"))
+    assert total <= 300
+
+
+def test_disk_tier_evicts_least_recently_read_without_listing(tmp_path, monkeypatch):
+    tier = DiskCacheTier(tmp_path, max_bytes=100, ttl=None)
+    tier.set("a", {"payload": "x" * 20})
+    tier.set("b", {"payload": "x" * 20})
+    tier.get("a")
+    monkeypatch.setattr(type(tmp_path), "glob", Mock(side_effect=AssertionError))
+    tier.set("c", {"payload": "x" * 20})
+
+    assert tier.get("a") == {"payload": "x" * 20}
+    assert tier.get("b") is None
+    assert tier.get("c") == {"payload": "x" * 20}
+
+
+def test_disk_tier_size_survives_a_restart(tmp_path):
+    DiskCacheTier(tmp_path, ttl=None).set("a", {"payload": "x" * 50})
+    tier = DiskCacheTier(tmp_path, max_bytes=80, ttl=None)
+    tier.set("b", {"payload": "x" * 50})
+
+    assert not (tmp_path / "a.json").exists()
+    assert tier.get("b") is not None
+
+
+def test_async_lookups_read_disk_in_a_worker_thread(tmp_path):
+    cache = ResponseCache(disk_dir=tmp_path)
+    disk = cache.tiers[1]
+    loop_thread = threading.get_ident()
+    threads = []
+    get = disk.get
+
+    def recording_get(key):
+        threads.append(threading.get_ident())
+        return get(key)
+
+    disk.get = recording_get
+
+    async def run():
+        await cache.aset("key", {"v": 1})
+        cache.tiers[0].clear()
+        return await cache.aget("key")
+
+    assert asyncio.run(run()) == {"v": 1}
+    assert threads and loop_thread not in threads
+    assert cache.stats.disk_hits == 1
+
+
+def test_disk_hit_is_promoted_and_counted(tmp_path):
+    cache = ResponseCache(disk_dir=tmp_path)
+    cache.tiers[1].set("key", {"v": 1})
+
+    assert cache.get("key") == {"v": 1}
+    assert cache.get("key") == {"v": 1}
+    assert cache.get("missing") is None
+    assert cache.stats.disk_hits == 1
+    assert cache.stats.memory_hits == 1
+    assert cache.stats.misses == 1
+
+
+def test_service_serves_temperature_zero_calls_from_cache(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    cache = ResponseCache()
+    service = AnthropicService(response_cache=cache)
+    service.client = Mock()
+    service.client.messages.create.return_value = _message("cached answer")
+
+    messages = [{"role": "user", "content": [{"type": "text", "text": "hi"}]}]
+    first = service.call_claude_pdf_with_messages(100, messages, temperature=0.0)
+    second = service.call_claude_pdf_with_messages(100, messages, temperature=0.0)
+
+    assert first == second == "cached answer"
+    assert service.client.messages.create.call_count == 1
+    assert cache.stats.hits == 1
+
+
+def test_service_does_not_cache_sampled_calls(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    service = AnthropicService(response_cache=ResponseCache())
+    service.client = Mock()
+    service.client.messages.create.return_value = _message("sampled")
+
+    service.call_claude_basic(100, "hi")
+    service.call_claude_basic(100, "hi")
+
+    assert service.client.messages.create.call_count == 2
+
+
+def test_documents_enter_the_key_by_content_hash(tmp_path):
+    pdf = tmp_path / "paper.pdf"
+    pdf.write_bytes(b"%PDF-1.4\n%paper\n%%EOF\n")
+    registry = PdfPayloadRegistry()
+    payload = registry.get(str(pdf))
+
+    def messages(block):
+        return [{"role": "user", "content": [block, {"type": "text", "text": "hi"}]}]
+
+    resident = make_cache_key("m", None, messages(payload.document_block()), 1, 0)
+    # An equal document in another string (e.g. after eviction) keys the same
+    block = payload.document_block()
+    block["source"]["data"] = "".join(list(payload.base64))
+    copied = make_cache_key("m", None, messages(block), 1, 0)
+    block["source"]["data"] = base64.b64encode(b"%PDF-1.4\n%other\n").decode()
+    other = make_cache_key("m", None, messages(block), 1, 0)
+
+    assert resident == copied != other
+    assert document_sha256(payload.base64) == payload.sha256
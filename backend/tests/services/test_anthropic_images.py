@@ -0,0 +1,76 @@
+import base64
+import io
+
+from unittest.mock import Mock
+
+from PIL import Image
+
+from dhg.services.anthropic_images import (
+    MAX_IMAGE_EDGE,
+    detect_media_type,
+    prepare_image,
+)
+from dhg.services.anthropic_service import AnthropicService
+
+
+def _image_bytes(size, mode="RGB", fmt="JPEG"):
+    output = io.BytesIO()
+    Image.new(mode, size, color=(10, 120, 200, 128)[: len(mode)]).save(
+        output, format=fmt
+    )
+    return output.getvalue()
+
+
+def _decoded_size(data_base64):
+    with Image.open(io.BytesIO(base64.b64decode(data_base64))) as image:
+        return image.size
+
+
+def test_detect_media_type_from_signature():
+    assert detect_media_type(_image_bytes((8, 8), fmt="PNG")) == "image/png"
+    assert detect_media_type(_image_bytes((8, 8), fmt="WEBP")) == "image/webp"
+    assert detect_media_type(b"not an image") is None
+
+
+def test_small_image_is_passed_through_with_real_type():
+    data = _image_bytes((200, 100), fmt="PNG")
+
+    encoded, media_type = prepare_image(data)
+
+    assert media_type == "image/png"
+    assert base64.b64decode(encoded) == data
+
+
+def test_large_photo_is_downscaled_to_max_edge():
+    data = _image_bytes((4032, 3024))
+
+    encoded, media_type = prepare_image(data)
+
+    assert media_type == "image/jpeg"
+    assert _decoded_size(encoded) == (MAX_IMAGE_EDGE, 1176)
+
+
+def test_transparent_image_stays_png_when_resized():
+    data = _image_bytes((3000, 1000), mode="RGBA", fmt="PNG")
+
+    encoded, media_type = prepare_image(data)
+
+    assert media_type == "image/png"
+    assert max(_decoded_size(encoded)) == MAX_IMAGE_EDGE
+
+
+def test_call_claude_with_image_sends_every_image(tmp_path):
+    paths = []
+    for i, fmt in enumerate(("PNG", "JPEG")):
+        path = tmp_path / f"figure{i}.{fmt.lower()}"
+        path.write_bytes(_image_bytes((64, 64), fmt=fmt))
+        paths.append(str(path))
+
+    service = AnthropicService(api_key="test-key")
+    service._create_message = Mock(return_value=Mock(content=[Mock(text="ok")]))
+
+    assert service.call_claude_with_image(paths, "Compare these") == "ok"
+
+    content = service._create_message.call_args.kwargs["messages"][0]["content"]
+    media_types = [block["source"]["media_type"] for block in content[1:]]
+    assert media_types == ["image/png", "image/jpeg"]
@@ -0,0 +1,171 @@
+import threading
+
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.anthropic_metrics import (
+    CallRecord,
+    MetricsRecorder,
+    SupabaseMetricsExporter,
+    claude_label,
+)
+from dhg.services.anthropic_retry import RetryPolicy
+from dhg.services.anthropic_service import AnthropicService
+
+
+class _OverloadedError(Exception):
+    status_code = 529
+
+
+def _response(text="ok", input_tokens=120, output_tokens=30):
+    response = Mock()
+    response.content = [Mock(text=text)]
+    response.usage = Mock(
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cache_creation_input_tokens=0,
+        cache_read_input_tokens=100,
+    )
+    return response
+
+
+def _user(text):
+    return {"role": "user", "content": text}
+
+
+def _service(recorder):
+    return AnthropicService(
+        api_key="test-key",
+        metrics=recorder,
+        retry_policy=RetryPolicy(base_delay=0, max_delay=0),
+    )
+
+
+def test_calls_are_recorded_under_the_callers_label():
+    recorder = MetricsRecorder()
+    service = _service(recorder)
+    service.client = Mock()
+    service.client.messages.create.side_effect = [_OverloadedError(), _response()]
+
+    with claude_label("summary"):
+        service.call_claude_basic(max_tokens=100, input_string="Hi")
+
+    stats = recorder.stats("summary", service.model_name)
+    assert stats.calls == 1
+    assert stats.retries == 1
+    assert stats.input_tokens == 120
+    assert stats.cache_read_input_tokens == 100
+
+
+def test_get_completion_is_retried_and_recorded():
+    recorder = MetricsRecorder()
+    service = _service(recorder)
+    service.client = Mock()
+    service.client.messages.create.side_effect = [_OverloadedError(), _response()]
+
+    with claude_label("completion"):
+        text = service.get_completion(service.client, [_user("Hi")])
+
+    assert text == "ok"
+    stats = recorder.stats("completion", service.model_name)
+    assert stats.calls == 1
+    assert stats.retries == 1
+
+
+def test_failed_calls_count_as_errors():
+    recorder = MetricsRecorder()
+    service = _service(recorder)
+    service.client = Mock()
+    service.client.messages.create.side_effect = ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        service.call_claude_basic(max_tokens=100, input_string="Hi")
+
+    assert recorder.snapshot()[0]["errors"] == 1
+
+
+def test_claude_many_labels_reach_worker_threads():
+    recorder = MetricsRecorder()
+    service = _service(recorder)
+    service.client = Mock()
+    service.client.messages.create.return_value = _response()
+
+    with claude_label("batch"):
+        service.call_claude_many(
+            [
+                {"max_tokens": 10, "input_string": "a"},
+                {"max_tokens": 10, "input_string": "b", "label": "special"},
+            ]
+        )
+
+    assert recorder.stats("batch", service.model_name).calls == 1
+    assert recorder.stats("special", service.model_name).calls == 1
+
+
+def test_stream_records_time_to_first_token():
+    recorder = MetricsRecorder()
+    service = _service(recorder)
+    stream = Mock()
+    stream.text_stream = iter(["Hel", "lo"])
+    stream.get_final_message.return_value = _response()
+    service.client = Mock()
+    service.client.messages.stream.return_value.__enter__ = Mock(return_value=stream)
+    service.client.messages.stream.return_value.__exit__ = Mock(return_value=False)
+
+    with claude_label("chat"):
+        assert "".join(service.stream_claude_messages(10, [_user("Hi")])) == "Hello"
+
+    stats = recorder.stats("chat", service.model_name)
+    assert stats.time_to_first_token.count == 1
+    assert stats.output_tokens == 30
+
+
+def test_prometheus_rendering_includes_histograms():
+    recorder = MetricsRecorder()
+    recorder.record(CallRecord(label='say "hi"', model="m", latency=1.5))
+
+    text = recorder.render_prometheus()
+
+    assert 'claude_calls_total{label="say \\"hi\\"",model="m"} 1' in text
+    assert (
+        'claude_latency_seconds_bucket{label="say \\"hi\\"",model="m",le="2"} 1' in text
+    )
+    assert (
+        'claude_latency_seconds_bucket{label="say \\"hi\\"",model="m",le="1"} 0' in text
+    )
+
+
+def test_supabase_exporter_batches_rows():
+    client = Mock()
+    exporter = SupabaseMetricsExporter(client, batch_size=2)
+    recorder = MetricsRecorder(exporters=[exporter])
+
+    recorder.record(CallRecord(label="a", model="m", latency=0.1))
+    client.table.assert_not_called()
+    recorder.record(CallRecord(label="a", model="m", latency=0.2))
+    exporter.flush()
+
+    client.table.assert_called_once_with("claude_call_metrics")
+    rows = client.table.return_value.insert.call_args.args[0]
+    assert [row["latency"] for row in rows] == [0.1, 0.2]
+
+
+def test_supabase_exporter_inserts_off_the_call_path():
+    client = Mock()
+    inserting = threading.Event()
+    release = threading.Event()
+
+    def execute():
+        inserting.set()
+        release.wait(5)
+
+    client.table.return_value.insert.return_value.execute.side_effect = execute
+    exporter = SupabaseMetricsExporter(client, batch_size=1)
+
+    # Returns while the insert is still blocked
+    exporter.export(CallRecord(label="a", model="m", latency=0.1))
+    assert inserting.wait(5)
+    release.set()
+    exporter.flush()
+
+    client.table.return_value.insert.assert_called_once()
@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.anthropic_rate_limiter import (
+    AdaptiveConcurrency,
+    MemoryBucketBackend,
+    RateLimiter,
+    RateLimits,
+    SQLiteBucketBackend,
+)
+
+
+class _OverloadedError(Exception):
+    status_code = 529
+
+
+def test_bucket_take_is_all_or_nothing():
+    """If any bucket is short, nothing is taken and a wait time is returned."""
+    backend = MemoryBucketBackend()
+    rpm = ("rpm", 1, 1, 0.001)
+    tpm = ("tpm", 500, 1000, 10.0)
+
+    assert backend.take([rpm, tpm]) == 0
+    wait = backend.take([rpm, ("tpm", 100, 1000, 10.0)])
+
+    assert wait > 0
+    # The tpm bucket was untouched by the failed take
+    assert backend.take([("tpm", 500, 1000, 10.0)]) == 0
+
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    """Two backends on the same file (e.g. two workers) draw from one bucket."""
+    db_path = str(tmp_path / "limits.db")
+    first = SQLiteBucketBackend(db_path)
+    second = SQLiteBucketBackend(db_path)
+
+    assert first.take([("rpm", 1, 2, 0.001)]) == 0
+    assert second.take([("rpm", 1, 2, 0.001)]) == 0
+    assert first.take([("rpm", 1, 2, 0.001)]) > 0
+
+
+def test_aimd_window_halves_on_overload_and_grows_on_success():
+    window = AdaptiveConcurrency(initial=8, cooldown=0)
+
+    window.acquire()
+    window.release(overloaded=True)
+    assert window.limit == 4
+
+    for _ in range(8):
+        window.acquire()
+        window.release(overloaded=False)
+    assert window.limit == 5
+
+
+def test_aimd_cooldown_ignores_overloads_from_same_burst():
+    window = AdaptiveConcurrency(initial=8, cooldown=60)
+    for _ in range(3):
+        window.acquire()
+        window.release(overloaded=True)
+    assert window.limit == 4
+
+
+def test_limiter_settles_output_reservation_against_usage():
+    """Unused max_tokens are returned to the output bucket after the call."""
+    limiter = RateLimiter(RateLimits(output_tokens_per_minute=1000))
+    params = {"messages": [{"role": "user", "content": "hi"}], "max_tokens": 1000}
+
+    with limiter.limit(params) as slot:
+        slot.record(Mock(input_tokens=5, output_tokens=100))
+
+    # 900 tokens were refunded, so a 900-token reservation fits immediately
+    assert limiter.backend.take([("anthropic:output_tpm", 900, 1000, 1000 / 60)]) == 0
+
+
+def test_limiter_shrinks_window_on_overload_error():
+    limiter = RateLimiter(RateLimits(), concurrency=AdaptiveConcurrency(initial=4))
+
+    with pytest.raises(_OverloadedError):
+        with limiter.limit({"messages": [], "max_tokens": 10}):
+            raise _OverloadedError()
+
+    assert limiter.concurrency.limit == 2
+    assert limiter.concurrency.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_async_limit_acquires_and_releases_slot():
+    limiter = RateLimiter(RateLimits(requests_per_minute=60))
+
+    async with await limiter.alimit({"messages": [], "max_tokens": 10}):
+        assert limiter.concurrency.in_flight == 1
+    assert limiter.concurrency.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_async_limit_runs_sqlite_backend_off_the_event_loop(tmp_path):
+    backend = SQLiteBucketBackend(str(tmp_path / "limits.db"))
+    threads = []
+    take, adjust = backend.take, backend.adjust
+
+    def recording_take(requests):
+        threads.append(threading.get_ident())
+        return take(requests)
+
+    def recording_adjust(*args):
+        threads.append(threading.get_ident())
+        adjust(*args)
+
+    backend.take, backend.adjust = recording_take, recording_adjust
+    limiter = RateLimiter(RateLimits(output_tokens_per_minute=1000), backend=backend)
+
+    async with await limiter.alimit({"messages": [], "max_tokens": 100}) as slot:
+        slot.record(Mock(input_tokens=5, output_tokens=10))
+
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
@@ -0,0 +1,83 @@
+import httpx
+import pytest
+from unittest.mock import Mock
+
+import anthropic
+
+from dhg.services.anthropic_retry import (
+    RetryPolicy,
+    is_retryable,
+    retry_after_seconds,
+)
+
+
+def _status_error(status_code: int, headers=None) -> anthropic.APIStatusError:
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return anthropic.APIStatusError("error", response=response, body=None)
+
+
+def test_classifies_transient_and_permanent_errors():
+    assert is_retryable(_status_error(429))
+    assert is_retryable(_status_error(529))
+    assert is_retryable(_status_error(503))
+    assert not is_retryable(_status_error(400))
+    assert not is_retryable(_status_error(401))
+    assert not is_retryable(ValueError("bad input"))
+
+
+def test_should_retry_header_overrides_status():
+    assert not is_retryable(_status_error(529, {"x-should-retry": "false"}))
+    assert is_retryable(_status_error(400, {"x-should-retry": "true"}))
+
+
+def test_retry_after_headers_are_parsed():
+    assert retry_after_seconds(_status_error(429, {"retry-after": "7"})) == 7.0
+    assert retry_after_seconds(_status_error(429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(_status_error(429)) is None
+
+
+def test_decorrelated_jitter_stays_within_bounds():
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0)
+    delay = policy.base_delay
+    for _ in range(50):
+        delay = policy.next_delay(delay)
+        assert 1.0 <= delay <= 10.0
+
+
+def test_call_retries_transient_errors_then_succeeds(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda _: None)
+    func = Mock(side_effect=[_status_error(529), _status_error(429), "ok"])
+    on_retry = Mock()
+
+    result = RetryPolicy(max_attempts=5).call(func, on_retry=on_retry)
+
+    assert result == "ok"
+    assert func.call_count == 3
+    assert on_retry.call_count == 2
+
+
+def test_call_does_not_retry_permanent_errors(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda _: None)
+    func = Mock(side_effect=_status_error(400))
+
+    with pytest.raises(anthropic.APIStatusError):
+        RetryPolicy().call(func)
+    assert func.call_count == 1
+
+
+def test_call_gives_up_when_retry_after_passes_deadline(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda _: None)
+    func = Mock(side_effect=_status_error(429, {"retry-after": "120"}))
+
+    with pytest.raises(anthropic.APIStatusError):
+        RetryPolicy(deadline=30).call(func)
+    assert func.call_count == 1
+
+
+def test_call_passes_remaining_deadline_to_attempt():
+    func = Mock(return_value="ok")
+    RetryPolicy(deadline=30).call(func)
+
+    remaining = func.call_args.args[0]
+    assert 0 < remaining <= 30
@@ -0,0 +1,176 @@
+import asyncio
+import base64
+import io
+import re
+import sys
+import threading
+
+import pytest
+from unittest.mock import Mock
+
+from dhg.core.exceptions import AnthropicTokenBudgetError
+from dhg.services.anthropic_service import AnthropicService, _pdf_document_block
+from dhg.services.pdf_payload import PdfPayloadRegistry
+from dhg.services.anthropic_tokens import (
+    MODEL_CONTEXT_WINDOW,
+    PDF_TOKENS_PER_PAGE,
+    TokenEstimator,
+    apreflight,
+    count_pdf_pages,
+    default_token_estimator,
+    plan_max_tokens,
+    preflight,
+)
+
+
+def _fake_pdf(pages):
+    body = b"".join(b"<< /Type /Page /Parent 2 0 R >>\n" for _ in range(pages))
+    header = b"<< /Type /Pages /Count " + str(pages).encode() + b" >>\n"
+    return b"%PDF-1.4\n" + header + body
+
+
+def _pdf_params(pages, max_tokens=4096):
+    pdf_base64 = base64.b64encode(_fake_pdf(pages)).decode()
+    return {
+        "model": "claude-3-5-sonnet-20241022",
+        "max_tokens": max_tokens,
+        "messages": [{"role": "user", "content": [_pdf_document_block(pdf_base64)]}],
+    }
+
+
+def test_count_pdf_pages_ignores_pages_tree_node():
+    assert count_pdf_pages(_fake_pdf(3)) == 3
+
+
+def test_count_pdf_pages_is_zero_when_unknown():
+    assert count_pdf_pages(b"%PDF-1.4\n%no page objects\n%%EOF\n") == 0
+
+
+def test_count_pdf_pages_falls_back_to_pypdf():
+    pypdf = pytest.importorskip("pypdf")
+    writer = pypdf.PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(width=72, height=72)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    # An escaped name hides the page objects from the byte scan, as object
+    # streams do
+    pdf_bytes = re.sub(
+        rb"/Type\s*/Page(?![a-zA-Z])", b"/Type /Pag#65", buffer.getvalue()
+    )
+
+    assert count_pdf_pages(pdf_bytes) == 3
+
+
+def test_pdf_estimate_is_cached_by_content_hash():
+    estimator = TokenEstimator()
+    params = _pdf_params(2)
+    data = params["messages"][0]["content"][0]["source"]["data"]
+
+    first = estimator.estimate_pdf(data)
+    # An equal but distinct string still hits the hash-keyed cache
+    second = estimator.estimate_pdf("".join(list(data)))
+
+    assert first is second
+    assert estimator.estimate_request(params) >= 2 * PDF_TOKENS_PER_PAGE
+
+
+def test_plan_max_tokens_shrinks_only_when_window_is_short():
+    assert plan_max_tokens(1000, 4096) == 4096
+    assert plan_max_tokens(MODEL_CONTEXT_WINDOW - 1000, 4096) == 1000
+    with pytest.raises(AnthropicTokenBudgetError):
+        plan_max_tokens(MODEL_CONTEXT_WINDOW - 10, 4096)
+
+
+def test_preflight_rejects_pdf_over_page_limit():
+    with pytest.raises(AnthropicTokenBudgetError, match="101 pages"):
+        preflight(_pdf_params(101), TokenEstimator())
+
+
+def test_preflight_confirms_a_tight_fit_with_the_exact_count():
+    # 80 pages estimate past the context window, but fit in practice
+    params = _pdf_params(80)
+    count_exact = Mock(return_value=120_000)
+
+    assert preflight(params, TokenEstimator(), count_exact) is params
+    count_exact.assert_called_once_with(params)
+
+    count_exact.return_value = MODEL_CONTEXT_WINDOW - 1000
+    assert preflight(params, TokenEstimator(), count_exact)["max_tokens"] == 1000
+
+
+def test_preflight_sends_unchecked_when_counting_fails():
+    params = _pdf_params(80)
+    count_exact = Mock(side_effect=ConnectionError("offline"))
+
+    assert preflight(params, TokenEstimator(), count_exact) is params
+
+
+def test_apreflight_awaits_the_exact_count():
+    async def count_exact(params):
+        return 120_000
+
+    params = _pdf_params(80)
+    assert asyncio.run(apreflight(params, TokenEstimator(), count_exact)) is params
+
+
+def test_estimator_does_not_keep_the_document():
+    data = _pdf_params(2)["messages"][0]["content"][0]["source"]["data"]
+    references = sys.getrefcount(data)
+
+    default_token_estimator.estimate_pdf(data)
+
+    assert sys.getrefcount(data) == references
+
+
+def test_apreflight_estimates_off_the_event_loop():
+    estimator = TokenEstimator()
+    threads = []
+    estimate_request = estimator.estimate_request
+
+    def recording_estimate(params):
+        threads.append(threading.get_ident())
+        return estimate_request(params)
+
+    estimator.estimate_request = recording_estimate
+    asyncio.run(apreflight(_pdf_params(2), estimator))
+
+    assert threads and threading.get_ident() not in threads
+
+
+def test_resident_payloads_are_estimated_by_their_registry_hash(tmp_path, monkeypatch):
+    pdf = tmp_path / "paper.pdf"
+    pdf.write_bytes(_fake_pdf(2))
+    registry = PdfPayloadRegistry()
+    payload = registry.get(str(pdf))
+    estimator = TokenEstimator()
+
+    first = estimator.estimate_pdf(payload.base64)
+    # Cached under the registry's hash, so it is never decoded again
+    monkeypatch.setattr(base64, "b64decode", Mock(side_effect=AssertionError))
+    second = estimator.estimate_pdf(payload.document_block()["source"]["data"])
+
+    assert first.sha256 == payload.sha256
+    assert second is first
+
+
+def test_pdf_call_fails_before_upload_when_too_large():
+    service = AnthropicService(api_key="test-key")
+    service.client = Mock()
+    params = _pdf_params(101)
+
+    with pytest.raises(AnthropicTokenBudgetError):
+        service.create_pdf_message(max_tokens=1024, messages=params["messages"])
+    service.client.messages.create.assert_not_called()
+
+
+def test_exact_count_is_cached():
+    service = AnthropicService(api_key="test-key", token_estimator=TokenEstimator())
+    service.client = Mock()
+    service.client.messages.count_tokens.return_value = Mock(input_tokens=42)
+    messages = [{"role": "user", "content": "hello"}]
+
+    assert service.count_tokens(messages, exact=True) == 42
+    assert service.count_tokens(messages, exact=True) == 42
+    service.client.messages.count_tokens.assert_called_once()
+    assert service.count_tokens(messages) > 0
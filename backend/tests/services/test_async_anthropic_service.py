@@ -0,0 +1,103 @@
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from dhg.services.async_anthropic_service import (
+    AsyncAnthropicService,
+    get_shared_async_client,
+)
+
+
+def test_shared_client_is_reused_per_settings():
+    """Clients with the same pool settings are shared; different settings are not."""
+    first = get_shared_async_client("test-key", max_connections=10)
+    second = get_shared_async_client("test-key", max_connections=10)
+    other = get_shared_async_client("test-key", max_connections=20)
+
+    assert first is second
+    assert first is not other
+
+
+def test_services_share_one_client():
+    """Every service instance in a process uses the same pooled client."""
+    first = AsyncAnthropicService(api_key="test-key")
+    second = AsyncAnthropicService(api_key="test-key")
+
+    assert first.client is second.client
+
+
+def test_missing_api_key_raises(monkeypatch):
+    """Construction fails fast without an API key."""
+    monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+    with pytest.raises(ValueError):
+        AsyncAnthropicService()
+
+
+@pytest.mark.asyncio
+async def test_call_claude_basic_awaits_client():
+    """call_claude_basic builds a single user turn and returns the text."""
+    service = AsyncAnthropicService(api_key="test-key")
+    response = Mock()
+    response.content = [Mock(text="Hello there")]
+    service._create_message = AsyncMock(return_value=response)
+
+    result = await service.call_claude_basic(
+        max_tokens=50, input_string="Hi", system_string="Be brief"
+    )
+
+    assert result == "Hello there"
+    kwargs = service._create_message.await_args.kwargs
+    assert kwargs["system"] == "Be brief"
+    assert kwargs["messages"] == [
+        {"role": "user", "content": [{"type": "text", "text": "Hi"}]}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_call_claude_pdf_with_messages_rejects_bad_messages():
+    """Malformed messages are reported as a PDF processing failure."""
+    service = AsyncAnthropicService(api_key="test-key")
+    service._create_message = AsyncMock()
+
+    with pytest.raises(Exception, match="PDF processing failed"):
+        await service.call_claude_pdf_with_messages(
+            max_tokens=50, messages=[{"role": "user"}]
+        )
+    service._create_message.assert_not_awaited()
+
+
+class _FakeStream:
+    """Stand-in for the SDK's async message stream context manager."""
+
+    def __init__(self, deltas):
+        self._deltas = deltas
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        for delta in self._deltas:
+            yield delta
+
+    async def get_final_message(self):
+        return Mock(usage=Mock(input_tokens=1, output_tokens=len(self._deltas)))
+
+
+@pytest.mark.asyncio
+async def test_stream_claude_messages_yields_deltas():
+    """Deltas are yielded as they arrive; unset options are not sent."""
+    service = AsyncAnthropicService(api_key="test-key")
+    fake_client = Mock()
+    fake_client.messages.stream.return_value = _FakeStream(["Hel", "lo"])
+    service.client = fake_client
+
+    messages = [{"role": "user", "content": "Hi"}]
+    deltas = [d async for d in service.stream_claude_messages(50, messages)]
+
+    assert deltas == ["Hel", "lo"]
+    kwargs = fake_client.messages.stream.call_args.kwargs
+    assert "system" not in kwargs
+    assert "temperature" not in kwargs
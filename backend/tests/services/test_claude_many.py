@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.anthropic_service import AnthropicService, ClaudeRequest
+from dhg.services.async_anthropic_service import AsyncAnthropicService
+
+
+def _response(text):
+    response = Mock()
+    response.content = [Mock(text=text)]
+    return response
+
+
+def _prompt_of(params):
+    return params["messages"][0]["content"][0]["text"]
+
+
+def test_call_claude_many_keeps_input_order_and_captures_errors():
+    service = AnthropicService(api_key="test-key")
+
+    def fake_create(**params):
+        prompt = _prompt_of(params)
+        if prompt == "boom":
+            raise RuntimeError("bad request")
+        # Later prompts finish first
+        time.sleep(0.05 if prompt == "a" else 0.0)
+        return _response(prompt.upper())
+
+    service._create_message = fake_create
+    results = service.call_claude_many(
+        [
+            {"max_tokens": 10, "input_string": "a"},
+            ClaudeRequest(max_tokens=10, input_string="boom"),
+            {"max_tokens": 10, "input_string": "c"},
+        ],
+        concurrency=3,
+    )
+
+    assert [r.index for r in results] == [0, 1, 2]
+    assert results[0].text == "A"
+    assert results[2].text == "C"
+    assert not results[1].ok
+    assert isinstance(results[1].error, RuntimeError)
+
+
+def test_call_claude_many_runs_requests_concurrently():
+    service = AnthropicService(api_key="test-key")
+
+    def slow_create(**params):
+        time.sleep(0.2)
+        return _response("ok")
+
+    service._create_message = slow_create
+    started = time.monotonic()
+    results = service.call_claude_many(
+        [{"max_tokens": 10, "input_string": str(i)} for i in range(10)],
+        concurrency=10,
+    )
+
+    assert all(r.ok for r in results)
+    assert time.monotonic() - started < 1.0
+
+
+def test_invalid_spec_is_reported_per_item():
+    service = AnthropicService(api_key="test-key")
+    service._create_message = Mock(return_value=_response("ok"))
+
+    results = service.call_claude_many([{"max_tokens": 10}])
+
+    assert isinstance(results[0].error, ValueError)
+
+
+@pytest.mark.asyncio
+async def test_async_call_claude_many_respects_concurrency():
+    service = AsyncAnthropicService(api_key="test-key")
+    in_flight = 0
+    peak = 0
+
+    async def fake_create(**params):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return _response(_prompt_of(params))
+
+    service._create_message = fake_create
+    results = await service.call_claude_many(
+        [{"max_tokens": 10, "input_string": str(i)} for i in range(12)],
+        concurrency=3,
+    )
+
+    assert [r.text for r in results] == [str(i) for i in range(12)]
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_async_iter_claude_many_yields_in_completion_order():
+    service = AsyncAnthropicService(api_key="test-key")
+
+    async def fake_create(**params):
+        prompt = _prompt_of(params)
+        await asyncio.sleep(0.05 if prompt == "slow" else 0.0)
+        return _response(prompt)
+
+    service._create_message = fake_create
+    order = [
+        result.text
+        async for result in service.iter_claude_many(
+            [
+                {"max_tokens": 10, "input_string": "slow"},
+                {"max_tokens": 10, "input_string": "fast"},
+            ]
+        )
+    ]
+
+    assert order == ["fast", "slow"]
@@ -0,0 +1,184 @@
+import json
+import threading
+
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.analysis_store import SqliteAnalysisStore
+from dhg.services.anthropic_metrics import CallRecord, MetricsRecorder
+from dhg.services.paper_corpus import RunManifest, analyze_many, resolve_sources
+from tests.conftest import fake_tool_message
+
+MODEL = "claude-3-5-sonnet-20241022"
+ANALYSIS = {
+    "strengths": [{"aspect": "writing", "description": "clear"}],
+    "weaknesses": [{"aspect": "sample", "description": "small"}],
+}
+SUGGESTIONS = {"suggestions": [{"recommendation": "grow", "rationale": "power"}]}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    papers = tmp_path / "papers"
+    (papers / "nested").mkdir(parents=True)
+    for i, path in enumerate(["a.pdf", "b.pdf", "nested/c.pdf"]):
+        (papers / path).write_bytes(f"%PDF-1.4\n%paper {i}\n%%EOF\n".encode())
+    (papers / "notes.txt").write_text("not a paper")
+    return papers
+
+
+@pytest.fixture
+def service():
+    service = Mock(model_name=MODEL, metrics=MetricsRecorder())
+
+    def record_call():
+        service.metrics.record(
+            CallRecord("test", MODEL, 0.1, input_tokens=100, output_tokens=20)
+        )
+
+    def create_pdf_message(**kwargs):
+        record_call()
+        return fake_tool_message(ANALYSIS, kwargs["tool_choice"]["name"])
+
+    def call_claude_structured(**kwargs):
+        record_call()
+        return SUGGESTIONS
+
+    service.create_pdf_message.side_effect = create_pdf_message
+    service.call_claude_structured.side_effect = call_claude_structured
+    return service
+
+
+def test_sources_expand_directories_globs_and_storage(corpus):
+    storage = Mock()
+    bucket = storage.storage.from_.return_value
+    bucket.list.side_effect = lambda folder, options: {
+        "2024": [{"name": "x.pdf", "id": "1"}, {"name": "sub", "id": None}],
+        "2024/sub": [{"name": "y.pdf", "id": "2"}, {"name": "y.txt", "id": "3"}],
+    }[folder]
+
+    papers = resolve_sources(
+        [str(corpus), str(corpus / "*.pdf"), "supabase://papers/2024/"], storage
+    )
+
+    assert [paper.name for paper in papers] == [
+        "a.pdf",
+        "b.pdf",
+        "c.pdf",
+        "y.pdf",
+        "x.pdf",
+    ]
+    assert papers[3].uri == "supabase://papers/2024/sub/y.pdf"
+
+
+def test_analyze_many_writes_manifest_and_skips_done_papers(corpus, service, tmp_path):
+    output_dir = tmp_path / "out"
+    store = SqliteAnalysisStore(str(tmp_path / "analysis.db"))
+    snapshots = []
+
+    manifest = analyze_many(
+        [str(corpus)],
+        str(output_dir),
+        workers=2,
+        anthropic_service=service,
+        result_store=store,
+        on_progress=snapshots.append,
+    )
+
+    assert [p["status"] for p in manifest["papers"].values()] == ["done"] * 3
+    assert manifest["progress"]["done"] == 3
+    assert manifest["progress"]["input_tokens"] == 600
+    assert snapshots[-1]["remaining"] == 0
+    assert json.loads((output_dir / "manifest.json").read_text()) == manifest
+    assert not (output_dir / "manifest.jsonl").exists()
+    for paper in manifest["papers"].values():
+        assert (tmp_path / paper["output_dir"] / "analysis.md").exists()
+    # The progress exporter is only registered for the run
+    assert service.metrics.exporters == []
+
+    calls = service.metrics.stats("test", MODEL).calls
+    manifest = analyze_many(
+        [str(corpus)], str(output_dir), workers=2, anthropic_service=service
+    )
+
+    assert service.metrics.stats("test", MODEL).calls == calls
+    assert manifest["progress"]["total"] == 0
+
+
+def test_manifest_replays_journal_after_a_crash(tmp_path):
+    manifest = RunManifest(str(tmp_path / "manifest.json"))
+    manifest.update("a.pdf", status="pending")
+    manifest.update("b.pdf", status="pending")
+    manifest.save({"done": 0})
+    manifest.update("a.pdf", status="done")
+    manifest.append("a.pdf", {"done": 1})
+    # Interrupted while appending the next entry
+    with open(manifest.journal_path, "a") as f:
+        f.write('{"uri": "b.pdf", "pap')
+
+    resumed = RunManifest(str(tmp_path / "manifest.json"))
+
+    assert resumed.is_done("a.pdf")
+    assert not resumed.is_done("b.pdf")
+    assert resumed.data["progress"] == {"done": 1}
+
+
+def test_progress_counts_only_the_runs_own_calls(corpus, service, tmp_path):
+    create_pdf_message = service.create_pdf_message.side_effect
+
+    def create_with_outside_traffic(**kwargs):
+        # A call elsewhere in the process, on the same recorder
+        outside = threading.Thread(
+            target=service.metrics.record,
+            args=(CallRecord("api", MODEL, 0.1, input_tokens=5000),),
+        )
+        outside.start()
+        outside.join()
+        return create_pdf_message(**kwargs)
+
+    service.create_pdf_message.side_effect = create_with_outside_traffic
+
+    manifest = analyze_many(
+        [str(corpus / "a.pdf")],
+        str(tmp_path / "out"),
+        anthropic_service=service,
+        result_store=SqliteAnalysisStore(str(tmp_path / "analysis.db")),
+    )
+
+    assert manifest["progress"]["input_tokens"] == 200
+
+
+def test_failed_papers_are_recorded(corpus, service, tmp_path):
+    service.create_pdf_message.side_effect = RuntimeError("overloaded")
+
+    manifest = analyze_many(
+        [str(corpus / "a.pdf")],
+        str(tmp_path / "out"),
+        anthropic_service=service,
+        result_store=SqliteAnalysisStore(str(tmp_path / "analysis.db")),
+    )
+
+    (paper,) = manifest["papers"].values()
+    assert paper["status"] == "failed"
+    assert "no outputs" in paper["error"]
+    assert manifest["progress"]["failed"] == 1
+
+
+def test_analyze_many_downloads_storage_papers(service, tmp_path):
+    storage = Mock()
+    bucket = storage.storage.from_.return_value
+    bucket.list.return_value = [{"name": "x.pdf", "id": "1"}]
+    bucket.download.return_value = b"%PDF-1.4\n%stored paper\n%%EOF\n"
+
+    manifest = analyze_many(
+        ["supabase://papers/2024/"],
+        str(tmp_path / "out"),
+        anthropic_service=service,
+        result_store=SqliteAnalysisStore(str(tmp_path / "analysis.db")),
+        storage_client=storage,
+    )
+
+    (paper,) = manifest["papers"].values()
+    assert paper["status"] == "done", paper.get("error")
+    assert len(paper["pdf_sha256"]) == 64
+    bucket.download.assert_called_once_with("2024/x.pdf")
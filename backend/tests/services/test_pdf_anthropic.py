@@ -1,7 +1,15 @@
+import base64
+import hashlib
+import time
+
 import pytest
+from unittest.mock import Mock
+
 from dhg.services.anthropic_service import AnthropicService
-from dhg.services.pdf_anthropic import PdfAnthropic
+from dhg.services.pdf_anthropic import PdfAnthropic, PdfProcessingError
+from dhg.services.pdf_payload import PdfPayloadRegistry, encode_file_base64
 from dhg.services.prompts.paper_analysis_prompts import SOURCE_QUERY_PROMPT
+from tests.conftest import fake_message
 
 
 def test_source_query():
@@ -16,6 +24,205 @@ def test_source_query():
     return responses[0]
 
 
+def test_prompt_cache_marks_document_and_system(sample_pdf):
+    """With prompt caching, the document, system prompt and latest turn carry breakpoints."""
+    service = Mock()
+    service.create_pdf_message.side_effect = [
+        fake_message("first", cache_write=900),
+        fake_message("second", cache_read=900),
+    ]
+    pdf_processor = PdfAnthropic(service, sample_pdf, use_prompt_cache=True)
+
+    responses = pdf_processor.process_pdf(
+        custom_prompts=["Summarize", "Critique"], system_string="You are a reviewer"
+    )
+
+    assert responses == ["first", "second"]
+    kwargs = service.create_pdf_message.call_args.kwargs
+    document = kwargs["messages"][0]["content"][0]
+    assert document["type"] == "document"
+    assert document["cache_control"] == {"type": "ephemeral"}
+    assert kwargs["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert kwargs["messages"][-1]["content"][-1]["cache_control"] == {
+        "type": "ephemeral"
+    }
+    assert [u["cache_read_input_tokens"] for u in pdf_processor.turn_usage] == [0, 900]
+    assert pdf_processor.turn_usage[0]["cache_creation_input_tokens"] == 900
+
+
+def test_without_prompt_cache_requests_are_unmarked(sample_pdf):
+    service = Mock()
+    service.create_pdf_message.return_value = fake_message("only")
+    pdf_processor = PdfAnthropic(service, sample_pdf)
+
+    pdf_processor.process_pdf(custom_prompts=["Summarize"])
+
+    kwargs = service.create_pdf_message.call_args.kwargs
+    assert kwargs["system"] is None
+    assert all(
+        "cache_control" not in block for block in kwargs["messages"][0]["content"]
+    )
+
+
+def test_failed_chain_resumes_from_failed_turn(sample_pdf):
+    """A transient failure on turn 2 does not re-run turn 1 on the next call."""
+    service = Mock()
+    service.create_pdf_message.side_effect = [
+        fake_message("first"),
+        RuntimeError("overloaded"),
+        fake_message("second"),
+    ]
+    pdf_processor = PdfAnthropic(service, sample_pdf)
+
+    with pytest.raises(PdfProcessingError, match="Turn 2 of 2"):
+        pdf_processor.process_pdf(custom_prompts=["Summarize", "Critique"])
+    responses = pdf_processor.process_pdf(custom_prompts=["Summarize", "Critique"])
+
+    assert responses == ["first", "second"]
+    assert service.create_pdf_message.call_count == 3
+    last_messages = service.create_pdf_message.call_args.kwargs["messages"]
+    assert last_messages[1]["content"][0]["text"] == "first"
+
+
+def _prompt_in(kwargs):
+    content = kwargs["messages"][0]["content"]
+    return next(block["text"] for block in content if block["type"] == "text")
+
+
+def test_independent_mode_runs_prompts_concurrently(sample_pdf):
+    service = Mock()
+
+    def create(**kwargs):
+        time.sleep(0.2)
+        return fake_message(_prompt_in(kwargs).upper())
+
+    service.create_pdf_message.side_effect = create
+    pdf_processor = PdfAnthropic(service, sample_pdf)
+
+    started = time.monotonic()
+    responses = pdf_processor.process_pdf(
+        custom_prompts=["summarize", "critique", "sources"], mode="independent"
+    )
+
+    assert time.monotonic() - started < 0.5
+    assert responses == ["SUMMARIZE", "CRITIQUE", "SOURCES"]
+    assert len(pdf_processor.turn_usage) == 3
+    for call in service.create_pdf_message.call_args_list:
+        # Each prompt is its own single-turn request with the document
+        assert len(call.kwargs["messages"]) == 1
+        content = call.kwargs["messages"][0]["content"]
+        assert [block["type"] for block in content] == ["text", "document"]
+
+
+def test_independent_mode_writes_the_prompt_cache_once(sample_pdf):
+    service = Mock()
+    order = []
+
+    def create(**kwargs):
+        order.append(_prompt_in(kwargs))
+        return fake_message("ok")
+
+    service.create_pdf_message.side_effect = create
+    pdf_processor = PdfAnthropic(service, sample_pdf, use_prompt_cache=True)
+
+    pdf_processor.process_pdf(custom_prompts=["a", "b", "c"], mode="independent")
+
+    assert order[0] == "a"
+    assert sorted(order[1:]) == ["b", "c"]
+
+
+def test_independent_mode_resumes_only_failed_prompts(sample_pdf):
+    service = Mock()
+    failures = {"critique": 1}
+
+    def create(**kwargs):
+        prompt = _prompt_in(kwargs)
+        if failures.get(prompt):
+            failures[prompt] -= 1
+            raise RuntimeError("overloaded")
+        return fake_message(prompt)
+
+    service.create_pdf_message.side_effect = create
+    pdf_processor = PdfAnthropic(service, sample_pdf)
+    prompts = ["summarize", "critique", "sources"]
+
+    with pytest.raises(PdfProcessingError, match="1 of 3 prompts failed; prompt 2"):
+        pdf_processor.process_pdf(custom_prompts=prompts, mode="independent")
+    responses = pdf_processor.process_pdf(custom_prompts=prompts, mode="independent")
+
+    assert responses == prompts
+    assert service.create_pdf_message.call_count == 4
+
+
+def test_chunked_encoding_matches_base64(tmp_path):
+    pdf_path = tmp_path / "paper.pdf"
+    content = bytes(range(256)) * 40 + b"tail"
+    pdf_path.write_bytes(content)
+
+    encoded = encode_file_base64(str(pdf_path), chunk_size=3 * 100)
+
+    assert encoded == base64.b64encode(content).decode()
+
+
+def test_pdf_is_not_read_until_a_request_is_built(sample_pdf):
+    service = Mock()
+    service.create_pdf_message.return_value = fake_message("only")
+    pdf_processor = PdfAnthropic(service, sample_pdf)
+
+    assert "pdf_base64" not in vars(pdf_processor)
+    pdf_processor.process_pdf(custom_prompts=["Summarize"])
+
+    document = service.create_pdf_message.call_args.kwargs["messages"][0]["content"][1]
+    with open(sample_pdf, "rb") as f:
+        assert document["source"]["data"] == base64.b64encode(f.read()).decode()
+
+
+def test_pdf_hash_does_not_encode_the_pdf(sample_pdf):
+    registry = PdfPayloadRegistry()
+    pdf_processor = PdfAnthropic(Mock(), sample_pdf, payload_registry=registry)
+
+    with open(sample_pdf, "rb") as f:
+        assert pdf_processor.pdf_sha256 == hashlib.sha256(f.read()).hexdigest()
+    assert registry.stats.misses == 0
+
+
+def test_registry_encodes_duplicate_papers_once(tmp_path):
+    registry = PdfPayloadRegistry()
+    first = tmp_path / "a.pdf"
+    second = tmp_path / "copy_of_a.pdf"
+    first.write_bytes(b"%PDF-1.4\nsame paper\n")
+    second.write_bytes(b"%PDF-1.4\nsame paper\n")
+    service = Mock()
+
+    a = PdfAnthropic(service, str(first), payload_registry=registry)
+    b = PdfAnthropic(service, str(second), payload_registry=registry)
+
+    assert a.pdf_sha256 == b.pdf_sha256
+    assert a.payload is b.payload
+    # The hashes come from the files; only the payloads touch the registry
+    assert (registry.stats.misses, registry.stats.hits) == (1, 1)
+
+
+def test_registry_evicts_least_recently_used(tmp_path):
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"{i}.pdf"
+        path.write_bytes(bytes([i]) * 300)
+        paths.append(str(path))
+    # Room for two 400-character payloads
+    registry = PdfPayloadRegistry(max_bytes=800)
+
+    registry.get(paths[0])
+    registry.get(paths[1])
+    registry.get(paths[0])
+    registry.get(paths[2])
+
+    assert len(registry) == 2
+    assert registry.stats.evictions == 1
+    registry.get(paths[0])
+    assert registry.stats.hits == 2
+
+
 if __name__ == "__main__":
     response = test_source_query()
     print("Source Information:")
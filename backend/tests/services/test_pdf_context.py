@@ -0,0 +1,80 @@
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.pdf_anthropic import PdfAnthropic
+from dhg.services.pdf_context import DependencyContext, LastTurns, RunningSummary
+from tests.conftest import fake_message
+
+
+def _texts(messages):
+    return [
+        block["text"]
+        for message in messages
+        for block in message["content"]
+        if block["type"] == "text"
+    ]
+
+
+@pytest.fixture
+def service():
+    service = Mock()
+    service.create_pdf_message.side_effect = lambda **kwargs: fake_message(
+        f"answer {len(service.create_pdf_message.call_args_list)}"
+    )
+    return service
+
+
+def _sent(service):
+    return [
+        call.kwargs["messages"] for call in service.create_pdf_message.call_args_list
+    ]
+
+
+def test_last_turns_bounds_the_replayed_conversation(service, sample_pdf):
+    processor = PdfAnthropic(service, sample_pdf)
+
+    processor.process_pdf(
+        custom_prompts=["p0", "p1", "p2", "p3"], context_policy=LastTurns(1)
+    )
+
+    sent = _sent(service)
+    assert [len(messages) for messages in sent] == [1, 3, 3, 3]
+    assert _texts(sent[3]) == ["p2", "answer 3", "p3"]
+    # Every request still starts with the document
+    assert all(m[0]["content"][1]["type"] == "document" for m in sent)
+
+
+def test_dependencies_replay_only_declared_turns(service, sample_pdf):
+    processor = PdfAnthropic(service, sample_pdf, use_prompt_cache=True)
+
+    processor.process_pdf(
+        custom_prompts=["p0", "p1", "p2"],
+        context_policy=DependencyContext({2: [0]}),
+    )
+
+    sent = _sent(service)
+    assert _texts(sent[1]) == ["p1"]
+    assert _texts(sent[2]) == ["p0", "answer 1", "p2"]
+    assert sent[2][-1]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_dependencies_must_point_backwards():
+    with pytest.raises(ValueError):
+        DependencyContext({1: [1]})
+
+
+def test_running_summary_folds_old_turns_once(service, sample_pdf):
+    service.call_claude_basic.side_effect = ["summary of p0", "summary of p0 and p1"]
+    processor = PdfAnthropic(service, sample_pdf)
+
+    processor.process_pdf(
+        custom_prompts=["p0", "p1", "p2", "p3"],
+        context_policy=RunningSummary(keep_last=1),
+    )
+
+    assert service.call_claude_basic.call_count == 2
+    last = _texts(_sent(service)[3])
+    assert last[0].startswith("Summary of the earlier conversation")
+    assert "summary of p0 and p1" in last[0]
+    assert last[0].endswith("p2")
+    assert last[1:] == ["answer 3", "p3"]
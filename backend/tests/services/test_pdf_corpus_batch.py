@@ -0,0 +1,131 @@
+import re
+import time
+
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.anthropic_batches import BatchJobStore
+from dhg.services.pdf_corpus_batch import CorpusBatchBuilder
+from dhg.services.pdf_payload import PdfPayloadRegistry
+
+
+def _papers(tmp_path, *contents):
+    paths = []
+    for i, content in enumerate(contents):
+        path = tmp_path / f"paper_{i}.pdf"
+        path.write_bytes(b"%PDF-1.4\n" + content)
+        paths.append(str(path))
+    return paths
+
+
+def _builder(tmp_path, **kwargs):
+    service = Mock()
+    service.model_name = "claude-3-5-sonnet-20241022"
+    created = []
+
+    def create(requests):
+        created.append(requests)
+        return Mock(id=f"batch_{len(created)}", processing_status="in_progress")
+
+    service.client.messages.batches.create.side_effect = create
+    builder = CorpusBatchBuilder(
+        service,
+        batch_store=BatchJobStore(str(tmp_path / "batches.db")),
+        payload_registry=PdfPayloadRegistry(),
+        **kwargs,
+    )
+    builder.manager.min_interval = 0
+    return builder, service.client, created
+
+
+def test_requests_are_packed_up_to_the_count_limit(tmp_path):
+    builder, _, created = _builder(tmp_path, max_batch_requests=4)
+    paths = _papers(tmp_path, b"one", b"two", b"three")
+
+    batch_ids = builder.submit(paths, ["Summarize", "Critique"], concurrency=2)
+
+    assert len(batch_ids) == 2
+    assert sorted(len(requests) for requests in created) == [2, 4]
+
+
+def test_requests_are_packed_up_to_the_byte_limit(tmp_path):
+    builder, _, created = _builder(tmp_path, max_batch_bytes=2500)
+    paths = _papers(tmp_path, b"one", b"two")
+
+    builder.submit(paths, ["Summarize"])
+
+    # Each request is ~1 KB with overhead, so two fit per batch at most
+    assert [len(requests) for requests in created] == [2]
+    builder.max_batch_bytes = 1500
+    builder.submit(paths, ["Summarize"])
+    assert [len(requests) for requests in created[1:]] == [1, 1]
+
+
+def test_uploads_in_flight_are_bounded_by_bytes(tmp_path):
+    builder, client, created = _builder(tmp_path, max_batch_requests=1)
+    paths = _papers(tmp_path, b"one", b"two", b"three")
+    create = client.messages.batches.create.side_effect
+    uploading = []
+    peak = []
+
+    def slow_create(requests):
+        uploading.append(requests)
+        peak.append(len(uploading))
+        time.sleep(0.05)
+        uploading.remove(requests)
+        return create(requests)
+
+    client.messages.batches.create.side_effect = slow_create
+
+    # Each one-request batch is ~1 KB, so only one fits in 1.5 KB
+    builder.submit(paths, ["Summarize"], concurrency=4, max_in_flight_bytes=1500)
+
+    assert len(created) == 3
+    assert max(peak) == 1
+
+
+def test_custom_ids_are_deterministic_and_valid(tmp_path):
+    builder, _, _ = _builder(tmp_path)
+    paths = _papers(tmp_path, b"one")
+
+    first = [
+        i["request"]["custom_id"]
+        for b in builder.iter_batches(paths, ["a", "b"])
+        for i in b
+    ]
+    second = [
+        i["request"]["custom_id"]
+        for b in builder.iter_batches(paths, ["a", "b"])
+        for i in b
+    ]
+
+    assert first == second
+    assert all(re.fullmatch(r"[a-zA-Z0-9_-]{1,64}", custom_id) for custom_id in first)
+
+
+@pytest.mark.asyncio
+async def test_results_are_routed_to_every_path_of_a_paper(tmp_path):
+    builder, client, created = _builder(tmp_path)
+    paths = _papers(tmp_path, b"same", b"same", b"other")
+
+    def results(batch_id):
+        for request in created[0]:
+            entry = Mock(custom_id=request["custom_id"])
+            entry.result.type = "succeeded"
+            prompt = request["params"]["messages"][0]["content"][0]["text"]
+            entry.result.message.content = [Mock(text=f"answer to {prompt}")]
+            yield entry
+
+    client.messages.batches.retrieve.return_value = Mock(processing_status="ended")
+    client.messages.batches.results.side_effect = results
+
+    by_paper = await builder.process_corpus(paths, ["Summarize", "Critique"])
+
+    # The duplicate paper was only requested once
+    assert len(created[0]) == 4
+    assert set(by_paper) == set(paths)
+    assert by_paper[paths[0]] == by_paper[paths[1]]
+    assert [r["result"] for r in by_paper[paths[2]]] == [
+        "answer to Summarize",
+        "answer to Critique",
+    ]
@@ -0,0 +1,102 @@
+import base64
+import io
+
+import pytest
+from unittest.mock import Mock
+
+from dhg.core.exceptions import AnthropicTokenBudgetError
+from dhg.services.anthropic_service import AnthropicService
+from dhg.services.async_anthropic_service import AsyncAnthropicService
+from dhg.services.pdf_split import chunk_page_limit, page_ranges, split_pdf
+
+pypdf = pytest.importorskip("pypdf")
+
+
+def _pdf(tmp_path, pages):
+    writer = pypdf.PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    path = tmp_path / f"paper_{pages}.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def _pages_in(chunk):
+    data = base64.b64decode(chunk.payload.base64)
+    return len(pypdf.PdfReader(io.BytesIO(data)).pages)
+
+
+def _response(text):
+    response = Mock()
+    response.content = [Mock(text=text)]
+    return response
+
+
+def _prompt_of(params):
+    return params["messages"][0]["content"][0]["text"]
+
+
+def test_page_ranges_are_even_and_cover_every_page():
+    assert page_ranges(150, 66) == [(0, 50), (50, 100), (100, 150)]
+    assert page_ranges(10, 100) == [(0, 10)]
+
+
+def test_chunk_page_limit_leaves_room_for_prompt_and_response():
+    assert chunk_page_limit(max_tokens=8192) == 63
+    with pytest.raises(AnthropicTokenBudgetError):
+        chunk_page_limit(max_tokens=8192, prompt_tokens=195_000)
+
+
+def test_split_pdf_respects_page_and_byte_limits(tmp_path):
+    path = _pdf(tmp_path, 12)
+
+    chunks = split_pdf(path, max_pages=5)
+    assert [(c.first_page, c.last_page) for c in chunks] == [(1, 4), (5, 8), (9, 12)]
+    assert [_pages_in(c) for c in chunks] == [4, 4, 4]
+
+    single_page = len(base64.b64decode(split_pdf(path, max_pages=1)[0].payload.base64))
+    chunks = split_pdf(path, max_pages=12, max_bytes=single_page * 3)
+    assert all(c.payload.size_bytes <= single_page * 3 for c in chunks)
+    assert sum(_pages_in(c) for c in chunks) == 12
+
+
+def test_oversized_pdf_falls_back_to_map_reduce(tmp_path):
+    path = _pdf(tmp_path, 150)
+    service = AnthropicService(api_key="test-key")
+    service.client = Mock()
+
+    def create(**params):
+        content = params["messages"][0]["content"]
+        if len(content) == 1:
+            return _response("merged")
+        return _response(_prompt_of(params).split(" of a ")[0])
+
+    service.client.messages.create.side_effect = create
+
+    answer = service.call_claude_pdf_basic(1000, "Summarize", path)
+
+    assert answer == "merged"
+    calls = [c.kwargs for c in service.client.messages.create.call_args_list]
+    assert len(calls) == 4
+    reduce_text = _prompt_of(calls[-1])
+    assert "<task>\nSummarize\n</task>" in reduce_text
+    assert reduce_text.index('pages="1-50"') < reduce_text.index('pages="101-150"')
+
+
+@pytest.mark.asyncio
+async def test_async_map_reduce_raises_when_a_chunk_fails(tmp_path):
+    path = _pdf(tmp_path, 6)
+    service = AsyncAnthropicService(api_key="test-key")
+
+    async def create(**params):
+        if "pages 4-6" in _prompt_of(params):
+            raise RuntimeError("overloaded")
+        return _response("part")
+
+    service._create_message = create
+
+    with pytest.raises(Exception, match="1 of 2 PDF chunks failed"):
+        await service.call_claude_pdf_map_reduce(
+            1000, "Summarize", path, pages_per_chunk=3
+        )
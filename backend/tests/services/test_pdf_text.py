@@ -0,0 +1,157 @@
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.analysis_store import SqliteAnalysisStore
+from dhg.services.paper_analysis_service import PaperAnalysisService
+from dhg.services.pdf_payload import PdfPayloadRegistry
+from dhg.services.pdf_text import PdfTextCache, PdfTextExtractor
+
+pytest.importorskip("pypdf")
+
+
+def _text_pdf(path, pages):
+    """Write a PDF whose pages are lists of (font size, line) pairs."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for lines in pages:
+        commands = []
+        y = 740
+        for size, line in lines:
+            commands.append(f"BT /F1 {size} Tf 72 {y} Td ({line}) Tj ET")
+            y -= size * 2
+        stream = "\n".join(commands).encode("latin-1")
+        objects.append(
+            b"<< /Length "
+            + str(len(stream)).encode()
+            + b" >>\nstream\n"
+            + stream
+            + b"\nendstream"
+        )
+        content = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents "
+            + str(content).encode()
+            + b" 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    objects[1] = objects[1].encode()
+
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += str(number).encode() + b" 0 obj\n" + body + b"\nendobj\n"
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        data += f"{offset:010d} 00000 n \n".encode()
+    data += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n"
+    ).encode()
+    path.write_bytes(data)
+    return str(path)
+
+
+PAPER = [
+    [
+        (18, "A Study of Things"),
+        (11, "Abstract"),
+        (11, "We studied things carefully."),
+        (14, "1. Introduction"),
+        (11, "Things matter for many reasons."),
+    ],
+    [
+        (14, "2. Methods"),
+        (11, "We counted the things twice."),
+        (11, "References"),
+        (11, "Smith 2020."),
+    ],
+]
+
+
+@pytest.fixture
+def extractor():
+    extractor = PdfTextExtractor(
+        max_workers=2, cache=PdfTextCache(), payload_registry=PdfPayloadRegistry()
+    )
+    yield extractor
+    extractor.shutdown()
+
+
+def test_extracts_pages_and_detects_sections(tmp_path, extractor):
+    path = _text_pdf(tmp_path / "paper.pdf", PAPER)
+
+    text = extractor.extract(path)
+
+    assert len(text.pages) == 2
+    assert "We counted the things twice." in text.pages[1]
+    assert text.text.startswith("[Page 1]\n")
+    assert [s.title for s in text.sections] == [
+        "A Study of Things",
+        "Abstract",
+        "1. Introduction",
+        "2. Methods",
+        "References",
+    ]
+    methods = text.section("methods")
+    assert methods.first_page == 2
+    assert methods.text == "We counted the things twice."
+
+
+def test_each_document_is_extracted_once(tmp_path, extractor):
+    first = _text_pdf(tmp_path / "a.pdf", PAPER)
+    copy = _text_pdf(tmp_path / "b.pdf", PAPER)
+    other = _text_pdf(tmp_path / "c.pdf", [[(11, "Other paper")]])
+    pool = extractor._pool()
+    submit = Mock(wraps=pool.submit)
+    pool.submit = submit
+
+    texts = extractor.extract_many([first, copy, other])
+    extractor.extract(first)
+
+    assert submit.call_count == 2
+    assert texts[first] is texts[copy]
+    assert texts[other].pages == ["Other paper"]
+
+
+def test_disk_cache_survives_a_new_extractor(tmp_path):
+    path = _text_pdf(tmp_path / "paper.pdf", PAPER)
+    cache_dir = str(tmp_path / "text-cache")
+    first = PdfTextExtractor(max_workers=1, cache=PdfTextCache(cache_dir))
+    expected = first.extract(path)
+    first.shutdown()
+
+    second = PdfTextExtractor(cache=PdfTextCache(cache_dir))
+    second._pool = Mock(side_effect=AssertionError("should not parse again"))
+
+    assert second.extract(path) == expected
+
+
+def test_text_only_analysis_skips_the_pdf_upload(tmp_path, extractor):
+    path = _text_pdf(tmp_path / "paper.pdf", PAPER)
+    processor = Mock(pdf_path=path, pdf_sha256="abc")
+    processor.anthropic_service.model_name = "claude-3-5-sonnet-20241022"
+    processor.anthropic_service.call_claude_structured.return_value = {
+        "strengths": ["clear"],
+        "weaknesses": ["small"],
+    }
+    service = PaperAnalysisService(
+        processor,
+        text_extractor=extractor,
+        result_store=SqliteAnalysisStore(str(tmp_path / "analysis.db")),
+    )
+
+    analysis = service.extract_strengths_and_weaknesses(text_only=True)
+
+    assert analysis == {"strengths": ["clear"], "weaknesses": ["small"]}
+    processor.extract_structured.assert_not_called()
+    call = processor.anthropic_service.call_claude_structured.call_args
+    (message,) = call.kwargs["messages"]
+    assert "We counted the things twice." in message["content"][0]["text"]
@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+from unittest.mock import Mock
+
+from dhg.core.exceptions import PipelineError
+from dhg.services.analysis_store import SqliteAnalysisStore
+from dhg.services.paper_analysis_service import PaperAnalysisService
+from dhg.services.pipeline import (
+    FileCheckpointStore,
+    MemoryCheckpointStore,
+    PipelineExecutor,
+    PipelineNode,
+)
+
+MODEL = "claude-3-5-sonnet-20241022"
+
+
+def test_independent_nodes_run_concurrently():
+    # Both branches wait for each other, so this only finishes if they overlap
+    barrier = threading.Barrier(2, timeout=5)
+
+    def branch(offset):
+        def step(root):
+            barrier.wait()
+            return root + offset
+
+        return step
+
+    executor = PipelineExecutor(
+        [
+            PipelineNode("root", lambda: 1),
+            PipelineNode("left", branch(1), ("root",)),
+            PipelineNode("right", branch(2), ("root",)),
+            PipelineNode("join", lambda left, right: left + right, ("left", "right")),
+        ]
+    )
+
+    assert executor.run("run")["join"] == 5
+
+
+def test_rerun_resumes_from_the_failed_node():
+    checkpoints = MemoryCheckpointStore()
+    first = Mock(return_value="a")
+    flaky = Mock(side_effect=[RuntimeError("overloaded"), "b"])
+    nodes = [
+        PipelineNode("first", first),
+        PipelineNode("second", lambda first: flaky(first), ("first",)),
+    ]
+
+    with pytest.raises(PipelineError) as error:
+        PipelineExecutor(nodes, checkpoints=checkpoints).run("run")
+    assert error.value.node == "second"
+
+    outputs = PipelineExecutor(nodes, checkpoints=checkpoints).run("run")
+
+    assert outputs == {"first": "a", "second": "b"}
+    assert first.call_count == 1
+
+
+def test_graph_is_validated():
+    with pytest.raises(ValueError, match="cycle"):
+        PipelineExecutor(
+            [
+                PipelineNode("a", lambda b: b, ("b",)),
+                PipelineNode("b", lambda a: a, ("a",)),
+            ]
+        )
+    with pytest.raises(ValueError, match="unknown"):
+        PipelineExecutor([PipelineNode("a", lambda b: b, ("b",))])
+
+
+def test_file_checkpoints_round_trip(tmp_path):
+    store = FileCheckpointStore(str(tmp_path))
+    store.save("run", "analysis", {"strengths": ["clear"]})
+    (tmp_path / "run" / "broken.json").write_text("{")
+
+    assert store.load("run") == {"analysis": {"strengths": ["clear"]}}
+    assert store.load("other") == {}
+
+
+def test_analyze_paper_resumes_after_a_failed_step(tmp_path):
+    processor = Mock(pdf_path="paper.pdf", pdf_sha256="abc")
+    processor.anthropic_service.model_name = MODEL
+    processor.extract_structured.return_value = {
+        "strengths": ["clear"],
+        "weaknesses": ["small"],
+    }
+    processor.anthropic_service.call_claude_structured.side_effect = [
+        RuntimeError("overloaded"),
+        {"suggestions": [{"recommendation": "grow", "rationale": "power"}]},
+    ]
+    service = PaperAnalysisService(
+        processor, result_store=SqliteAnalysisStore(str(tmp_path / "analysis.db"))
+    )
+    output_dir = str(tmp_path / "out")
+
+    assert service.analyze_paper(output_dir) == {}
+    result = service.analyze_paper(output_dir)
+
+    assert set(result) == {"analysis", "suggestions", "rewritten_paper", "rationale"}
+    # The analysis was not requested again on the second run
+    assert processor.extract_structured.call_count == 1
+    assert (tmp_path / "out" / ".checkpoints").is_dir()
@@ -0,0 +1,118 @@
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.analysis_store import SqliteAnalysisStore
+from dhg.services.paper_analysis_service import PaperAnalysisService
+from dhg.services.pdf_anthropic import PdfAnthropic, PdfProcessingError
+from dhg.services.prompts.paper_analysis_prompts import (
+    SOURCE_QUERY_PROMPT,
+    SOURCE_QUERY_SCHEMA,
+)
+from dhg.services.prompt_fusion import (
+    FUSED_TOOL_NAME,
+    FusedPrompt,
+    fused_prompt,
+    fused_tool,
+)
+from tests.conftest import fake_tool_message
+
+MODEL = "claude-3-5-sonnet-20241022"
+ANALYSIS = {
+    "strengths": [{"aspect": "writing", "description": "clear"}],
+    "weaknesses": [{"aspect": "sample", "description": "small"}],
+}
+SOURCE = {"title": "A Study of Things", "authors": ["Smith"]}
+REVIEW = "## Strengths\n- clear\n\n## Weaknesses\n- small"
+
+
+def _fields(service):
+    """Fields requested by the fused tool of the last request."""
+    (tool,) = service.create_pdf_message.call_args.kwargs["tools"]
+    return tool["input_schema"]["required"]
+
+
+@pytest.fixture
+def analysis_service(tmp_path, sample_pdf):
+    service = Mock(model_name=MODEL)
+    processor = PdfAnthropic(service, sample_pdf)
+    return PaperAnalysisService(
+        processor, result_store=SqliteAnalysisStore(str(tmp_path / "analysis.db"))
+    )
+
+
+def test_sections_are_tagged_with_their_fields():
+    prompts = [
+        FusedPrompt("source", "Who wrote it?", {"type": "object"}),
+        FusedPrompt("review", "Review it."),
+    ]
+
+    text = fused_prompt(prompts)
+    tool = fused_tool(prompts)
+
+    assert '<task field="source">\nWho wrote it?\n</task>' in text
+    assert '<task field="review">\nReview it.\n</task>' in text
+    assert tool.input_schema["required"] == ["source", "review"]
+    assert tool.input_schema["properties"]["review"] == {"type": "string"}
+    with pytest.raises(ValueError):
+        fused_tool([FusedPrompt("a", "x"), FusedPrompt("a", "y")])
+
+
+def test_one_request_answers_every_prompt(analysis_service):
+    service = analysis_service.pdf_processor.anthropic_service
+    service.create_pdf_message.return_value = fake_tool_message(
+        {
+            "paper_analysis": ANALYSIS,
+            "strengths_and_weaknesses": REVIEW,
+            "source": SOURCE,
+        },
+        FUSED_TOOL_NAME,
+    )
+
+    results = analysis_service.analyze_fused()
+
+    assert results == {
+        "paper_analysis": ANALYSIS,
+        "strengths_and_weaknesses": REVIEW,
+        "source": SOURCE,
+    }
+    assert service.create_pdf_message.call_count == 1
+    # The fused answer is shared with the standalone analysis step
+    assert analysis_service.extract_strengths_and_weaknesses() == ANALYSIS
+    assert service.create_pdf_message.call_count == 1
+
+
+def test_stored_answers_are_left_out_of_the_request(analysis_service):
+    service = analysis_service.pdf_processor.anthropic_service
+    service.create_pdf_message.return_value = fake_tool_message(
+        {
+            "paper_analysis": ANALYSIS,
+            "strengths_and_weaknesses": REVIEW,
+            "source": SOURCE,
+        },
+        FUSED_TOOL_NAME,
+    )
+    analysis_service.analyze_fused()
+    service.create_pdf_message.return_value = fake_tool_message(
+        {"extra": "answer"}, FUSED_TOOL_NAME
+    )
+
+    results = analysis_service.analyze_fused(
+        [
+            FusedPrompt("source", SOURCE_QUERY_PROMPT, SOURCE_QUERY_SCHEMA),
+            FusedPrompt("extra", "More?"),
+        ]
+    )
+
+    assert results == {"source": SOURCE, "extra": "answer"}
+    assert _fields(service) == ["extra"]
+
+
+def test_answers_are_checked_against_each_schema(analysis_service):
+    service = analysis_service.pdf_processor.anthropic_service
+    service.create_pdf_message.return_value = fake_tool_message(
+        {"paper_analysis": ANALYSIS, "strengths_and_weaknesses": REVIEW, "source": {}},
+        FUSED_TOOL_NAME,
+    )
+
+    with pytest.raises(PdfProcessingError, match="source"):
+        analysis_service.analyze_fused()
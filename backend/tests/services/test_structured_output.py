@@ -0,0 +1,136 @@
+import json
+
+import pytest
+from unittest.mock import Mock
+
+from dhg.services.anthropic_retry import RetryPolicy
+from dhg.services.anthropic_service import AnthropicService
+from dhg.services.structured_output import (
+    IncrementalJsonParser,
+    StructuredOutputError,
+    StructuredTool,
+    iter_json_values,
+)
+
+TOOL = StructuredTool(
+    "report_suggestions",
+    "Report suggestions.",
+    {
+        "type": "object",
+        "properties": {
+            "suggestions": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"recommendation": {"type": "string"}},
+                    "required": ["recommendation"],
+                },
+            }
+        },
+        "required": ["suggestions"],
+    },
+)
+
+DOCUMENT = (
+    'Here you go: {"suggestions": [{"recommendation": "say \\"why\\""}, '
+    '{"recommendation": "grow"}], "score": -1.5e2, "final": true, "notes": null}'
+)
+
+
+def _chunks(text, size):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_parser_reports_values_as_they_complete(size):
+    parser = IncrementalJsonParser()
+    events = []
+    for chunk in _chunks(DOCUMENT, size):
+        events.extend(parser.feed(chunk))
+
+    expected = json.loads(DOCUMENT[DOCUMENT.index("{") :])
+    assert parser.close() == expected
+    assert events[0] == (("suggestions", 0, "recommendation"), 'say "why"')
+    assert events[1] == (("suggestions", 0), {"recommendation": 'say "why"'})
+    assert (("score",), -150.0) in events
+    assert events[-1] == ((), expected)
+
+
+def test_schema_violation_fails_before_the_stream_ends():
+    consumed = []
+
+    def chunks():
+        for chunk in ['{"suggestions": [{"recommendation": 3}', ", {"]:
+            consumed.append(chunk)
+            yield chunk
+
+    with pytest.raises(StructuredOutputError, match="recommendation"):
+        list(TOOL.iter_fields(chunks()))
+    assert len(consumed) == 1
+
+
+def test_truncated_stream_is_an_error():
+    with pytest.raises(StructuredOutputError, match="ended"):
+        list(iter_json_values(['{"suggestions": [']))
+
+
+def test_parse_requires_the_tool_call():
+    with pytest.raises(StructuredOutputError):
+        TOOL.parse(Mock(content=[Mock(type="text", text="{}")]))
+
+    block = Mock(type="tool_use", input={"suggestions": []})
+    block.name = TOOL.name
+    assert TOOL.parse(Mock(content=[block])) == {"suggestions": []}
+
+
+class _ToolStream:
+    def __init__(self, partial_json):
+        self.events = [
+            Mock(
+                type="content_block_delta",
+                delta=Mock(type="input_json_delta", partial_json=chunk),
+            )
+            for chunk in partial_json
+        ]
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for event in self.events:
+            self.consumed += 1
+            yield event
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+        return False
+
+    def get_final_message(self):
+        return Mock(usage=Mock(input_tokens=10, output_tokens=5))
+
+
+def test_streamed_tool_input_can_stop_early():
+    stream = _ToolStream(
+        ['{"suggestions": [{"recommendation": "a"}', ', {"recommendation": "b"}]}']
+    )
+    service = AnthropicService(
+        api_key="test-key", retry_policy=RetryPolicy(base_delay=0, max_delay=0)
+    )
+    service.client = Mock()
+    service.client.messages.stream.return_value = stream
+
+    fields = TOOL.iter_fields(
+        service.stream_claude_tool_input(100, [{"role": "user", "content": "Hi"}], TOOL)
+    )
+    for path, value in fields:
+        if path == ("suggestions", 0):
+            break
+    fields.close()
+
+    assert value == {"recommendation": "a"}
+    assert stream.consumed == 1
+    assert stream.closed
+    kwargs = service.client.messages.stream.call_args.kwargs
+    assert kwargs["tool_choice"] == {"type": "tool", "name": TOOL.name}
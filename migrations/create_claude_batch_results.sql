@@ -0,0 +1,13 @@
+CREATE TABLE public.claude_batch_results (
+    id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    batch_id text NOT NULL,
+    custom_id text NOT NULL,
+    result_type text NOT NULL,
+    result text,
+    metadata jsonb,
+    input_tokens integer NOT NULL DEFAULT 0,
+    output_tokens integer NOT NULL DEFAULT 0,
+    created_at timestamp with time zone DEFAULT now(),
+    -- Lets a resumed stream upsert rows it already wrote
+    CONSTRAINT claude_batch_results_batch_custom_id_unique UNIQUE (batch_id, custom_id)
+);
@@ -0,0 +1,20 @@
+CREATE TABLE public.claude_call_metrics (
+    id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    label text NOT NULL,
+    model text NOT NULL,
+    latency double precision NOT NULL,
+    input_tokens integer NOT NULL DEFAULT 0,
+    output_tokens integer NOT NULL DEFAULT 0,
+    cache_creation_input_tokens integer NOT NULL DEFAULT 0,
+    cache_read_input_tokens integer NOT NULL DEFAULT 0,
+    time_to_first_token double precision,
+    retries integer NOT NULL DEFAULT 0,
+    cached boolean NOT NULL DEFAULT false,
+    error text,
+    ok boolean NOT NULL,
+    "timestamp" double precision NOT NULL,
+    created_at timestamp with time zone DEFAULT now()
+);
+
+-- Index for per-prompt cost and latency queries
+CREATE INDEX claude_call_metrics_label_created_at_idx ON public.claude_call_metrics(label, created_at);
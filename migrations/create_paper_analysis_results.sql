@@ -0,0 +1,10 @@
+CREATE TABLE public.paper_analysis_results (
+    id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    pdf_sha256 text NOT NULL,
+    prompt_sha256 text NOT NULL,
+    model text NOT NULL,
+    step text,
+    result jsonb NOT NULL,
+    created_at timestamp with time zone DEFAULT now(),
+    CONSTRAINT paper_analysis_results_key_unique UNIQUE (pdf_sha256, prompt_sha256, model)
+);
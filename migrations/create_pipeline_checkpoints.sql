@@ -0,0 +1,8 @@
+CREATE TABLE public.pipeline_checkpoints (
+    id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    run_id text NOT NULL,
+    node text NOT NULL,
+    output jsonb,
+    created_at timestamp with time zone DEFAULT now(),
+    CONSTRAINT pipeline_checkpoints_run_node_unique UNIQUE (run_id, node)
+);